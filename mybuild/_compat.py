@@ -57,6 +57,15 @@ else:
             return True
 
 
+# types for isinstance() checks
+if py3k:
+    string_types  = (str,)
+    integer_types = (int,)
+else:
+    string_types  = (basestring,)
+    integer_types = (int, long)
+
+
 if py3k:
     from itertools import filterfalse as filternot
 else:
@@ -291,6 +291,38 @@ class OptupleBase(InstanceBoundTypeMixin):
     # This allows subclasses to introduce a regular __dict__ without
     # breaking _asdict() logic.
 
+    # Optuples are interned per optuple type, that is, equal optuples are
+    # the same object, so they are hashed by identity and looking them up
+    # (e.g. in a node cache of Pgraph) doesn't need to compare values.
+    # Values are told apart by their types as well, so that m(x=True) is not
+    # the same as m(x=1). Optuples holding unhashable values (like domains of
+    # Context, which are optuples of sets) are not interned, and can't be
+    # hashed: such optuples are turned into instances of an unhashable
+    # subtype, which only compare equal to each other. Note that interned
+    # optuples live as long as their type does (tuples can't be referenced
+    # weakly).
+
+    def __new__(cls, *args, **kwargs):
+        cls = cls._interned_type
+        return cls._intern(super(OptupleBase, cls).__new__(cls,
+                                                           *args, **kwargs))
+
+    @classmethod
+    def _make(cls, iterable):
+        cls = cls._interned_type
+        return cls._intern(super(OptupleBase, cls)._make(iterable))
+
+    def _key(self):
+        return tuple((type(value), value) for value in self)
+
+    @classmethod
+    def _intern(cls, optuple):
+        try:
+            return cls._interned.setdefault(optuple._key(), optuple)
+        except TypeError:  # unhashable
+            optuple.__class__ = cls._uninterned_type
+            return optuple
+
     @property
     def __dict__(self):
         return self._asdict()
@@ -306,9 +338,12 @@ class OptupleBase(InstanceBoundTypeMixin):
         return _self._replace(**kwargs) if kwargs else _self
 
     def __eq__(self, other):
-        return self._type_eq(other) and tuple.__eq__(self, other)
-    def __hash__(self):
-        return self._type_hash() ^ tuple.__hash__(self)
+        return self is other or (self._type_eq(other) and
+                                 self._key() == other._key())
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = object.__hash__  # see _intern()
 
     def __repr__(self):
         options_str = ', '.join(starmap('{0}={1}'.format, self._iterpairs()))
@@ -319,8 +354,13 @@ class OptupleBase(InstanceBoundTypeMixin):
 
     @classmethod
     def _create_type(cls, base_type, module):
-        return type('ModuleOptuple', (cls, base_type),
-                    dict(__slots__=(), _module=module))
+        new_type = type('ModuleOptuple', (cls, base_type),
+                        dict(__slots__=(), _module=module,
+                             _interned={}))  # {key: optuple}
+        new_type._interned_type = new_type
+        new_type._uninterned_type = type('ModuleOptuple', (new_type,),
+                                         dict(__slots__=(), __hash__=None))
+        return new_type
 
 
 class Optuple(OptupleBase):
@@ -10,7 +10,10 @@ from functools import partial
 from itertools import product, starmap
 
 from mybuild.core import InstanceError
-from mybuild.req.pgraph import And, AtMostOne, Atom, Pgraph
+from mybuild.req.components import solve_components
+from mybuild.req.models import minimize
+from mybuild.req.pgraph import And, AtMostOne, Atom, OperandSetNode, Pgraph
+from mybuild.req.session import Session
 from mybuild.req.solver import solve
 from mybuild.util.itertools import pop_iter
 
@@ -20,6 +23,7 @@ __date__ = "2012-11-09"
 
 __all__ = [
     "Context",
+    "node_label",
     "resolve",
 ]
 
@@ -30,14 +34,41 @@ logger = logging.getLogger(__name__)
 class Context(object):
     """docstring for Context"""
 
-    def __init__(self):
+    def __init__(self, processes=None, cache=None, costs=None, hints=None):
+        """In case either of processes or cache is given, the pgraph is
+        solved component-wise, see mybuild.req.components. The cache may be
+        a mybuild.req.cache.ComponentCache to share solutions across runs.
+
+        Costs of modules, if given, make the resolution to find a solution
+        with the least total cost of included modules (rather than to
+        merely prefer to exclude modules), see mybuild.req.models.minimize().
+        These are given as a {module: cost} mapping, or as a function of a
+        module, e.g. 'lambda module: 1' to minimize the number of modules.
+
+        Hints are values of atoms of a previous solution as returned by
+        solution_hints(), which are tried first so that the solution changes
+        as little as possible, see mybuild.req.solver.warm_resolve(). These
+        can't be combined with either of the above.
+        """
         super(Context, self).__init__()
+        if hints is not None and (processes is not None or
+                                  cache is not None or costs is not None):
+            raise ValueError("Hints can't be used along with "
+                             "processes, cache or costs")
+
+        self.processes = processes
+        self.cache = cache
+        self.costs = costs
+        self.hints = hints
+
         self._domains = dict()   # {module: domain}, domain is optuple of sets
         self._providers = dict() # {module: provider}
         self._instantiation_queue = deque()
 
         self.pgraph = ContextPgraph(self)
         self.instance_nodes = list()
+        self.initial_values = dict()
+        self.solution = None
 
     def domain_for(self, module):
         try:
@@ -171,20 +202,76 @@ class Context(object):
         self.init_pgraph_domains()
         self.init_pgraph_providers()
 
-        solution = solve(self.pgraph, {self.pgraph.node_for(optuple): True})
-
+        self.initial_values = initial_values = {
+            self.pgraph.node_for(optuple): True,
+        }
+        if self.costs is not None:
+            solution, cost, optimal = minimize(self.pgraph, initial_values,
+                                               self.module_atom_costs())
+            logger.debug("minimized cost: %r (optimal: %s)", cost, optimal)
+        elif self.processes is None and self.cache is None:
+            hints = None
+            if self.hints:
+                hints = dict((atom, self.hints.get(node_label(atom)))
+                             for atom in self.pgraph.atoms)
+            solution = solve(self.pgraph, initial_values, hints)
+        else:
+            solution = solve_components(self.pgraph, initial_values,
+                                        self.processes, self.cache,
+                                        key=node_label)
+
+        self.solution = solution
+        return self.instance_map(solution)
+
+    def solution_hints(self, solution=None):
+        """Returns a {label: value} mapping of atoms of a solution (the last
+        one by default) to be persisted and passed as hints to a context of
+        a subsequent build."""
+        if solution is None:
+            solution = self.solution
+        return dict((node_label(atom), solution[atom])
+                    for atom in self.pgraph.atoms
+                    if solution.get(atom) is not None)
+
+    def module_atom_costs(self):
+        costs = self.costs
+        if not callable(costs):
+            costs = lambda module, mapping=costs: mapping.get(module, 0)
+
+        return dict((atom, costs(atom.module))
+                    for atom in self.pgraph.module_atoms)
+
+    def instance_map(self, solution):
         instances = [node.instance
                      for node in self.instance_nodes if solution[node]]
         instance_map = dict((type(instance), instance)
                             for instance in instances)
         return instance_map
 
+    def session(self):
+        """Starts a what-if session over the pgraph built by resolve().
+
+        Assumptions are given in terms of pgraph nodes, e.g. to see what
+        happens if a module is enabled or an option takes some value:
+
+            session.assume({context.pgraph.atom_for(module): True})
+            session.assume({context.pgraph.node_for(module(opt=3)): True})
+
+        See mybuild.req.session.Session.
+        """
+        return Session(self.pgraph, self.initial_values)
+
 
 class ContextPgraph(Pgraph):
 
     def __init__(self, context):
         super(ContextPgraph, self).__init__()
         self.context = context
+        self._optuple_nodes = {}  # {optuple: node}, optuples are interned
+
+    module_atoms  = property(lambda self: self.nodes_of(ModuleAtom))
+    option_atoms  = property(lambda self: self.nodes_of(OptionValueAtom))
+    optuple_nodes = property(lambda self: self.nodes_of(OptupleNode))
 
     def atom_for(self, module, option=None, value=Ellipsis):
         if option is not None:
@@ -194,7 +281,13 @@ class ContextPgraph(Pgraph):
 
     def node_for(self, mslice):
         # TODO should accept arbitrary expr as well.
-        return self.new_node(OptupleNode, mslice())
+        optuple = mslice()
+        try:
+            return self._optuple_nodes[optuple]
+        except KeyError:
+            ret = self._optuple_nodes[optuple] = self.new_node(OptupleNode,
+                                                              optuple)
+            return ret
 
 
 @ContextPgraph.node_type
@@ -262,6 +355,23 @@ class OptupleNode(And):
         return repr(self.optuple)
 
 
+def node_label(node):
+    """Names a node of ContextPgraph after modules and options it refers to,
+    so that labels are the same across runs, unlike node identities."""
+    if isinstance(node, ModuleAtom):
+        return node.module._fullname
+    if isinstance(node, OptionValueAtom):
+        return '{0}.{1}={2!r}'.format(node.module._fullname,
+                                      node.option, node.value)
+    if isinstance(node, OptupleNode):
+        return repr(node.optuple)
+    if isinstance(node, OperandSetNode):
+        return '{0}({1})'.format(type(node).__name__,
+                                 ', '.join(sorted(map(node_label,
+                                                      node._operands))))
+    return repr(node)
+
+
 def why_option_can_have_at_most_one_value(outcome, *causes):
     return 'option can have at most one value: %s: %s' % (outcome, causes)
 def why_disabled_option_cannot_have_a_value(outcome, *causes):
@@ -303,5 +413,5 @@ def why_inviable_instance_is_disabled(outcome, *_):
     return fmt.format(**locals())
 
 
-def resolve(initial_module):
-    return Context().resolve(initial_module)
+def resolve(initial_module, **kwargs):
+    return Context(**kwargs).resolve(initial_module)
@@ -6,7 +6,7 @@ from mybuild._compat import *
 
 import mybuild
 from mybuild.binding import pydsl
-from mybuild.nsloader import myfile, pyfile
+from mybuild.nsloader import catalogue, myfile, pyfile
 from mybuild.util.misc import stringify
 from mybuild.util.namespace import Namespace
 from mybuild.util.operator import attr
@@ -231,6 +231,18 @@ class MyDslLoader(LoaderMixin, myfile.MyFileLoader):
     dsl.project      = None
 
 
+class MyCatalogueLoader(catalogue.CatalogueLoader):
+    """Loads catalogues converted from Mybuild files, see catalogue.convert().
+
+    Register it under 'Mybuild' name instead of MyDslLoader."""
+    FILENAME = 'Config.cat'
+
+    kinds = dict(catalogue.default_kinds,
+                 module       = MyDslLoader.CcModule,
+                 application  = MyDslLoader.ApplicationCcModule,
+                 library      = MyDslLoader.LibCcModule)
+
+
 class PyDslLoader(LoaderMixin, pyfile.PyFileLoader):
     FILENAME = 'Pybuild'
     dsl = pydsl
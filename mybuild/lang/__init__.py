@@ -12,11 +12,91 @@ __author__ = "Eldar Abusalimov"
 __date__ = "2013-07-30"
 
 
-def my_compile(source, filename='<unknown>', mode='exec'):
+def my_compile(source, filename='<unknown>', mode='exec', fast=False):
+    """Compiles a My-file into a code object.
+
+    A fast mode is for files known to be correct: resulting code has only
+    approximate line numbers, see mybuild.lang.parse.MyParser.parse().
+    """
     try:
-        from mylang.parse import my_parse
+        from mybuild.lang.parse import my_parse
     except ImportError:
         raise ImportError('PLY is not installed')
 
-    ast_root = my_parse(source, filename, mode)
+    ast_root = my_parse(source, filename, mode, fast)
     return compile(ast_root, filename, mode)
+
+
+def my_exports(source, filename='<unknown>'):
+    """Lists names bound at the top level of a My-file.
+
+    Only tokens of the source are looked through, which is much cheaper than
+    parsing and executing the whole file.
+    """
+    try:
+        from mybuild.lang import lex
+        from mybuild.lang.location import Fileinfo
+    except ImportError:
+        raise ImportError('PLY is not installed')
+
+    lx = lex.Tokenizer()
+    lx.ignore_newline_stack = [0]
+    lx.fileinfo = Fileinfo(source, filename)
+    lx.input(source)
+
+    names = []
+    depth = 0
+    head = []  # leading tokens of a current top-level statement
+
+    for token in iter(lx.token, None):
+        if token.type == 'LBRACE':
+            depth += 1
+        elif token.type == 'RBRACE':
+            depth -= 1
+
+        if depth or head is None:
+            if not depth and token.type in ('NEWLINE', 'SEMI'):
+                head = []
+            continue
+
+        if token.type in ('NEWLINE', 'SEMI'):
+            head = []
+        elif token.type in ('COLON', 'DOUBLECOLON'):
+            name = _binding_name(head)
+            if name is not None:
+                names.append(name)
+            head = None
+        else:
+            head.append(token)
+
+    return names
+
+
+def _binding_name(head):
+    """Takes tokens preceding a colon and returns a name being bound, if any:
+
+        name.attr: ...
+        metatype name(...): ...
+    """
+    def skip_qualname(pos):
+        if pos >= len(head) or head[pos].type != 'ID':
+            return None
+        pos += 1
+        while (pos + 1 < len(head) and
+               head[pos].type == 'PERIOD' and head[pos+1].type == 'ID'):
+            pos += 2
+        return pos
+
+    pos = skip_qualname(0)
+    if pos is None:
+        return None
+    if pos == len(head):
+        return head[0].value
+
+    name_pos = pos
+    pos = skip_qualname(name_pos)
+    if pos is None:
+        return None
+    if (pos == len(head) or
+            head[pos].type == 'LPAREN' and head[-1].type == 'RPAREN'):
+        return head[name_pos].value
@@ -0,0 +1,277 @@
+"""
+Incremental parsing of My-files, meant for editors validating a file as it
+is being typed.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import itertools
+
+from mybuild.lang import x_ast as ast
+from mybuild.lang.location import Fileinfo, Location
+from mybuild.lang.parse import (Binding, BuildingBlock, MySyntaxError,
+                                build_module, parser_pool)
+
+
+__all__ = [
+    "IncrementalParse",
+]
+
+
+# Names of top-level auxiliary functions are tagged with a chunk serial
+# number, so that functions of chunks parsed at different times never clash.
+_chunk_serials = itertools.count(1)
+
+
+class Chunk(object):
+    """
+    A top-level statement along with delimiters, blank lines and comments
+    following it.
+
+    Statements emitted by a chunk are fixed up with locations right after
+    parsing, and lined_nodes lists ones which line numbers come from the
+    source (as opposed to those inherited from the module root), in order to
+    shift them in case lines are added or removed before the chunk.
+    """
+    __slots__ = ('length', 'stmts', 'bindings', 'lined_nodes')
+
+    def __init__(self, length, stmts, bindings, lined_nodes=None):
+        super(Chunk, self).__init__()
+        self.length   = length
+        self.stmts    = stmts
+        self.bindings = bindings
+
+        if lined_nodes is None:
+            lined_nodes = _lined_nodes(stmts)
+            for stmt in stmts:
+                ast.fix_missing_locations(stmt)
+        self.lined_nodes = lined_nodes
+
+    def shifted(self, fileinfo, line_delta, offset_delta):
+        """Returns a copy of the chunk with bindings moved along with the text
+        following an edit. Nodes are shifted separately, see shift_lines()."""
+        bindings = [Binding(binding.qualname,
+                            [Location(fileinfo,
+                                      loc.lineno + line_delta,
+                                      loc.offset + offset_delta)
+                             for loc in binding.name_locs],
+                            binding.func, binding.is_static)
+                    for binding in self.bindings]
+        return Chunk(self.length, self.stmts, bindings, self.lined_nodes)
+
+    def shift_lines(self, line_delta):
+        for node in self.lined_nodes:
+            node.lineno += line_delta
+
+
+def _lined_nodes(stmts):
+    ret = []
+    seen = set()
+    stack = [(stmt, False) for stmt in stmts]
+    while stack:
+        node, lined = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+
+        if 'lineno' in node._attributes:
+            lined = lined or hasattr(node, 'lineno')
+            if lined:
+                ret.append(node)
+
+        stack.extend((child, lined) for child in ast.iter_child_nodes(node))
+
+    return ret
+
+
+class ChunkRecorder(object):
+    """Splits a parsed suite into chunks, see mybuild.lang.parse.get_toplevel().
+    """
+
+    def __init__(self, start):
+        super(ChunkRecorder, self).__init__()
+        self.start = start
+        self.bblock = None
+        self.bindings = []
+        self.marks = []  # [(end, nr_stmts, nr_bindings)] of chunk boundaries
+        self.pending_mark = None
+
+    def enter(self, bblock):
+        self.bblock = bblock
+        self._new_aux_tag()
+
+    def _new_aux_tag(self):
+        self.bblock.aux_tag = '0.{0}'.format(next(_chunk_serials))
+
+    def statement(self, bindings):
+        if self.pending_mark is not None:
+            self.marks.append(self.pending_mark)
+            self.pending_mark = None
+        self.bindings.extend(bindings)
+
+    def delimiter(self, end):
+        # A chunk ends with the last delimiter preceding the next statement.
+        self.pending_mark = end, len(self.bblock.stmts), len(self.bindings)
+        self._new_aux_tag()
+
+    def chunks(self, end):
+        marks = list(self.marks)
+        if self.pending_mark is not None:
+            marks.append(self.pending_mark)
+        marks.append((end, len(self.bblock.stmts), len(self.bindings)))
+
+        ret = []
+        prev_end, prev_nr_stmts, prev_nr_bindings = self.start, 0, 0
+        for mark in marks:
+            end, nr_stmts, nr_bindings = mark
+            ret.append(Chunk(end - prev_end,
+                             self.bblock.stmts[prev_nr_stmts:nr_stmts],
+                             self.bindings[prev_nr_bindings:nr_bindings]))
+            prev_end, prev_nr_stmts, prev_nr_bindings = mark
+
+        return ret
+
+
+class IncrementalParse(object):
+    """
+    Result of parsing a My-file which can be brought up to date with edits
+    of the source.
+
+    The source is split into chunks of top-level statements, and an edit
+    only causes reparsing of the chunks it touches (extended up to the start
+    of a line). The resulting module is then assembled from the chunks and
+    is the same as the one returned by my_parse(), up to names of auxiliary
+    functions.
+
+    In case a reparsed region fails, the whole source is parsed once again,
+    so that a syntax error is reported exactly as my_parse() would do.
+    """
+
+    def __init__(self, source, filename='<unknown>'):
+        super(IncrementalParse, self).__init__()
+        self.filename = filename
+
+        fileinfo = Fileinfo(source, filename)
+        doc_str, chunks = self._parse_region(fileinfo, 0, len(source))
+        self._update(fileinfo, doc_str, chunks)
+
+    @property
+    def bindings(self):
+        """Top-level bindings in order of appearance."""
+        return list(itertools.chain.from_iterable(chunk.bindings
+                                                  for chunk in self.chunks))
+
+    def _parse_region(self, fileinfo, start, end):
+        recorder = ChunkRecorder(start)
+        with parser_pool.parser() as my_parser:
+            bblock, doc_str, bindings = my_parser.parse_suite(
+                fileinfo.source, self.filename, start=start, end=end,
+                fileinfo=fileinfo, toplevel=recorder)
+        return doc_str, recorder.chunks(end)
+
+    def _update(self, fileinfo, doc_str, chunks, line_delta=0, suffix=()):
+        bblock = BuildingBlock()
+        try:
+            module = build_module(bblock, doc_str,
+                                  [Binding(binding.qualname,
+                                           binding.name_locs,
+                                           ast.x_Name(binding.func.id),
+                                           binding.is_static)
+                                   for chunk in chunks
+                                   for binding in chunk.bindings])
+        except MySyntaxError as e:
+            raise SyntaxError(*e.args)
+        ast.fix_missing_locations(module)
+
+        # Chunks are located already, and so they are inserted into the body
+        # of the suite function (which is bblock.stmts) right after its
+        # 'global' and '<module> =' header.
+        bblock.stmts[2:2] = itertools.chain.from_iterable(chunk.stmts
+                                                          for chunk in chunks)
+
+        if line_delta:
+            for chunk in suffix:
+                chunk.shift_lines(line_delta)
+
+        self.fileinfo = fileinfo
+        self.doc_str  = doc_str
+        self.chunks   = chunks
+        self.module   = module
+
+    @property
+    def source(self):
+        return self.fileinfo.source
+
+    def edit(self, start, end, text):
+        """
+        Replaces source[start:end] with the text and updates the result.
+
+        Nodes of the previous module may be reused and updated in place.
+
+        Raises:
+            SyntaxError: if the new source fails to parse, in which case
+                the result remains unchanged.
+        """
+        old_source = self.source
+        if not 0 <= start <= end <= len(old_source):
+            raise ValueError('Invalid edit range: {0}:{1}'.format(start, end))
+
+        source = old_source[:start] + text + old_source[end:]
+        offset_delta = len(source) - len(old_source)
+        fileinfo = Fileinfo(source, self.filename)
+
+        chunk_starts = []
+        chunk_ends = []
+        offset = 0
+        for chunk in self.chunks:
+            chunk_starts.append(offset)
+            offset += chunk.length
+            chunk_ends.append(offset)
+
+        # Chunks touching the edited range, up to the start of a line.
+        first = next(i for i, chunk_end in enumerate(chunk_ends)
+                     if chunk_end >= start)
+        last = max(i for i, chunk_start in enumerate(chunk_starts)
+                   if chunk_start <= end)
+        while (last + 1 < len(self.chunks) and
+               source[chunk_ends[last] + offset_delta - 1] != '\n'):
+            last += 1
+
+        region_start = chunk_starts[first]
+        old_region_end = chunk_ends[last]
+        region_end = old_region_end + offset_delta
+
+        try:
+            doc_str, region = self._parse_region(fileinfo,
+                                                 region_start, region_end)
+        except SyntaxError:
+            if region_start == 0 and region_end == len(source):
+                raise
+            region = None
+        else:
+            if region_end != len(source):
+                # The region must end exactly where the next chunk begins.
+                if region[-1].length:
+                    region = None
+                else:
+                    region.pop()
+            if first:
+                # Only the first chunk can have a docstring.
+                if isinstance(doc_str, ast.Str):
+                    region = None
+                doc_str = self.doc_str
+
+        if region is None:
+            doc_str, chunks = self._parse_region(fileinfo, 0, len(source))
+            self._update(fileinfo, doc_str, chunks)
+            return
+
+        line_delta = (source.count('\n', region_start, region_end) -
+                      old_source.count('\n', region_start, old_region_end))
+        suffix = self.chunks[last+1:]
+
+        self._update(fileinfo, doc_str,
+                     (self.chunks[:first] + region +
+                      [chunk.shifted(fileinfo, line_delta, offset_delta)
+                       for chunk in suffix]),
+                     line_delta, suffix)
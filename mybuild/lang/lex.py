@@ -4,6 +4,9 @@ Lexer definitions for My-files grammar.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import copy
+import re
+
 import ply.lex
 
 from mybuild.lang.location import Location
@@ -91,5 +94,189 @@ lexer = ply.lex.lex()
 lexer.ignore_newline_stack = [0]
 
 
+# A hand-written scanner producing exactly the same token stream as the PLY
+# lexer above. Instead of trying a master regex of all rules at each position
+# and calling back into a rule function per token, it dispatches on the first
+# character and skips comments and block comments using str.find().
+
+_id_re     = re.compile(t_ID)
+_number_re = re.compile(t_NUMBER.__doc__)
+# Same as the t_STRING regex, but unrolled so that it never backtracks.
+_string_re = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"')
+
+_id_start = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                      'abcdefghijklmnopqrstuvwxyz_')
+
+_delimiters = {
+    ',': 'COMMA',
+    '.': 'PERIOD',
+    '=': 'EQUALS',
+    ';': 'SEMI',
+}
+
+# Change of the innermost ignore_newline_stack counter per paren/bracket.
+_parens = {
+    '(': ('LPAREN',   +1),
+    ')': ('RPAREN',   -1),
+    '[': ('LBRACKET', +1),
+    ']': ('RBRACKET', -1),
+}
+
+
+class Token(object):
+    """A lightweight counterpart of ply.lex.LexToken.
+
+    The lexer attribute is left unset, as it is only needed to report an
+    error at the token, in which case PLY parsers set it themselves.
+    """
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'lexer')
+
+    def __init__(self, type, value, lineno, lexpos):
+        self.type   = type
+        self.value  = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return 'LexToken({0},{1!r},{2},{3})'.format(self.type, self.value,
+                                                    self.lineno, self.lexpos)
+
+
+def _newline_run_end(data, pos, end):
+    """Returns the end of a t_NEWLINE match starting at pos (which is pos
+    itself in case there is no match)."""
+    while True:
+        if data.startswith('\n', pos, end):
+            pos += 1
+        elif data.startswith('/*', pos, end):
+            close = data.find('*/', pos + 2, end)
+            if close < 0:
+                return pos
+            pos = close + 2
+        else:
+            return pos
+
+
+class Tokenizer(object):
+    """
+    Drop-in replacement of the PLY lexer (lexer.clone()) for PLY parsers.
+
+    Like the PLY lexer, it expects ignore_newline_stack and fileinfo
+    attributes to be set by a user, and it does not reset lineno on input().
+    """
+
+    def __init__(self):
+        super(Tokenizer, self).__init__()
+        self.lexdata = None
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+
+    def clone(self):
+        return copy.copy(self)
+
+    def input(self, data, start=0, end=None):
+        """Unlike the PLY lexer, can be limited to a slice of data."""
+        self.lexdata = data
+        self.lexpos = start
+        self.lexlen = len(data) if end is None else end
+
+    def token(self):
+        data = self.lexdata
+        pos = self.lexpos
+        end = self.lexlen
+
+        while pos < end:
+            char = data[pos]
+
+            if char == ' ' or char == '\t':
+                pos += 1  # cheaper than a regex for typical short runs
+                continue
+
+            if char in _id_start:
+                m = _id_re.match(data, pos, end)
+                self.lexpos = m.end()
+                return Token('ID', m.group(), self.lineno, pos)
+
+            if char == '\n' or char == '/':
+                if data.startswith('//', pos, end):
+                    newline = data.find('\n', pos + 2, end)
+                    pos = newline if newline >= 0 else end
+                    continue
+
+                run_end = _newline_run_end(data, pos, end)
+                if run_end == pos:
+                    break  # unterminated block comment
+
+                lineno = self.lineno
+                nr_newlines = data.count('\n', pos, run_end)
+                self.lineno += nr_newlines
+                if nr_newlines and not self.ignore_newline_stack[-1]:
+                    self.lexpos = run_end
+                    return Token('NEWLINE', data[pos:run_end], lineno, pos)
+                pos = run_end
+                continue
+
+            if char in _delimiters:
+                self.lexpos = pos + 1
+                return Token(_delimiters[char], char, self.lineno, pos)
+
+            if char == ':':
+                if data.startswith('::', pos, end):
+                    self.lexpos = pos + 2
+                    return Token('DOUBLECOLON', '::', self.lineno, pos)
+                self.lexpos = pos + 1
+                return Token('COLON', ':', self.lineno, pos)
+
+            if char in _parens:
+                type, delta = _parens[char]
+                self.ignore_newline_stack[-1] += delta
+                self.lexpos = pos + 1
+                return Token(type, char, self.lineno, pos)
+
+            if char == '{':
+                self.ignore_newline_stack.append(0)
+                self.lexpos = pos + 1
+                return Token('LBRACE', char, self.lineno, pos)
+
+            if char == '}':
+                self.ignore_newline_stack.pop()
+                self.lexpos = pos + 1
+                return Token('RBRACE', char, self.lineno, pos)
+
+            if char == '"':
+                m = _string_re.match(data, pos, end)
+                if m is None:
+                    break
+                self.lexpos = m.end()
+                value = str(m.group()[1:-1].encode().decode("unicode_escape"))
+                return Token('STRING', value, self.lineno, pos)
+
+            m = _number_re.match(data, pos, end)
+            if m is None:
+                break
+            self.lexpos = m.end()
+            return Token('NUMBER', int(m.group()), self.lineno, pos)
+
+        else:
+            self.lexpos = pos + 1
+            return None
+
+        self.lexpos = pos
+        t = Token('error', data[pos:], self.lineno, pos)
+        t.lexer = self
+        t_error(t)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        t = self.token()
+        if t is None:
+            raise StopIteration
+        return t
+    __next__ = next
+
+
 if __name__ == "__main__":
     ply.lex.runmain(lexer)
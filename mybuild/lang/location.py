@@ -20,15 +20,24 @@ class Fileinfo(object):
         self.source = source
         self.name = name
 
-        self.line_table   = lines   = source.splitlines(True)
-        self.offset_table = offsets = [0]
+    # Tables are only needed to report columns, which is not the case
+    # for a file that parses fine in a fast mode.
+
+    @cached_property
+    def line_table(self):
+        return self.source.splitlines(True)
+
+    @cached_property
+    def offset_table(self):
+        offsets = [0]
 
         offset = 0
-        for line_len in map(len, lines):
+        for line_len in map(len, self.line_table):
             offset += line_len
             offsets.append(offset)
 
         offsets[-1] += 1  # corner case when there is no newline at end of file
+        return offsets
 
     def get_line(self, lineno):
         return self.line_table[lineno-1]
@@ -101,3 +110,13 @@ class Location(object):
                     .format(type(self).__name__, **locals()))
         except AttributeError:
             return super(Location, self).__repr__()
+
+
+class LineLocation(Location):
+    """Cheap location that only knows a line number, used in a fast parse
+    mode. A column is always reported as 0."""
+
+    column = 0
+
+    def __init__(self, fileinfo=None, lineno=None):
+        super(LineLocation, self).__init__(fileinfo, lineno)
@@ -4,6 +4,8 @@ PLY-based parser for Myfile grammar.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import contextlib
+import copy
 import functools
 import itertools
 import ply.yacc
@@ -11,7 +13,7 @@ from collections import namedtuple, OrderedDict
 
 from mybuild.lang import lex, x_ast as ast
 from mybuild.lang.helpers import rule
-from mybuild.lang.location import Fileinfo, Location
+from mybuild.lang.location import Fileinfo, LineLocation, Location
 from mybuild.util.operator import getter
 
 
@@ -43,6 +45,10 @@ def node_loc(ast_node, p):
     return Location.from_ast_node(ast_node, p.lexer.fileinfo)
 
 def ploc(p, i=1):
+    if p.parser.fast:
+        # Without tracking nonterminals have no position, take the line
+        # the lexer is currently at.
+        return LineLocation(p.lexer.fileinfo, p.lineno(i) or p.lexer.lineno)
     return Location(p.lexer.fileinfo, p.lineno(i), p.lexpos(i))
 
 def set_loc(ast_node, loc):
@@ -53,6 +59,31 @@ def set_loc_p(ast_node, p, i=1):
 
 copy_loc = ast.copy_location
 
+def fix_missing_lines(root):
+    """A cheaper version of ast.fix_missing_locations for a fast mode: only
+    line numbers are propagated, missing columns are set to 0."""
+    ast_type = ast.AST
+    stack = [(root, 1)]
+    while stack:
+        node, lineno = stack.pop()
+
+        if 'lineno' in node._attributes:
+            try:
+                lineno = node.lineno
+            except AttributeError:
+                node.lineno = lineno
+                node.col_offset = 0
+
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                stack.extend((item, lineno) for item in value
+                             if isinstance(item, ast_type))
+            elif isinstance(value, ast_type):
+                stack.append((value, lineno))
+
+    return root
+
 
 def wloc(func):
     @functools.wraps(func)
@@ -145,17 +176,17 @@ def assign_funcs_to_variables(bblock, bindings):
                       ast.x_Name(var), binding.is_static)
 
 
-def fold_into_namespace(p, bindings):
+def fold_into_namespace(parent_bblock, bindings):
     if len(bindings) == 1 and len(bindings[0].qualname) == 1:
         return bindings[0].func
-    bblock = BuildingBlock(p.parser.bblock)
+    bblock = BuildingBlock(parent_bblock)
     bindings = list(assign_funcs_to_variables(bblock, bindings))
     stmt = ast.Expr(build_namespace_recursive(bindings, 1))
     bblock.append(stmt)
     return bblock.fold_into_binding()
 
 
-def fold_bindings(p, bindings):
+def fold_bindings(bblock, bindings):
     """
     Folds bindings so that each name matches a correponding namespace.
 
@@ -165,7 +196,7 @@ def fold_bindings(p, bindings):
     binding_asts = []
 
     for name, group in iteritems(groupby_name(bindings)):
-        func = fold_into_namespace(p, group)
+        func = fold_into_namespace(bblock, group)
         loc = group[0].name_locs[0]
         name_str = set_loc(ast.Str(name), loc)
 
@@ -193,7 +224,7 @@ def build_typedef(p, body, metatype, qualname=None, call_builder=None):
         name = DFL_TYPE_NAME
 
     doc_str, bindings = body
-    binding_list = fold_bindings(p, bindings)
+    binding_list = fold_bindings(p.parser.bblock, bindings)
 
     args = [metatype, ast.Str(name), ast.x_Name(_MODULE_NAME),
             doc_str, binding_list]
@@ -212,6 +243,55 @@ def build_typedef(p, body, metatype, qualname=None, call_builder=None):
     return copy_loc(ret_call, metatype)
 
 
+def build_module(bblock, doc_str, bindings):
+    """Wraps statements of the top-level bblock into a module.
+
+    Raises:
+        MySyntaxError: if a namespace element is bound twice.
+    """
+    # stmts... ->
+    #
+    # try:
+    #     @__my_exec_module__
+    #     def __suite():
+    #         global __name__
+    #         <module> = __name__
+    #         ...
+    #         return [...]
+    #
+    # except __my_exec_module__:
+    #     pass
+    #
+    # N.B. This voodoo is to avoid storing __suite name into global module
+    # dict. Applied as a decorator, __my_exec_module__ executes a function
+    # being decorated (__suite in this case) and throws 'itself' instead
+    # of returning as normal.
+    # Likewise any auxiliary function is defined local to the __suite.
+    #
+    binding_list = fold_bindings(bblock, bindings)
+
+    bblock.insert(0,
+                  ast.Global(['__name__']),
+                  ast.Assign([ast.Name(_MODULE_NAME, ast.Store())],
+                             ast.x_Name('__name__')))
+
+    bblock.append(ast.Return(binding_list))
+
+    suite_func = ast.x_FunctionDef(_MODULE_EXEC, ast.x_arguments(),
+                                   bblock.stmts,
+                                   decos=[ast.x_Name(MY_EXEC_MODULE)])
+
+    eh_stmt = ast.ExceptHandler(ast.x_Name(MY_EXEC_MODULE), None, [ast.Pass()])
+    try_stmt = ast.x_TryExcept([suite_func], [eh_stmt])
+
+    module_body = [try_stmt]
+
+    if isinstance(doc_str, ast.Str):
+        module_body.insert(0, ast.Expr(doc_str))
+
+    return ast.Module(module_body)
+
+
 # Dealing with statements.
 
 class BuildingBlock(object):
@@ -229,6 +309,10 @@ class BuildingBlock(object):
         else:
             self.depth = 0
 
+        # Distinguishes names of auxiliary functions, which are defined
+        # in the scope of a parent block.
+        self.aux_tag = self.depth
+
     @property
     def docstring_stmt(self):
         if (self.stmts and
@@ -257,7 +341,7 @@ class BuildingBlock(object):
     def new_aux_name(self):
         cnt = self.aux_cnt
         self.aux_cnt = cnt + 1
-        return _AUX_NAME_FMT.format(self.depth, cnt)
+        return _AUX_NAME_FMT.format(self.aux_tag, cnt)
 
     def build_func_from(self, stmts, arguments, name=None):
         if name is None:
@@ -341,13 +425,30 @@ def emit_stmt(p, *stmts):
     p.parser.bblock.append(*stmts)
 
 def push_new_bblock(p):
-    p.parser.bblock = BuildingBlock(p.parser.bblock)
+    bblock = BuildingBlock(p.parser.bblock)
+    if bblock.parent is None and p.parser.toplevel is not None:
+        p.parser.toplevel.enter(bblock)
+    p.parser.bblock = bblock
 
 def pop_bblock(p):
     bblock = p.parser.bblock
     p.parser.bblock = bblock.parent
     return bblock
 
+def get_toplevel(p):
+    """Returns a recorder of top-level statements, if any, provided that the
+    parser is currently at the top level.
+
+    A recorder is an object passed to MyParser.parse_suite() with the
+    following methods:
+        enter(bblock): the top-level block is created
+        statement(bindings): a statement is parsed
+        delimiter(end): a statement delimiter ending at the given offset
+    """
+    toplevel = p.parser.toplevel
+    if toplevel is not None and p.parser.bblock.depth == 0:
+        return toplevel
+
 
 # Here go grammar definitions for PLY.
 
@@ -360,50 +461,8 @@ def p_new_bblock(p):
 @rule
 def p_exec_start(p, docstring_bindings=-1):
     """exec_start : new_bblock typesuite"""
-    # stmts... ->
-    #
-    # try:
-    #     @__my_exec_module__
-    #     def __suite():
-    #         global __name__
-    #         <module> = __name__
-    #         ...
-    #         return [...]
-    #
-    # except __my_exec_module__:
-    #     pass
-    #
-    # N.B. This voodoo is to avoid storing __suite name into global module
-    # dict. Applied as a decorator, __my_exec_module__ executes a function
-    # being decorated (__suite in this case) and throws 'itself' instead
-    # of returning as normal.
-    # Likewise any auxiliary function is defined local to the __suite.
-    #
     doc_str, bindings = docstring_bindings
-    binding_list = fold_bindings(p, bindings)
-
-    bblock = pop_bblock(p)
-
-    bblock.insert(0,
-                  ast.Global(['__name__']),
-                  ast.Assign([ast.Name(_MODULE_NAME, ast.Store())],
-                             ast.x_Name('__name__')))
-
-    bblock.append(ast.Return(binding_list))
-
-    suite_func = ast.x_FunctionDef(_MODULE_EXEC, ast.x_arguments(),
-                                   bblock.stmts,
-                                   decos=[ast.x_Name(MY_EXEC_MODULE)])
-
-    eh_stmt = ast.ExceptHandler(ast.x_Name(MY_EXEC_MODULE), None, [ast.Pass()])
-    try_stmt = ast.x_TryExcept([suite_func], [eh_stmt])
-
-    module_body = [try_stmt]
-
-    if isinstance(doc_str, ast.Str):
-        module_body.insert(0, ast.Expr(doc_str))
-
-    return ast.Module(module_body)
+    return pop_bblock(p), doc_str, bindings
 
 @rule
 def p_typebody(p, docstring_bindings=2, typeret_func=-1):
@@ -450,6 +509,10 @@ def p_typestmt_namespace(p, qualname_wlocs=3, colons=4, body=-1):
         binding.qualname[:0] = qualname
         binding.name_locs[:0] = name_locs
 
+    toplevel = get_toplevel(p)
+    if toplevel is not None:
+        toplevel.statement(bindings)
+
     return bindings
 
 @rule
@@ -465,6 +528,11 @@ def p_typestmt(p, qualname_colons=2):
     qualname, name_locs = map(list, zip(*qualname_wlocs))
     binding_triple = Binding(qualname, name_locs,
                              func, ast.x_Const(is_static))
+
+    toplevel = get_toplevel(p)
+    if toplevel is not None:
+        toplevel.statement([binding_triple])
+
     return [binding_triple]
 
 @rule  # metatype target(): { ... }
@@ -750,6 +818,9 @@ def p_skipnl(p):
 def p_stmtdelim(p):
     """stmtdelim : mb_stmtdelim NEWLINE
        stmtdelim : mb_stmtdelim SEMI"""
+    toplevel = get_toplevel(p)
+    if toplevel is not None:
+        toplevel.delimiter(p.lexpos(2) + len(p[2]))
 
 def p_mb_stmtdelim(p):
     """mb_stmtdelim :
@@ -772,44 +843,142 @@ parser = ply.yacc.yacc(start='exec_start',
                        errorlog=ply.yacc.NullLogger(), debug=False,
                        write_tables=False)
 
-# The main entry point.
 
-def my_parse(source, filename='<unknown>', mode='exec', **kwargs):
+class MyParser(object):
     """
-    Parses the given source and returns the result.
+    Parser of My-files which keeps all the parsing state per instance.
 
-    Args:
-        source (str): data to parse
-        filename (str): file name to report in case of errors
-        mode (str): type of input to expect:
-            it can be 'exec' only (constrained by design).
+    Instances share LALR tables built once at the module level, so creating
+    a new one is cheap. A single instance must not be used by several threads
+    at once, while separate instances may. See also my_parse() which takes
+    care of that.
+    """
 
-        **kwargs are passed directly to the underlying PLY parser
+    def __init__(self):
+        super(MyParser, self).__init__()
+        # A shallow copy of the PLY parser refers to the same tables, but
+        # parsing stacks and the building block are assigned per copy.
+        self._parser = copy.copy(parser)
+        self._lexer = lex.Tokenizer()
+
+    def parse(self, source, filename='<unknown>', mode='exec', fast=False,
+              **kwargs):
+        """
+        Parses the given source and returns the result.
+
+        Args:
+            source (str): data to parse
+            filename (str): file name to report in case of errors
+            mode (str): type of input to expect:
+                it can be 'exec' only (constrained by design).
+            fast (bool): whether to skip tracking of token positions, so that
+                resulting nodes only get approximate line numbers and no
+                columns. Locations of syntax errors are imprecise too.
+
+            **kwargs are passed directly to the underlying PLY parser
+
+        Returns:
+            ast.Module object
+        """
+        if mode != 'exec':
+            raise NotImplementedError("Only 'exec' mode is supported")
+
+        bblock, doc_str, bindings = self.parse_suite(source, filename, fast,
+                                                     **kwargs)
+        try:
+            ast_root = build_module(bblock, doc_str, bindings)
+        except MySyntaxError as e:
+            raise SyntaxError(*e.args)
+
+        if fast:
+            return fix_missing_lines(ast_root)
+        return ast.fix_missing_locations(ast_root)
 
-    Returns:
-        ast.Module object
+    def parse_suite(self, source, filename='<unknown>', fast=False,
+                    start=0, end=None, fileinfo=None, toplevel=None,
+                    **kwargs):
+        """
+        Parses a sequence of top-level statements without wrapping them into
+        a module, see build_module().
 
-    Note:
-        This function is NOT reentrant.
-    """
-    if mode != 'exec':
-        raise NotImplementedError("Only 'exec' mode is supported")
+        Args:
+            start, end (int): a slice of the source to parse; it must begin
+                at the start of a statement (or with blank lines)
+            fileinfo (Fileinfo): info of the whole source, if already created
+            toplevel: an optional recorder of top-level statements, see
+                get_toplevel()
 
-    pr = parser
+            The rest args are the same as for parse().
 
-    lx = lex.lexer.clone()
-    lx.fileinfo = Fileinfo(source, filename)
+        Returns:
+            A (bblock, doc_str, bindings) tuple.
+        """
+        pr = self._parser
 
-    pr.bblock = None
-    try:
-        ast_root = pr.parse(source, lexer=lx, tracking=True, **kwargs)
-        return ast.fix_missing_locations(ast_root)
+        lx = self._lexer
+        lx.lineno = source.count('\n', 0, start) + 1
+        lx.ignore_newline_stack = [0]
+        lx.fileinfo = fileinfo or Fileinfo(source, filename)
+        lx.input(source, start, end)
 
-    except MySyntaxError as e:
-        raise SyntaxError(*e.args)
+        pr.bblock = None
+        pr.fast = fast
+        pr.toplevel = toplevel
+        try:
+            return pr.parse(lexer=lx, tracking=not fast, **kwargs)
 
-    finally:
-        del pr.bblock
+        except MySyntaxError as e:
+            raise SyntaxError(*e.args)
+
+        finally:
+            del pr.bblock
+            del pr.fast
+            del pr.toplevel
+            del lx.fileinfo
+
+
+class MyParserPool(object):
+    """Hands out idle parser instances creating new ones as needed."""
+
+    def __init__(self):
+        super(MyParserPool, self).__init__()
+        self._idle = []
+
+    @contextlib.contextmanager
+    def parser(self):
+        # list.pop() and list.append() are atomic, no need in a lock.
+        try:
+            my_parser = self._idle.pop()
+        except IndexError:
+            my_parser = MyParser()
+
+        try:
+            yield my_parser
+        finally:
+            self._idle.append(my_parser)
+
+
+parser_pool = MyParserPool()
+
+# The main entry point.
+
+def my_parse(source, filename='<unknown>', mode='exec', fast=False, **kwargs):
+    """
+    Parses the given source and returns the result, see MyParser.parse().
+
+    In a fast mode a source failed to parse is parsed once again with full
+    location tracking in order to report a precise error location.
+
+    This function is reentrant and thread-safe: each call takes a separate
+    parser instance from the pool.
+    """
+    with parser_pool.parser() as my_parser:
+        try:
+            return my_parser.parse(source, filename, mode, fast, **kwargs)
+        except SyntaxError:
+            if not fast:
+                raise
+        return my_parser.parse(source, filename, mode, **kwargs)
 
 
 class MySyntaxError(Exception):
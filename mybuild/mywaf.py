@@ -39,13 +39,15 @@ namespace_importer = NamespaceImportHook(loaders={
 sys.meta_path.insert(0, namespace_importer)
 
 
-def register_namespace(namespace, path='.'):
+def register_namespace(namespace, path='.', index_file=None):
     """Registers a new namespace recognized by a namespace importer.
 
     Args:
         namespace (str): namespace root name.
         path (list/str): a list of strings (or a string of space-separated
             entries) denoting directories to search when loading files.
+        index_file (str): optional file to keep an index of the namespace
+            tree in, which saves walking the tree on each run.
     """
 
     if '.' in namespace:
@@ -56,10 +58,16 @@ def register_namespace(namespace, path='.'):
             for path_entry in wafutils.to_list(path)]
 
     namespace_importer.namespace_path[namespace] = path
+    namespace_importer.namespace_index.pop(namespace, None)
+
+    if index_file is not None:
+        index_file = os.path.join(wafcontext.run_dir, index_file)
+        namespace_importer.load_index(namespace, index_file)
 
 
 def unregister_namespace(namespace):
     """Unregisters and returns a previously registered namespace (if any)."""
+    namespace_importer.namespace_index.pop(namespace, None)
     return namespace_importer.namespace_path.pop(namespace, None)
 
 
@@ -25,9 +25,9 @@ class SingleNamespaceImporter(NamespaceImportHook):
     PEP 343 context manager.
     """
 
-    def __init__(self, loaders, namespace, path=[]):
+    def __init__(self, loaders, namespace, path=[], lazy=False):
         super(SingleNamespaceImporter, self).__init__(loaders,
-                                                      {namespace: path})
+                                                      {namespace: path}, lazy)
         self.namespace = namespace
 
     def register(self):
@@ -48,8 +48,20 @@ class SingleNamespaceImporter(NamespaceImportHook):
     def import_namespace(self):
         return __import__(self.namespace)
 
-    def import_all(self, rel_names=[], silent=False):
+    def import_all(self, rel_names=[], silent=False, prefetch=False):
+        """Imports the namespace and the given packages within it.
+
+        In case prefetch is true, files of the packages are first compiled in
+        parallel in a pool of processes (see NamespaceImportHook.prefetch),
+        a number of which can also be passed as a value of the argument.
+        """
         ns = self.namespace
+        rel_names = list(rel_names)
+
+        if prefetch:
+            processes = None if prefetch is True else prefetch
+            self.prefetch(ns, rel_names, processes)
+
         ns_module = self.import_namespace()  # do it first
 
         for rel_name in rel_names:
@@ -62,13 +74,15 @@ class SingleNamespaceImporter(NamespaceImportHook):
         return ns_module
 
 
-def import_all(relative_dirnames, loaders, namespace, path=[]):
+def import_all(relative_dirnames, loaders, namespace, path=[], lazy=False,
+               prefetch=False):
     """
     Goes through relative_dirnames converting them into module names within
     the specified namespace and importing by using NamespaceImporter.
     """
 
-    with SingleNamespaceImporter(loaders, namespace, path) as importer:
-        return importer.import_all(dirname.replace(os.path.sep, '.')
-                                   for dirname in relative_dirnames
-                                   if '.' not in dirname)
+    with SingleNamespaceImporter(loaders, namespace, path, lazy) as importer:
+        return importer.import_all((dirname.replace(os.path.sep, '.')
+                                    for dirname in relative_dirnames
+                                    if '.' not in dirname),
+                                   prefetch=prefetch)
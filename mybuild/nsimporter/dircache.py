@@ -0,0 +1,104 @@
+"""
+Cache of directory listings used to locate packages and loader files.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import os
+
+try:
+    from os import scandir
+except ImportError:  # Python < 3.5
+    scandir = None
+
+
+__all__ = [
+    "DirectoryCache",
+]
+
+
+_empty_listing = (frozenset(), frozenset())
+
+
+def list_directory(dirpath):
+    """Reads a directory at once.
+
+    Returns:
+        A pair of frozensets (dirnames, filenames). Both are empty in case
+        the directory can't be read.
+    """
+    dirnames = set()
+    filenames = set()
+
+    try:
+        if scandir is not None:
+            for entry in scandir(dirpath):
+                if entry.is_dir():
+                    dirnames.add(entry.name)
+                elif entry.is_file():
+                    filenames.add(entry.name)
+
+        else:
+            for name in os.listdir(dirpath):
+                entry_path = os.path.join(dirpath, name)
+                if os.path.isdir(entry_path):
+                    dirnames.add(name)
+                elif os.path.isfile(entry_path):
+                    filenames.add(name)
+
+    except OSError:
+        return _empty_listing
+
+    return frozenset(dirnames), frozenset(filenames)
+
+
+class DirectoryCache(object):
+    """
+    Remembers contents of each visited directory, so that lookups of
+    sub-directories and files cost a single stat of the parent directory
+    instead of a stat per candidate name (similar to FileFinder of py3k
+    importlib).
+
+    A listing is read again once the modification time of its directory
+    changes. Use invalidate() in case a change may go unnoticed, for
+    example, when a directory is modified twice within the resolution of
+    a file system timestamp.
+    """
+
+    def __init__(self):
+        super(DirectoryCache, self).__init__()
+        self._listings = {}  # {dirpath: (mtime, dirnames, filenames)}
+
+    def listing(self, dirpath):
+        """Returns a pair of sets (dirnames, filenames) of a directory."""
+        try:
+            mtime = os.stat(dirpath or os.curdir).st_mtime
+        except OSError:
+            self._listings.pop(dirpath, None)
+            return _empty_listing
+
+        try:
+            cached_mtime, dirnames, filenames = self._listings[dirpath]
+        except KeyError:
+            pass
+        else:
+            if cached_mtime == mtime:
+                return dirnames, filenames
+
+        dirnames, filenames = list_directory(dirpath or os.curdir)
+        self._listings[dirpath] = mtime, dirnames, filenames
+
+        return dirnames, filenames
+
+    def isdir(self, dirpath, name):
+        return name in self.listing(dirpath)[0]
+
+    def isfile(self, dirpath, name):
+        return name in self.listing(dirpath)[1]
+
+    def invalidate(self, dirpath=None):
+        """Forgets a listing of the given directory, or all of them."""
+        if dirpath is None:
+            self._listings.clear()
+        else:
+            self._listings.pop(dirpath, None)
@@ -7,7 +7,10 @@ from mybuild._compat import *
 import os.path
 import sys
 
+from mybuild.nsimporter.dircache import DirectoryCache
+from mybuild.nsimporter.index import NamespaceIndex
 from mybuild.nsimporter.package import PackageLoader
+from mybuild.nsimporter.prefetch import compile_all
 from mybuild.util.importlib.abc import MetaPathFinder
 
 
@@ -28,6 +31,16 @@ class Loader(object):
     An optional FILENAME attribute is recognized which is used to locate
     a file within directories in a path.
     Defaults to a name inside a loaders mapping of the importer.
+
+    An optional get_exports(fullname) method, if defined, lets the importer
+    populate packages lazily. It must return a list of names that a module
+    would define, or None if it is impossible to tell without loading it.
+
+    A PREFETCH attribute set to True allows the importer to compile files
+    of such loader in advance in separate processes, see prefetch() of
+    NamespaceImportHook. Such loader is then created with None importer
+    just to call get_code(fullname), and it may use get_prefetched_code(path)
+    of the importer when loading a module for real.
     """
 
     def __init__(self, importer, fullname, path):
@@ -45,12 +58,132 @@ class NamespaceImportHook(MetaPathFinder):
     PEP 302 meta path import hook.
     """
 
-    def __init__(self, loaders={}, namespace_path={}):
+    def __init__(self, loaders={}, namespace_path={}, lazy=False):
         super(NamespaceImportHook, self).__init__()
 
         self.loaders        = dict(loaders)         # {module_name: loader}
         self.namespace_path = dict(namespace_path)  # {namespace: [path]}
 
+        # Whether to populate packages lazily, see PackageLoader.
+        self.lazy = lazy
+
+        self.namespace_index = {}  # {namespace: NamespaceIndex}
+        self.dircache = DirectoryCache()
+
+        self.prefetched = {}  # {path: (mtime, code)}
+
+    def invalidate_caches(self):
+        """Forgets cached directory listings and brings namespace indices up
+        to date, see importlib.invalidate_caches."""
+        self.dircache.invalidate()
+        for index in itervalues(self.namespace_index):
+            index.update()
+
+    def loader_filenames(self):
+        return set(getattr(loader_type, 'FILENAME', name)
+                   for name, loader_type in iteritems(self.loaders))
+
+    def load_index(self, namespace, index_file):
+        """Makes the importer use an index of a previously registered
+        namespace instead of probing the file system.
+
+        The index is read from the given file and is updated incrementally
+        (or built from scratch, if the file is missing or stale) and written
+        back in case it has changed.
+
+        Returns:
+            NamespaceIndex instance.
+        """
+        ns_path = self.namespace_path[namespace]
+        filenames = self.loader_filenames()
+
+        try:
+            index = NamespaceIndex.load(index_file)
+        except (IOError, OSError, ValueError):
+            index = None
+
+        if (index is None or
+                index.namespace != namespace or
+                index.path != list(ns_path) or
+                index.filenames != filenames):
+            index = NamespaceIndex.build(namespace, ns_path, filenames)
+            changed = True
+        else:
+            changed = index.update()
+
+        if changed:
+            index.save(index_file)
+
+        self.namespace_index[namespace] = index
+        return index
+
+    def prefetch(self, namespace, rel_names=None, processes=None):
+        """Compiles files of a namespace in parallel, so that loading them
+        later only takes executing a ready code.
+
+        Only files of loaders with PREFETCH attribute set are compiled.
+
+        Args:
+            namespace (str): a registered namespace.
+            rel_names: names of packages relative to the namespace to
+                prefetch along with their parents, or None for everything.
+            processes (int): number of worker processes.
+        """
+        ns_path = self.namespace_path[namespace]
+        loader_types = dict((getattr(loader_type, 'FILENAME', name),
+                             (name, loader_type))
+                            for name, loader_type in iteritems(self.loaders)
+                            if getattr(loader_type, 'PREFETCH', False))
+        if not loader_types:
+            return
+
+        index = self.namespace_index.get(namespace)
+        if index is None:
+            index = NamespaceIndex.build(namespace, ns_path, loader_types)
+
+        if rel_names is None:
+            rel_names = index.packages
+
+        packages = set([''])
+        for rel_name in rel_names:
+            while rel_name and rel_name not in packages:
+                packages.add(rel_name)
+                rel_name = rel_name.rpartition('.')[0]
+
+        jobs = []
+        for rel_name in packages:
+            if rel_name and rel_name not in index.packages:
+                continue
+            for filename, filepath in iteritems(index.loader_files(rel_name)):
+                try:
+                    name, loader_type = loader_types[filename]
+                except KeyError:
+                    continue
+                fullname = '.'.join(filter(None, [namespace, rel_name, name]))
+                jobs.append((loader_type, fullname, filepath))
+
+        self.prefetched.update(compile_all(jobs, processes))
+
+    def get_prefetched_code(self, path):
+        """Returns a code compiled by prefetch(), unless the file has changed
+        since then."""
+        try:
+            mtime, code = self.prefetched.pop(path)
+        except KeyError:
+            return None
+
+        try:
+            if os.stat(path).st_mtime == mtime:
+                return code
+        except OSError:
+            pass
+
+        return None
+
+    def _package_loader(self, path):
+        return PackageLoader(path, self.loaders,
+                             finder=self if self.lazy else None)
+
     def find_module(self, fullname, path=None):
         """
         Try to find a loader for the specified module.
@@ -81,7 +214,13 @@ class NamespaceImportHook(MetaPathFinder):
         except KeyError:
             return None
         if not restname:  # namespace root package
-            return PackageLoader(ns_path, self.loaders)
+            return self._package_loader(ns_path)
+
+        index = self.namespace_index.get(namespace)
+        def dircache_for(entry, filename=None):
+            if index is not None and index.knows(entry, filename):
+                return index
+            return self.dircache
 
         tailname = restname.rpartition('.')[2]
         try:
@@ -89,15 +228,15 @@ class NamespaceImportHook(MetaPathFinder):
 
         except KeyError:  # is it a sub-package?
             def find_loader_in(entry):
-                basepath = os.path.join(entry, tailname)
-                if os.path.isdir(basepath):
-                    return PackageLoader([basepath], self.loaders)
+                if dircache_for(entry).isdir(entry, tailname):
+                    basepath = os.path.join(entry, tailname)
+                    return self._package_loader([basepath])
 
         else:  # found a module loader, is there a corresponding file?
             filename = getattr(loader_type, 'FILENAME', tailname)
             def find_loader_in(entry):
-                filepath = os.path.join(entry, filename)
-                if os.path.isfile(filepath):
+                if dircache_for(entry, filename).isfile(entry, filename):
+                    filepath = os.path.join(entry, filename)
                     return loader_type(self, fullname, filepath)
 
         for loader in map(find_loader_in, path or sys.path):
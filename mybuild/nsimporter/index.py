@@ -0,0 +1,229 @@
+"""
+Precomputed index of packages and loader files within a namespace.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+from collections import namedtuple
+import json
+import os
+import re
+
+from mybuild.nsimporter.dircache import list_directory
+
+
+__all__ = [
+    "NamespaceIndex",
+]
+
+
+_identifier_re = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class DirEntry(namedtuple('_DirEntry', 'mtime, dirnames, filenames')):
+    """Listing of a single indexed directory.
+
+    Only sub-directories that can be imported as packages and only files
+    which names are tracked by the index are listed."""
+    __slots__ = ()
+
+
+class NamespaceIndex(object):
+    """
+    Maps dotted package names within a namespace to their directories, and
+    remembers which loader files (like Mybuild or Pybuild) each directory
+    contains.
+
+    Packages are resolved the same way NamespaceImportHook does: a package
+    is the first directory with a given name found along the path of its
+    parent, so shadowed directories are not indexed at all.
+
+    Modification times of indexed directories are stored along with their
+    listings. Adding or removing a file or a sub-directory changes the mtime
+    of its parent, so the index can be validated using a single stat per
+    directory, and only changed directories are read again during update().
+    """
+
+    VERSION = 1
+
+    def __init__(self, namespace, path, filenames):
+        super(NamespaceIndex, self).__init__()
+
+        self.namespace = namespace
+        self.path      = list(path)
+        self.filenames = frozenset(filenames)
+
+        self.dirs     = {}  # {dirpath: DirEntry}
+        self.packages = {}  # {'dotted.relname': dirpath}
+
+    @classmethod
+    def build(cls, namespace, path, filenames):
+        """Creates an index by walking a namespace tree."""
+        index = cls(namespace, path, filenames)
+        index._walk({})
+        return index
+
+    def update(self):
+        """Brings the index up to date with the file system.
+
+        Returns:
+            True if anything has changed, False otherwise.
+        """
+        valid_dirs = {}  # {dirpath: (st, entry)}
+        for dirpath, entry in iteritems(self.dirs):
+            try:
+                st = os.stat(dirpath)
+            except OSError:
+                continue
+            if st.st_mtime == entry.mtime:
+                valid_dirs[dirpath] = st, entry
+
+        if len(valid_dirs) == len(self.dirs):
+            return False
+
+        self._walk(valid_dirs)
+        return True
+
+    def _walk(self, valid_dirs):
+        dirs = {}
+        packages = {}
+        seen = set()  # (st_dev, st_ino) to avoid symlink loops
+
+        def read_dir(dirpath):
+            try:
+                st, entry = valid_dirs[dirpath]
+            except KeyError:
+                try:
+                    st = os.stat(dirpath)
+                except OSError:
+                    return None
+                entry = None
+
+            key = (st.st_dev, st.st_ino)
+            if key in seen:
+                return None
+            seen.add(key)
+
+            if entry is not None:
+                return entry
+
+            dirnames, filenames = list_directory(dirpath)
+            return DirEntry(st.st_mtime,
+                            frozenset(filter(_identifier_re.match, dirnames)),
+                            filenames & self.filenames)
+
+        stack = [('', self.path)]  # [(package relname, package path)]
+        while stack:
+            relname, path = stack.pop()
+
+            sub_names = set()
+            for dirpath in path:
+                if dirpath in dirs:
+                    continue
+                entry = read_dir(dirpath)
+                if entry is None:
+                    continue
+                dirs[dirpath] = entry
+
+                for name in entry.dirnames.difference(sub_names):
+                    sub_names.add(name)
+
+                    sub_relname = relname + '.' + name if relname else name
+                    sub_dirpath = os.path.join(dirpath, name)
+
+                    packages[sub_relname] = sub_dirpath
+                    stack.append((sub_relname, [sub_dirpath]))
+
+        self.dirs = dirs
+        self.packages = packages
+
+    def loader_files(self, relname):
+        """Returns {filename: filepath} of loader files found in a package
+        (or in namespace root, in case relname is empty)."""
+        ret = {}
+        for dirpath in ([self.packages[relname]] if relname else self.path):
+            entry = self.dirs.get(dirpath)
+            if entry is None:
+                continue
+            for filename in entry.filenames.difference(ret):
+                ret[filename] = os.path.join(dirpath, filename)
+        return ret
+
+    def knows(self, dirpath, filename=None):
+        """Tells whether a directory (and a given file within it) is covered
+        by the index."""
+        return (dirpath in self.dirs and
+                (filename is None or filename in self.filenames))
+
+    def isdir(self, dirpath, name):
+        return name in self.dirs[dirpath].dirnames
+
+    def isfile(self, dirpath, name):
+        return name in self.dirs[dirpath].filenames
+
+    @classmethod
+    def load(cls, filename):
+        """Reads an index previously stored with save().
+
+        Raises:
+            ValueError: if the file is malformed or of unsupported version.
+        """
+        with open(filename, 'r') as f:
+            data = json.load(f)
+
+        try:
+            if data['version'] != cls.VERSION:
+                raise ValueError('Unsupported index version: {0!r}'
+                                 .format(data['version']))
+
+            index = cls(data['namespace'], data['path'], data['filenames'])
+            index.dirs = dict((dirpath, DirEntry(mtime, frozenset(dirnames),
+                                                 frozenset(filenames)))
+                              for dirpath, (mtime, dirnames, filenames)
+                              in iteritems(data['dirs']))
+            index.packages = dict(data['packages'])
+
+        except (KeyError, TypeError) as e:
+            raise ValueError('Malformed index file: {0}'.format(e))
+
+        return index
+
+    def save(self, filename):
+        data = {
+            'version':   self.VERSION,
+            'namespace': self.namespace,
+            'path':      self.path,
+            'filenames': sorted(self.filenames),
+            'dirs':      dict((dirpath, [entry.mtime,
+                                         sorted(entry.dirnames),
+                                         sorted(entry.filenames)])
+                              for dirpath, entry in iteritems(self.dirs)),
+            'packages':  self.packages,
+        }
+
+        # Overwrite the file in place: unlike creating a new file and renaming
+        # it, this does not change mtime of a parent directory, which may be
+        # indexed itself. A partially written file is rejected by load().
+        with open(filename, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Generates an index of a namespace tree.')
+    parser.add_argument('-f', '--filename', action='append',
+                        dest='filenames', default=[],
+                        help='loader file name to track (default: Mybuild '
+                             'and Pybuild)')
+    parser.add_argument('namespace')
+    parser.add_argument('index_file')
+    parser.add_argument('path', nargs='+')
+    args = parser.parse_args()
+
+    index = NamespaceIndex.build(args.namespace,
+                                 [os.path.normpath(os.path.abspath(entry))
+                                  for entry in args.path],
+                                 args.filenames or ['Mybuild', 'Pybuild'])
+    index.save(args.index_file)
@@ -4,6 +4,7 @@ Namespace-related loaders that don't run any code directly.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import sys
 import types
 
 from mybuild.util.importlib.machinery import GenericLoader
@@ -13,12 +14,19 @@ class PackageLoader(GenericLoader):
     """Performs basic initialization required to load a sourceless package.
 
     Also loads modules supported by available loaders and fills the package
-    module with public contents of the loaded modules."""
+    module with public contents of the loaded modules.
 
-    def __init__(self, path, sub_modules=[]):
+    In case a finder is given, the modules are not loaded right away. Instead,
+    the finder is used to get a loader of each module, and names exported by
+    the module are retrieved through its get_exports() method (when a loader
+    has one). The module is then loaded upon the first access to any of these
+    names through the package."""
+
+    def __init__(self, path, sub_modules=[], finder=None):
         super(PackageLoader, self).__init__()
         self.path = path
         self.sub_modules = sub_modules
+        self.finder = finder
 
     def _new_module(self, fullname):
         return PackageModule(fullname)
@@ -31,28 +39,84 @@ class PackageLoader(GenericLoader):
         module.__path__    = self.path
         module.__loader__  = self
 
+        module._lazy_exports = lazy_exports = {}  # {attr: sub_name}
+
         for sub_name in self.sub_modules:
-            try:
-                __import__(fullname + '.' + sub_name)
-            except ImportError:
-                continue
+            exports = self._get_exports(fullname + '.' + sub_name)
+
+            if exports is None:
+                self._load_sub_module(module, sub_name)
             else:
-                sub_module = getattr(module, sub_name)
-
-            try:
-                attrs = sub_module.__all__
-            except AttributeError:
-                attrs = [attr for attr in sub_module.__dict__
-                         if not attr.startswith('_')]
-            for attr in attrs:
+                for attr in exports:
+                    lazy_exports[attr] = sub_name
+
+    def _get_exports(self, sub_fullname):
+        """Returns names exported by a module without loading it, or None if
+        the module must be loaded to know them."""
+        if self.finder is None:
+            return None
+
+        loader = self.finder.find_module(sub_fullname, self.path)
+        if loader is None:
+            return ()
+
+        try:
+            get_exports = loader.get_exports
+        except AttributeError:
+            return None
+
+        try:
+            return get_exports(sub_fullname)
+        except (ImportError, SyntaxError):
+            return None  # let the error be reported upon loading
+
+    def _import_sub_module(self, module, sub_name):
+        sub_fullname = module.__name__ + '.' + sub_name
+
+        if self.finder is None or sub_fullname in sys.modules:
+            __import__(sub_fullname)
+            return getattr(module, sub_name)
+
+        # Don't rely on the finder being still installed into sys.meta_path
+        # at the time a lazy package is accessed.
+        loader = self.finder.find_module(sub_fullname, self.path)
+        if loader is None:
+            raise ImportError('No module named ' + sub_fullname)
+
+        sub_module = loader.load_module(sub_fullname)
+        setattr(module, sub_name, sub_module)
+        return sub_module
+
+    def _load_sub_module(self, module, sub_name):
+        try:
+            sub_module = self._import_sub_module(module, sub_name)
+        except ImportError:
+            return
+
+        lazy_exports = module._lazy_exports
+
+        try:
+            attrs = sub_module.__all__
+        except AttributeError:
+            attrs = [attr for attr in sub_module.__dict__
+                     if not attr.startswith('_')]
+        for attr in attrs:
+            if lazy_exports.get(attr, sub_name) == sub_name:
+                lazy_exports.pop(attr, None)
                 setattr(module, attr, getattr(sub_module, attr))
 
 
 class PackageModule(types.ModuleType):
-    """In case of missing attribute lookup error attempts to import
+    """In case of missing attribute lookup error attempts to load a module
+    exporting such name (if the package is populated lazily) or to import
     a subpackage with such name."""
 
     def __getattr__(self, name):
+        lazy_exports = self.__dict__.get('_lazy_exports')
+        if lazy_exports and name in lazy_exports:
+            self.__loader__._load_sub_module(self, lazy_exports.pop(name))
+            return getattr(self, name)
+
         try:
             __import__(self.__name__ + '.' + name)
         except ImportError:
@@ -0,0 +1,69 @@
+"""
+Parallel compilation of files to be loaded by a namespace importer.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import marshal
+import multiprocessing
+import os
+
+
+__all__ = [
+    "compile_all",
+]
+
+
+def _compile(job):
+    """Runs in a worker process.
+
+    Code objects are not picklable, so they are passed back marshalled."""
+    loader_type, fullname, path = job
+    try:
+        mtime = os.stat(path).st_mtime
+        code = loader_type(None, fullname, path).get_code(fullname)
+    except Exception:
+        # Let the error be reported when the module is actually loaded.
+        return path, None, None
+    return path, mtime, marshal.dumps(code)
+
+
+def compile_all(jobs, processes=None, chunksize=4):
+    """Compiles files in a pool of worker processes.
+
+    Args:
+        jobs: an iterable of (loader_type, fullname, path) tuples; each
+            loader_type must be picklable and its get_code(fullname) must
+            not depend on an importer.
+        processes (int): number of workers, defaults to the number of CPUs.
+
+    Returns:
+        A dict {path: (mtime, code)} of successfully compiled files.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+
+    ret = {}
+    if processes <= 1:
+        results = map(_compile, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_compile, jobs, chunksize)
+
+    try:
+        for path, mtime, code_bytes in results:
+            if code_bytes is not None:
+                ret[path] = mtime, marshal.loads(code_bytes)
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return ret
@@ -0,0 +1,474 @@
+"""
+Loader for compact binary catalogues of modules.
+
+A catalogue holds plain data of module types (options with their values,
+files, includes, dependencies and provided interfaces), and module types
+are created right from the data, without parsing and executing any code.
+This suits large trees of machine-generated modules, which can be converted
+into catalogues once using convert().
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import bisect
+from collections import namedtuple
+import mmap
+import struct
+import sys
+import types
+
+from mybuild import core
+from mybuild.util.importlib.machinery import SourceFileLoader
+from mybuild.util.prop import cached_class_property, cached_property
+
+
+__all__ = [
+    "CatalogueLoader",
+    "Catalogue",
+    "ModuleRecord",
+    "convert",
+    "dump",
+]
+
+
+# File layout, all integers are little-endian unsigned 32-bit words:
+#
+#   header     magic, version, nr_strings, nr_modules, nr_words
+#   index      (name, offset, length) per module, sorted by name
+#   strings    nr_strings + 1 offsets of strings within the blob
+#   words      records of modules, referred by offset/length in the index
+#   blob       UTF-8 encoded strings
+#
+# Strings are referred by their numbers in the string table.
+
+MAGIC = b'MYBC'
+
+_header = struct.Struct('<4s4I')
+
+# Tags of values (each value takes two words: a tag and a payload).
+_ELLIPSIS, _NONE, _FALSE, _TRUE, _INT, _STR = range(6)
+
+
+class OptionRecord(namedtuple('_OptionRecord',
+                              'name, default, values, extendable')):
+    """Option of a module: values is a tuple, default may be Ellipsis."""
+    __slots__ = ()
+
+
+class ModuleRecord(namedtuple('_ModuleRecord',
+                              'name, kind, options, files, includes, '
+                              'depends, provides')):
+    """Plain data of a module type.
+
+    Other modules are referred by (module_name, type_name) pairs, where an
+    empty module_name stands for a module of the catalogue itself. Each item
+    of depends is a (module_name, type_name, option_pairs) triple.
+    """
+    __slots__ = ()
+
+
+class Catalogue(object):
+    """Read-only view of a catalogue in a buffer (usually a memory map).
+
+    Records are decoded on demand, so that opening even a huge catalogue
+    only takes reading its header.
+    """
+
+    VERSION = 1
+
+    def __init__(self, buf):
+        super(Catalogue, self).__init__()
+
+        try:
+            (magic, version,
+             nr_strings, nr_modules, nr_words) = _header.unpack_from(buf)
+        except struct.error:
+            raise ValueError('Truncated catalogue header')
+
+        if magic != MAGIC:
+            raise ValueError('Not a catalogue')
+        if version != self.VERSION:
+            raise ValueError('Unsupported catalogue version: {0}'
+                             .format(version))
+
+        self._buf = buf
+        self._nr_modules = nr_modules
+
+        self._index_offset = _header.size
+        self._strings_offset = self._index_offset + 12 * nr_modules
+        self._words_offset = self._strings_offset + 4 * (nr_strings + 1)
+        self._blob_offset = self._words_offset + 4 * nr_words
+        self._nr_strings = nr_strings
+
+        if len(buf) < self._blob_offset:
+            raise ValueError('Truncated catalogue')
+
+        self._strings = {}  # {number: str}, cached ones
+
+    @classmethod
+    def open(cls, path):
+        """Maps a catalogue file into memory."""
+        with open(path, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # an empty file can't be mapped
+                raise ValueError('Truncated catalogue header')
+
+        try:
+            return cls(buf)
+        except ValueError:
+            buf.close()
+            raise
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def _string(self, nr):
+        try:
+            return self._strings[nr]
+        except KeyError:
+            pass
+
+        if nr >= self._nr_strings:
+            raise ValueError('Bad string number: {0}'.format(nr))
+
+        start, end = struct.unpack_from('<2I', self._buf,
+                                        self._strings_offset + 4 * nr)
+        ret = self._strings[nr] = (self._buf[self._blob_offset + start:
+                                             self._blob_offset + end]
+                                   .decode('utf-8'))
+        return ret
+
+    def _index_entry(self, i):
+        return struct.unpack_from('<3I', self._buf,
+                                  self._index_offset + 12 * i)
+
+    def __len__(self):
+        return self._nr_modules
+
+    def __getitem__(self, i):
+        """Name of i-th module in sorted order."""
+        if not 0 <= i < self._nr_modules:
+            raise IndexError(i)
+        return self._string(self._index_entry(i)[0])
+
+    def names(self):
+        return [self[i] for i in range(len(self))]
+
+    def _find(self, name):
+        i = bisect.bisect_left(self, name)
+        if i < len(self) and self[i] == name:
+            return i
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def record(self, name):
+        """Decodes a record of the named module.
+
+        Returns:
+            ModuleRecord, or None if there is no such module.
+        """
+        i = self._find(name)
+        if i is None:
+            return None
+
+        _, offset, length = self._index_entry(i)
+        words = iter(struct.unpack_from('<{0}I'.format(length), self._buf,
+                                        self._words_offset + 4 * offset))
+        string = lambda: self._string(next(words))
+        value = lambda: self._value(next(words), next(words))
+        repeat = lambda func: [func() for _ in range(next(words))]
+
+        try:
+            kind = string()
+            options = repeat(lambda: OptionRecord(string(), value(),
+                                                  tuple(repeat(value)),
+                                                  bool(next(words))))
+            files = repeat(string)
+            includes = repeat(string)
+            depends = repeat(lambda: (string(), string(),
+                                      repeat(lambda: (string(), value()))))
+            provides = repeat(lambda: (string(), string()))
+        except StopIteration:
+            raise ValueError('Truncated record of {0}'.format(name))
+
+        return ModuleRecord(name, kind, options, files, includes,
+                            depends, provides)
+
+    def _value(self, tag, payload):
+        if tag == _STR:
+            return self._string(payload)
+        if tag == _INT:
+            return int(self._string(payload))
+        try:
+            return (Ellipsis, None, False, True)[tag]
+        except IndexError:
+            raise ValueError('Bad value tag: {0}'.format(tag))
+
+
+def dump(records, f):
+    """Writes ModuleRecord's into a binary file object."""
+    strings = {}  # {str: number}
+
+    def string(s):
+        try:
+            return strings[s]
+        except KeyError:
+            ret = strings[s] = len(strings)
+            return ret
+
+    def value(v):
+        if v is Ellipsis:
+            return [_ELLIPSIS, 0]
+        if v is None:
+            return [_NONE, 0]
+        if isinstance(v, bool):
+            return [_TRUE if v else _FALSE, 0]
+        if isinstance(v, integer_types):
+            return [_INT, string(str(v))]
+        if isinstance(v, string_types):
+            return [_STR, string(v)]
+        raise TypeError('Unsupported value type: {0!r}'.format(v))
+
+    records = sorted(records, key=lambda record: record.name)
+
+    index = []
+    words = []
+    for record in records:
+        offset = len(words)
+
+        words.append(string(record.kind))
+
+        words.append(len(record.options))
+        for option in record.options:
+            words.append(string(option.name))
+            words.extend(value(option.default))
+            words.append(len(option.values))
+            for each in option.values:
+                words.extend(value(each))
+            words.append(int(bool(option.extendable)))
+
+        for strs in record.files, record.includes:
+            words.append(len(strs))
+            words.extend(map(string, strs))
+
+        words.append(len(record.depends))
+        for module_name, type_name, option_pairs in record.depends:
+            words.extend([string(module_name), string(type_name),
+                          len(option_pairs)])
+            for option, each in option_pairs:
+                words.append(string(option))
+                words.extend(value(each))
+
+        words.append(len(record.provides))
+        for module_name, type_name in record.provides:
+            words.extend([string(module_name), string(type_name)])
+
+        index.extend([string(record.name), offset, len(words) - offset])
+
+    encoded = [s.encode('utf-8') for s, _ in sorted(iteritems(strings),
+                                                    key=lambda pair: pair[1])]
+    string_offsets = [0]
+    for each in encoded:
+        string_offsets.append(string_offsets[-1] + len(each))
+
+    f.write(_header.pack(MAGIC, Catalogue.VERSION,
+                         len(encoded), len(records), len(words)))
+    for ints in index, string_offsets, words:
+        f.write(struct.pack('<{0}I'.format(len(ints)), *ints))
+    f.write(b''.join(encoded))
+
+
+default_kinds = {
+    'module':  core.Module,
+    'project': core.Project,
+}
+
+
+def record_for(mtype, kinds=default_kinds):
+    """Makes a ModuleRecord of a module type.
+
+    The module is instantiated with default values of its options, and its
+    data is captured as is. That is, a module must have a default value for
+    each option, and its files, dependencies, etc. must not depend on the
+    option values, which is the case for generated modules.
+
+    The kind of the record is the one of the most specific base type found
+    among kinds (a {kind: base_type} mapping), 'module' by default.
+    """
+    kind_of = dict((base_type, kind) for kind, base_type in iteritems(kinds))
+    for base in mtype.__mro__:
+        if base in kind_of:
+            kind = kind_of[base]
+            break
+    else:
+        kind = 'module'
+
+    options = []
+    for optype in mtype._optypes:
+        values = sorted(optype._values,
+                        key=lambda v: (type(v).__name__, repr(v)))
+        options.append(OptionRecord(optype._name, optype.default,
+                                    tuple(values), optype.extendable))
+
+    defaults = [option.default for option in options]
+    if Ellipsis in defaults:
+        raise ValueError('Module {0!r} has options with no default value'
+                         .format(mtype))
+    instance = mtype._opmake(defaults)._instantiate_module()
+    instance._post_init()  # constrains on depends and build_depends
+
+    def ref(target):
+        module_name = target.__module__
+        if module_name == mtype.__module__:
+            module_name = ''
+        return module_name, target.__name__
+
+    depends = []
+    for optuple, condition in instance._constraints:
+        if not condition:
+            continue  # merely discovered, e.g. a provided interface
+        dep = ref(optuple._module) + (list(optuple._iterpairs()),)
+        if dep not in depends:
+            depends.append(dep)
+
+    provides = [ref(interface) for interface in instance.provides
+                if interface is not mtype]
+
+    return ModuleRecord(mtype.__name__, kind, options,
+                        list(instance.files), list(instance.includes),
+                        depends, provides)
+
+
+def convert(module, path, kinds=default_kinds):
+    """Writes a catalogue of module types defined in a (loaded) Python module,
+    e.g. in a one created by Mybuild or Pybuild loader, see record_for()."""
+    records = [record_for(value, kinds)
+               for name, value in sorted(iteritems(vars(module)))
+               if isinstance(value, core.ModuleMetaBase) and
+                   not value._internal and
+                   value.__module__ == module.__name__ and
+                   value.__name__ == name]
+
+    with open(path, 'wb') as f:
+        dump(records, f)
+
+
+class CatalogueLoader(SourceFileLoader):
+    """Loads catalogues of modules.
+
+    A module type is created upon the first access to its name. Catalogues
+    are not meant to be edited, and to replace the source files with
+    catalogues one should register the loader under the same name as of the
+    loader of source files (e.g., 'Mybuild'), but with a different FILENAME,
+    so that names of modules remain the same.
+    """
+
+    # Base module types for each kind of a record.
+    kinds = default_kinds
+
+    def __init__(self, importer, fullname, path):
+        super(CatalogueLoader, self).__init__(fullname, path)
+        self.importer = importer
+        self.catalogue = None
+
+    def is_package(self, fullname):
+        return False
+
+    def get_code(self, fullname):
+        return None
+
+    def get_source(self, fullname):
+        return None
+
+    def _open(self, fullname):
+        if self.catalogue is None:
+            try:
+                self.catalogue = Catalogue.open(self.get_filename(fullname))
+            except IOError:
+                raise ImportError("IO error while reading a catalogue")
+            except ValueError as e:
+                raise ImportError("Malformed catalogue: {0}".format(e))
+        return self.catalogue
+
+    def get_exports(self, fullname):
+        return self._open(fullname).names()
+
+    def _new_module(self, fullname):
+        return CatalogueModule(fullname)
+
+    def _exec_module(self, module):
+        self._open(module.__name__)
+
+    def _load_type(self, module, name):
+        """Creates a module type, or returns None if there is no such one."""
+        record = self.catalogue.record(name)
+        if record is None:
+            return None
+
+        try:
+            base_type = self.kinds[record.kind]
+        except KeyError:
+            raise ImportError("Unknown kind of module '{0}': {1}"
+                              .format(name, record.kind))
+
+        option_types = []
+        for option in record.options:
+            optype = core.Optype(*option.values)
+            optype.set(default=option.default,
+                       extendable=option.extendable,
+                       name=option.name)
+            option_types.append((option.name, optype))
+
+        resolve = lambda ref: _resolve(module, *ref)
+
+        def depends(self):
+            return [resolve(dep[:2])(**dict(dep[2]))
+                    for dep in record.depends]
+
+        def provides(cls):
+            return [cls] + list(map(resolve, record.provides))
+
+        attrs = {
+            '__module__': module.__name__,
+            'files':      cached_property(lambda self: list(record.files),
+                                          attr='files'),
+            'includes':   cached_property(lambda self: list(record.includes),
+                                          attr='includes'),
+            'depends':    cached_property(depends),
+            'provides':   cached_class_property(provides),
+        }
+
+        mtype = new_type(name, (base_type,), attrs,
+                         metaclass=type(base_type), option_types=option_types)
+        setattr(module, name, mtype)
+
+        return mtype
+
+
+def _resolve(module, module_name, type_name):
+    if not module_name:
+        return getattr(module, type_name)
+
+    target = sys.modules.get(module_name)
+    if target is None:
+        __import__(module_name)
+        target = sys.modules[module_name]
+
+    return getattr(target, type_name)
+
+
+class CatalogueModule(types.ModuleType):
+    """Creates module types upon the first access to their names."""
+
+    def __getattr__(self, name):
+        loader = self.__dict__.get('__loader__')
+        if loader is not None and not name.startswith('__'):
+            mtype = loader._load_type(self, name)
+            if mtype is not None:
+                return mtype
+
+        raise AttributeError("'{cls.__name__}' object has no attribute "
+                             "'{name}'".format(cls=type(self), **locals()))
@@ -4,7 +4,11 @@ Loader for plain old Mybuild files.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
-from mybuild.lang import my_compile, runtime
+import dis
+import sys
+import types
+
+from mybuild.lang import my_compile, my_exports, runtime
 from mybuild.nsloader import pyfile
 
 
@@ -15,6 +19,15 @@ __date__ = "2013-07-05"
 class MyFileLoader(pyfile.PyFileLoader):
     """Loads My-files using myfile parser/linker."""
 
+    PREFETCH = True
+
+    # Whether to compile files without tracking precise locations, which is
+    # faster and is fine for files known to be correct, see my_compile().
+    # In case a module fails to execute, the failed instruction is looked up
+    # in a precisely compiled code in order to get an exact location of the
+    # error, which is added as a note to the exception.
+    fast_compile = False
+
     def defaults_for_module(self, module):
         return dict(self.defaults,
                     __builtins__=runtime.builtins,
@@ -22,6 +35,101 @@ class MyFileLoader(pyfile.PyFileLoader):
 
     def get_code(self, fullname):
         source_path = self.get_filename(fullname)
+
+        if self.importer is not None:
+            code = self.importer.get_prefetched_code(source_path)
+            if code is not None:
+                return code
+
         source_string = self.get_source(fullname)
 
-        return my_compile(source_string, source_path, 'exec')
+        return my_compile(source_string, source_path, 'exec',
+                          self.fast_compile)
+
+    def _exec_module(self, module):
+        try:
+            super(MyFileLoader, self)._exec_module(module)
+
+        except Exception as e:
+            if not self.fast_compile:
+                raise
+
+            # Never run a module body twice: it may have side effects (e.g.
+            # imports or registration of modules). A precisely compiled code
+            # is only used to look up an exact location of the error.
+            location = self._precise_location(module.__name__,
+                                              sys.exc_info()[2])
+            if location is not None:
+                _add_note(e, 'Precise location: File "{0}", line {1}'
+                          .format(*location))
+            raise
+
+    def _precise_location(self, fullname, tb):
+        """Maps the innermost traceback entry within a module onto a precisely
+        compiled code. Returns a (filename, lineno) tuple, or None if it is
+        not known better than from the traceback itself."""
+        filename = self.get_filename(fullname)
+
+        last = None
+        while tb is not None:
+            if tb.tb_frame.f_code.co_filename == filename:
+                last = tb
+            tb = tb.tb_next
+        if last is None:
+            return None
+
+        try:
+            code = my_compile(self.get_source(fullname), filename, 'exec')
+        except Exception:
+            return None
+
+        lineno = precise_lineno(last.tb_frame.f_code, last.tb_lasti, code)
+        if lineno is None or lineno == last.tb_lineno:
+            return None
+
+        return filename, lineno
+
+    def get_exports(self, fullname):
+        source_path = self.get_filename(fullname)
+        source_string = self.get_source(fullname)
+
+        return my_exports(source_string, source_path)
+
+
+def _add_note(error, note):
+    # See PEP 678, notes are merely kept by Python versions prior to 3.11.
+    notes = getattr(error, '__notes__', None)
+    if notes is None:
+        error.__notes__ = notes = []
+    notes.append(note)
+
+
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            for each in _code_objects(const):
+                yield each
+
+
+def precise_lineno(fast_code, offset, precise_code):
+    """Looks up a line number of an instruction at the given offset of a fast
+    compiled code within a counterpart of that code in a precise one.
+
+    Returns:
+        The line number, or None unless there is exactly one counterpart with
+        the same bytecode.
+    """
+    key = lambda code: (code.co_name, code.co_firstlineno, code.co_code)
+    counterparts = [code for code in _code_objects(precise_code)
+                    if key(code) == key(fast_code)]
+    if len(counterparts) != 1:
+        return None
+
+    lineno = None
+    for start, each_lineno in dis.findlinestarts(counterparts[0]):
+        if start > offset:
+            break
+        if each_lineno is not None:
+            lineno = each_lineno
+    return lineno
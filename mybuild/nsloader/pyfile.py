@@ -4,9 +4,65 @@ Python-like loader which is able to customize default global namespace.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import ast
+
 from mybuild.util.importlib.machinery import SourceFileLoader
 
 
+_scope_types = tuple(getattr(ast, name) for name in
+                     ('FunctionDef', 'AsyncFunctionDef', 'ClassDef')
+                     if hasattr(ast, name))
+_nested_scope_types = tuple(getattr(ast, name) for name in
+                            ('Lambda', 'ListComp', 'SetComp', 'DictComp',
+                             'GeneratorExp')
+                            if hasattr(ast, name))
+
+# Builtins which allow to bind global names dynamically.
+_namespace_funcs = frozenset(['globals', 'vars', 'locals', 'exec'])
+
+
+def _is_dynamic(node):
+    """Tells whether a module may bind global names in a way which can't be
+    followed statically, e.g. using a 'global' statement or globals()."""
+    if isinstance(node, (ast.Global, getattr(ast, 'Exec', ast.Global))):
+        return True
+
+    return (isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Name) and
+            node.func.id in _namespace_funcs)
+
+
+def _iter_bound_names(node):
+    """Yields global names bound by a module or a statement, or None in case
+    it is not possible to tell them statically (e.g. 'from module import *').
+    """
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, _scope_types):
+            yield child.name
+
+        elif isinstance(child, _nested_scope_types):
+            continue
+
+        elif isinstance(child, (ast.Import, ast.ImportFrom)):
+            for alias in child.names:
+                if alias.name == '*':
+                    yield None
+                else:
+                    yield alias.asname or alias.name.partition('.')[0]
+
+        elif isinstance(child, ast.Name):
+            if isinstance(child.ctx, ast.Store):
+                yield child.id
+
+        else:
+            if (isinstance(child, ast.ExceptHandler) and
+                    isinstance(child.name, str)):  # Py3k only
+                yield child.name
+
+            for each in _iter_bound_names(child):
+                yield each
+
+
 class PyFileLoader(SourceFileLoader):
     """Loads Pybuild files and executes them as regular Python scripts.
 
@@ -30,6 +86,47 @@ class PyFileLoader(SourceFileLoader):
     def defaults_for_module(self, module):
         return self.defaults
 
+    def get_exports(self, fullname):
+        """Lists public names of a module without executing it.
+
+        Returns:
+            A list of names, or None if the module has to be executed
+            to know them.
+        """
+        source_path = self.get_filename(fullname)
+        source = self.get_source(fullname)
+
+        module_ast = ast.parse(source, source_path)
+
+        all_refs = 0  # __all__ must only be assigned once to a literal
+        for node in ast.walk(module_ast):
+            if _is_dynamic(node):
+                return None
+            if isinstance(node, ast.Name) and node.id == '__all__':
+                all_refs += 1
+
+        if all_refs:
+            if all_refs > 1:
+                return None
+
+            for stmt in module_ast.body:
+                if (isinstance(stmt, ast.Assign) and
+                        len(stmt.targets) == 1 and
+                        isinstance(stmt.targets[0], ast.Name) and
+                        stmt.targets[0].id == '__all__'):
+                    try:
+                        return list(ast.literal_eval(stmt.value))
+                    except ValueError:
+                        return None
+
+            return None  # e.g. assigned within an if statement
+
+        names = set(_iter_bound_names(module_ast))
+        if None in names:
+            return None
+
+        return [name for name in names if not name.startswith('_')]
+
     def _init_module(self, module):
         module.__dict__.update(self.defaults_for_module(module))
         super(PyFileLoader, self)._init_module(module)
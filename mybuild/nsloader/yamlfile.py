@@ -5,6 +5,9 @@ from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
 import functools
+import io
+import os
+import types
 
 from mybuild.util.importlib.machinery import SourceFileLoader
 
@@ -21,13 +24,70 @@ else:
         from yaml import Loader as YamlLoader
 
 
+# Document indices of files scanned so far: {(path, name_key): (mtime, index)}
+_index_cache = {}
+
+
+def index_documents(source, name_key, loader_type=None):
+    """Scans YAML source for documents without constructing them.
+
+    Returns:
+        A list of (name, start, end) tuples, where name is a scalar value of
+        name_key of a top-level mapping of the document (or None), and
+        start:end is a slice of the source which holds the document.
+    """
+    if loader_type is None:
+        loader_type = YamlLoader
+
+    ret = []
+
+    depth = 0
+    for event in yaml.parse(source, Loader=loader_type):
+        if isinstance(event, yaml.DocumentStartEvent):
+            mark = event.start_mark
+            start = mark.index - mark.column  # keep indentation
+            name = None
+            key = None
+            is_key = True
+
+        elif isinstance(event, yaml.DocumentEndEvent):
+            ret.append((name, start, event.end_mark.index))
+
+        elif isinstance(event, yaml.NodeEvent):
+            # Keys and values of the top-level mapping are at depth 1.
+            if depth == 1:
+                if is_key:
+                    key = getattr(event, 'value', None)
+                elif (key == name_key and name is None and
+                      isinstance(event, yaml.ScalarEvent)):
+                    name = event.value
+                is_key = not is_key
+
+            if isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+
+    return ret
+
+
 class YamlFileLoader(SourceFileLoader):
     """Loads YAML files.
 
+    Documents are scanned once to find their names, and each document
+    having a name is constructed only upon the first access to the
+    corresponding module attribute. A name is taken from the NAME_KEY entry
+    of a document, and it must be the same as __name__ of an object
+    constructed from the document. Documents with no name are constructed
+    right away.
+
     TODO Does not fully comply InspectLoader protocol."""
 
     MODULE = 'MyYaml'
 
+    NAME_KEY = 'name'
+
     @classmethod
     def init_ctx(cls, importer, initials):
         return initials  # defaults
@@ -36,6 +96,8 @@ class YamlFileLoader(SourceFileLoader):
         super(YamlFileLoader, self).__init__(fullname, path)
         self._defaults = dict((key, value)
                               for key, value in iteritems(defaults))
+        self._yaml_loader_type = None
+        self._source = None
 
     def is_package(self, fullname):
         return False
@@ -43,33 +105,113 @@ class YamlFileLoader(SourceFileLoader):
     def get_code(self, fullname):
         return None
 
+    def get_source(self, fullname):
+        try:
+            with io.open(self.get_filename(fullname), 'r',
+                         encoding='utf-8') as f:
+                return f.read()
+        except IOError:
+            raise ImportError("IO error while reading a stream")
+
+    def _new_module(self, fullname):
+        return YamlModule(fullname)
+
+    def _get_loader_type(self, fullname):
+        if self._yaml_loader_type is None:
+            # Constructors are added to a subclass, and so they are not
+            # visible to other loaders.
+            class MyYamlLoader(YamlLoader):
+                pass
+
+            for tag, func in iteritems(self._defaults):
+                MyYamlLoader.add_constructor(tag,
+                                             _constructor(fullname, func))
+
+            self._yaml_loader_type = MyYamlLoader
+
+        return self._yaml_loader_type
+
+    def _get_index(self, fullname):
+        """Returns an index of documents, see index_documents()."""
+        path = self.get_filename(fullname)
+        key = (path, self.NAME_KEY)
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            raise ImportError("IO error while reading a stream")
+
+        try:
+            cached_mtime, index = _index_cache[key]
+        except KeyError:
+            pass
+        else:
+            if cached_mtime == mtime:
+                return index
+
+        index = index_documents(self._source, self.NAME_KEY)
+        _index_cache[key] = mtime, index
+
+        return index
+
+    def get_exports(self, fullname):
+        self._source = self.get_source(fullname)
+        index = self._get_index(fullname)
+
+        names = [name for name, start, end in index]
+        if None in names:
+            return None
+        return names
+
     def _exec_module(self, module):
         fullname = module.__name__
 
         if yaml is None:
             raise ImportError('PyYaml is not installed')
 
-        class MyYamlLoader(YamlLoader):
-            pass
+        self._source = self.get_source(fullname)
 
-        for tag, func in iteritems(self._defaults):
-            @functools.wraps(func)
-            def constructor(loader, node):
-                return func(fullname, loader.construct_mapping(node))
+        try:
+            index = self._get_index(fullname)
+        except yaml.YAMLError as e:
+            raise e  # XXX convert into SyntaxError
 
-            yaml.add_constructor(tag, constructor, Loader=MyYamlLoader)
+        module._lazy_docs = lazy_docs = {}  # {name: (start, end)}
 
-        try:
-            stream = file(self.get_filename(fullname), 'r')
-            docs = yaml.load_all(stream, Loader=MyYamlLoader)
+        for name, start, end in index:
+            if name is None:
+                self._load_document(module, start, end)
+            else:
+                lazy_docs[name] = start, end
 
-        except IOError:
-            raise ImportError("IO error while reading a stream")
+    def _load_document(self, module, start, end):
+        loader_type = self._get_loader_type(module.__name__)
+
+        try:
+            doc = yaml.load(self._source[start:end], Loader=loader_type)
         except yaml.YAMLError as e:
             raise e  # XXX convert into SyntaxError
 
-        else:
-            for doc in docs:
-                if not hasattr(doc, '__name__'):
-                    continue
-                setattr(module, doc.__name__, doc)
+        if hasattr(doc, '__name__'):
+            setattr(module, doc.__name__, doc)
+
+
+def _constructor(fullname, func):
+    @functools.wraps(func)
+    def constructor(loader, node):
+        return func(fullname, loader.construct_mapping(node))
+    return constructor
+
+
+class YamlModule(types.ModuleType):
+    """Constructs a document upon the first access to its name."""
+
+    def __getattr__(self, name):
+        lazy_docs = self.__dict__.get('_lazy_docs')
+        if lazy_docs and name in lazy_docs:
+            self.__loader__._load_document(self, *lazy_docs.pop(name))
+            if name in self.__dict__:
+                return self.__dict__[name]
+
+        raise AttributeError("'{cls.__name__}' object has no attribute "
+                             "'{name}'".format(cls=type(self), **locals()))
@@ -57,6 +57,17 @@ Sub-modules of the `mybuild.req` package:
     * `mybuild.req.solver`: The algorithm itself; given a pgraph finds a
       solution, i.e. assigns a boolean value for every its node.
 
+    * `mybuild.req.frozen`: Compact picklable snapshots of pgraphs.
+
+    * `mybuild.req.components`: Splits a pgraph into independent connected
+      components to solve them separately (optionally in parallel).
+
+    * `mybuild.req.cache`: Persistent on-disk cache of solved components.
+
+    * `mybuild.req.session`: Incremental what-if solving under assumptions.
+
+    * `mybuild.req.models`: Enumerates and counts distinct solutions.
+
     * `mybuild.req.rgraph`: Extracts the shortest path in a reasoning graph
       that leads to a conflict and formats an error message for the user.
 """
@@ -0,0 +1,150 @@
+"""
+Persistent cache of solutions of pgraph components.
+
+Components are addressed by a digest of their descriptions (see
+mybuild.req.components.describe()), so a component shared by different
+configurations is solved once, provided that its nodes are ordered by a key
+which is stable across runs, like the one of mybuild.core.context.node_label.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import tempfile
+
+
+__all__ = [
+    "ComponentCache",
+]
+
+
+class ComponentCache(object):
+    """
+    A size-bounded directory of solved components, which is used as a
+    mapping from descriptions to solutions by solve_components().
+
+    Each entry is a file named by a digest of a description, and holds the
+    description itself along with the solution, so that digest collisions
+    can't lead to a wrong solution. The least recently used entries are
+    evicted once the total size of entries exceeds max_size bytes; recency
+    is kept in modification times of entry files, so it is shared across
+    runs.
+    """
+
+    VERSION = 1
+
+    SUFFIX = '.solution'
+
+    def __init__(self, path, max_size=64 << 20):
+        super(ComponentCache, self).__init__()
+        self.path = path
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        entries = []
+        for filename in os.listdir(path):
+            if not filename.endswith(self.SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(path, filename))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, filename[:-len(self.SUFFIX)],
+                            st.st_size))
+
+        self._entries = OrderedDict()  # {digest: size}, oldest first
+        for mtime, digest, size in sorted(entries):
+            self._entries[digest] = size
+        self._size = sum(itervalues(self._entries))
+
+    def digest(self, description):
+        data = '{0}:{1!r}'.format(self.VERSION, description)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def _filename(self, digest):
+        return os.path.join(self.path, digest + self.SUFFIX)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, description):
+        return self.get(description) is not None
+
+    def __getitem__(self, description):
+        ret = self.get(description)
+        if ret is None:
+            raise KeyError(description)
+        return ret
+
+    def get(self, description, default=None):
+        digest = self.digest(description)
+        if digest not in self._entries:
+            self.misses += 1
+            return default
+
+        filename = self._filename(digest)
+        try:
+            with open(filename, 'rb') as f:
+                stored_description, values = pickle.load(f)
+            os.utime(filename, None)
+        except Exception:  # removed or broken, just forget it
+            self._discard(digest)
+            stored_description = None
+
+        if stored_description != description:
+            self.misses += 1
+            return default
+
+        self._entries[digest] = self._entries.pop(digest)  # most recent
+        self.hits += 1
+        return values
+
+    def __setitem__(self, description, values):
+        digest = self.digest(description)
+
+        fd, tmp_filename = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((description, values), f,
+                            pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp_filename)
+            os.rename(tmp_filename, self._filename(digest))
+        except:
+            os.remove(tmp_filename)
+            raise
+
+        self._discard(digest)
+        self._entries[digest] = size
+        self._size += size
+
+        self._evict()
+
+    def _discard(self, digest):
+        size = self._entries.pop(digest, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self):
+        while self._size > self.max_size and len(self._entries) > 1:
+            digest = next(iter(self._entries))
+            self._discard(digest)
+            try:
+                os.remove(self._filename(digest))
+            except OSError:
+                pass
+
+    def clear(self):
+        for digest in list(self._entries):
+            self._discard(digest)
+            try:
+                os.remove(self._filename(digest))
+            except OSError:
+                pass
@@ -0,0 +1,292 @@
+"""
+Decomposition of a pgraph into connected components solved independently.
+
+Nodes of different components share neither implications nor neglasts
+(constant nodes aside, which are resolved upfront anyway), so a solution of
+the whole pgraph is merely a union of solutions of its components.
+
+A component is solved on its replica: a plain pgraph of anonymous atoms
+reproducing the implications, neglasts and levels of the original literals.
+A replica is built from a description, which is a nested tuple of integers,
+so that it can be solved in another process and serve as a cache key.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import multiprocessing
+
+from mybuild import util
+from mybuild.req.pgraph import (Atom, ConstNode, FalseConst, Neglast,
+                                Pgraph, TrueConst, to_lset)
+from mybuild.req.solver import solve, solve_trunk
+from mybuild.util.misc import bools
+
+
+__all__ = [
+    "Component",
+    "connected_components",
+    "describe",
+    "replicate",
+    "solve_components",
+]
+
+
+logger = util.get_extended_logger(__name__)
+
+
+class Component(object):
+    """Connected nodes of a pgraph, along with constant nodes."""
+
+    def __init__(self, pgraph, nodes):
+        super(Component, self).__init__()
+        self.pgraph = pgraph
+        self.nodes = set(nodes)
+        self.nodes.update(literal.node for literal in pgraph.const_literals)
+
+    def __repr__(self):
+        return ('<{cls.__name__}: {nr_nodes} node(s)>'
+                .format(cls=type(self), nr_nodes=len(self.nodes)))
+
+
+class _DisjointSets(object):
+    """Union-find over hashable items."""
+
+    def __init__(self):
+        super(_DisjointSets, self).__init__()
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] is not item:
+            parent[item] = parent[parent[item]]  # path halving
+            item = parent[item]
+        return item
+
+    def union(self, item, other):
+        root, other_root = self.find(item), self.find(other)
+        if root is other_root:
+            return
+        if self.size[root] < self.size[other_root]:
+            root, other_root = other_root, root
+        self.parent[other_root] = root
+        self.size[root] += self.size.pop(other_root)
+
+
+def connected_components(pgraph):
+    """Splits nodes of a pgraph into components by implications and
+    neglasts of their literals.
+
+    Returns:
+        A list of Component objects.
+    """
+    const_nodes = set(literal.node for literal in pgraph.const_literals)
+
+    sets = _DisjointSets()
+    for node in pgraph.nodes:
+        if node in const_nodes:
+            continue
+        sets.add(node)
+
+        for literal in node:
+            for implied in literal.implies:
+                if implied.node not in const_nodes:
+                    sets.add(implied.node)
+                    sets.union(node, implied.node)
+
+            for neglast in literal.neglasts:
+                for other in neglast.literals:
+                    if other.node not in const_nodes:
+                        sets.add(other.node)
+                        sets.union(node, other.node)
+
+    components = {}  # {root: [node]}
+    for node in sets.parent:
+        components.setdefault(sets.find(node), []).append(node)
+
+    return [Component(pgraph, nodes) for nodes in itervalues(components)]
+
+
+def describe(component, initial_literals=(), key=None):
+    """Makes a description of a component and initial literals within it.
+
+    Constant nodes always come first (False, then True), and the rest of
+    nodes are ordered using the key function, if any. Descriptions of
+    components ordered by the same stable key (like names of modules and
+    options) are equal for equally shaped components.
+
+    Returns:
+        A (description, nodes) tuple, where the nodes list maps indices of
+        the description back to nodes.
+    """
+    const_nodes = [component.pgraph.new_node(const_type)
+                   for const_type in ConstNode.types]
+    other_nodes = [node for node in component.nodes
+                   if not isinstance(node, ConstNode)]
+    if key is not None:
+        other_nodes.sort(key=key)
+
+    nodes = const_nodes + other_nodes
+    index = dict((node, i) for i, node in enumerate(nodes))
+
+    def literal_index(literal):
+        return index[literal.node], literal.value
+
+    neglasts = set()
+    literals = []
+    for node in nodes:
+        for literal in node:
+            neglasts.update(literal.neglasts)
+            literals.append((literal.level,
+                             tuple(sorted(literal_index(implied)
+                                          for implied in literal.implies
+                                          if implied.node in index))))
+
+    neglasts = sorted((literal_index(neglast.default),
+                       tuple(sorted(map(literal_index, neglast.literals))))
+                      for neglast in neglasts)
+
+    initial = sorted(literal_index(literal) for literal in initial_literals
+                     if literal.node in index)
+
+    return (tuple(literals), tuple(neglasts), tuple(initial)), nodes
+
+
+class ReplicaPgraph(Pgraph):
+    pass
+
+
+@ReplicaPgraph.node_type
+class ReplicaAtom(Atom):
+    """Anonymous atom distinguished by an index."""
+    __slots__ = ()
+
+    def __init__(self, index):
+        super(ReplicaAtom, self).__init__()
+
+
+def replicate(description):
+    """Builds a replica of a described component.
+
+    Returns:
+        A (pgraph, nodes, initial_literals) tuple, where the nodes list
+        is indexed just like the one returned by describe().
+    """
+    literal_data, neglast_data, initial = description
+
+    g = ReplicaPgraph()
+    nodes = [g.new_node(FalseConst), g.new_node(TrueConst)]
+    nodes += [g.new_node(ReplicaAtom, i)
+              for i in range(len(nodes), len(literal_data) // 2)]
+
+    literal_at = lambda pair: nodes[pair[0]][pair[1]]
+
+    for i, (level, implies) in enumerate(literal_data):
+        literal = nodes[i // 2][bools[i % 2]]
+        literal.level = level
+        literal.implies.update(map(literal_at, implies))
+
+    for default, literals in neglast_data:
+        neglast = Neglast(literal_at(default), (literal_at(each)
+                                                for each in literals
+                                                if each != default), None)
+        for literal in neglast.literals:
+            literal.neglasts.add(neglast)
+
+    return g, nodes, list(map(literal_at, initial))
+
+
+def solve_description(description):
+    """Solves a replica of a described component.
+
+    Returns:
+        A tuple of values of described nodes (None for unresolved ones),
+        or None if the solver fails, leaving it up to solve() to report
+        the failure in terms of the original pgraph.
+    """
+    g, nodes, initial_literals = replicate(description)
+
+    try:
+        trunk = solve_trunk(g, initial_literals)
+    except Exception:
+        return None
+
+    values = dict(trunk.literals)
+    return tuple(values.get(node) for node in nodes)
+
+
+def _solve_batch(descriptions):
+    return list(map(solve_description, descriptions))
+
+
+@logger.wrap
+def solve_components(pgraph, initial_values={}, processes=None, cache=None,
+                     key=None):
+    """Solves a pgraph component-wise, see solve().
+
+    Args:
+        processes (int): number of worker processes to solve components in,
+            by default components are solved in this one.
+        cache: a mapping to look up and store solutions of components,
+            which is keyed by descriptions (see describe()), e.g.
+            mybuild.req.cache.ComponentCache.
+        key: a function to order nodes of components by.
+
+    Raises:
+        SolveError: exactly as solve() does (the whole pgraph is solved
+            in case of a failure to get a proper error).
+    """
+    initial_literals = to_lset(initial_values)
+    components = connected_components(pgraph)
+    logger.info('solving %d component(s) of %r', len(components), pgraph)
+
+    jobs = []  # [(description, nodes)]
+    for component in components:
+        jobs.append(describe(component, initial_literals, key))
+
+    results = [None] * len(jobs)
+    todo = []  # indices into jobs
+    for i, (description, nodes) in enumerate(jobs):
+        if cache is not None:
+            results[i] = cache.get(description)
+        if results[i] is None:
+            todo.append(i)
+
+    if processes is None or processes <= 1 or len(todo) <= 1:
+        solved = _solve_batch(jobs[i][0] for i in todo)
+    else:
+        # Hand out large components first for better load balancing.
+        todo.sort(key=lambda i: -len(jobs[i][1]))
+        batches = [todo[n::processes] for n in range(processes)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            batch_results = pool.map(_solve_batch,
+                                     [[jobs[i][0] for i in batch]
+                                      for batch in batches])
+        finally:
+            pool.terminate()
+            pool.join()
+
+        todo = [i for batch in batches for i in batch]
+        solved = [values for batch_values in batch_results
+                  for values in batch_values]
+
+    for i, values in zip(todo, solved):
+        if values is None:
+            logger.info('component %r has no solution', components[i])
+            return solve(pgraph, initial_values)
+        results[i] = values
+        if cache is not None:
+            cache[jobs[i][0]] = values
+
+    ret = dict.fromkeys(pgraph.nodes)
+    for (description, nodes), values in zip(jobs, results):
+        ret.update(pair for pair in zip(nodes, values)
+                   if pair[1] is not None)
+
+    return ret
@@ -0,0 +1,173 @@
+"""
+Compact immutable snapshots of pgraphs.
+
+A frozen pgraph refers to literals by integer ids: a literal of a node with
+id N (see Pgraph.node_id()) gets id 2*N for False and 2*N+1 for True. Since
+operands are created before nodes built upon them, ids of operands precede
+ids of such nodes. Implications and neglasts are kept in flat arrays in CSR
+layout, that is, members of an i-th entry are at [start[i]:start[i+1]].
+
+Snapshots are picklable (sans back-mapping to the original nodes), so they
+can be solved in another process or stored. A snapshot is solved on its
+replica, just like a component of a pgraph (see mybuild.req.components).
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+from array import array
+
+from mybuild.req.components import ReplicaAtom, ReplicaPgraph
+from mybuild.req.pgraph import ConstNode, FalseConst, Neglast, TrueConst
+from mybuild.req.solver import solve_trunk
+
+
+__all__ = [
+    "FrozenPgraph",
+    "freeze",
+    "thaw",
+    "solve_frozen",
+]
+
+
+class FrozenPgraph(object):
+    """
+    Attributes:
+        nodes: the original nodes by ids, None once unpickled.
+        levels: levels of literals by ids.
+        implies_start, implies: implications of literals by ids.
+        neglast_defaults: a default literal id of each neglast.
+        neglast_start, neglast_literals: literal ids of each neglast.
+    """
+
+    nr_nodes = property(lambda self: len(self.levels) // 2)
+    nr_neglasts = property(lambda self: len(self.neglast_defaults))
+
+    def __init__(self, nodes, levels, implies_start, implies,
+                 neglast_defaults, neglast_start, neglast_literals):
+        super(FrozenPgraph, self).__init__()
+        self.nodes = nodes
+        self.levels = levels
+        self.implies_start = implies_start
+        self.implies = implies
+        self.neglast_defaults = neglast_defaults
+        self.neglast_start = neglast_start
+        self.neglast_literals = neglast_literals
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['nodes'] = None
+        return state
+
+    def implied_by(self, literal_id):
+        start, end = self.implies_start[literal_id:literal_id+2]
+        return self.implies[start:end]
+
+    def neglast_members(self, neglast_id):
+        start, end = self.neglast_start[neglast_id:neglast_id+2]
+        return self.neglast_literals[start:end]
+
+    def literal_id(self, literal):
+        node, value = literal
+        return 2 * node.pgraph.node_id(node) + value
+
+    def to_solution(self, values):
+        """Maps values by node ids back to the original nodes."""
+        return dict(zip(self.nodes, values))
+
+    def __repr__(self):
+        return ('<{cls.__name__}: {self.nr_nodes} node(s), '
+                '{self.nr_neglasts} neglast(s)>'
+                .format(cls=type(self), self=self))
+
+
+def _csr(rows):
+    start = array('l', [0])
+    items = array('l')
+    for row in rows:
+        items.extend(row)
+        start.append(len(items))
+    return start, items
+
+
+def freeze(pgraph):
+    """Makes a snapshot of all nodes created so far in a pgraph."""
+    nodes = tuple(pgraph.nodes)
+    assert all(isinstance(node, const_type) for node, const_type
+               in zip(nodes, ConstNode.types)), "consts are created first"
+
+    def literal_id(literal):
+        return 2 * pgraph.node_id(literal.node) + literal.value
+
+    levels = []
+    implies = []
+    neglasts = {}  # {neglast: id}, to keep them in order of appearance
+
+    for node in nodes:
+        for literal in node:
+            levels.append(literal.level)
+            implies.append(sorted(map(literal_id, literal.implies)))
+            for neglast in literal.neglasts:
+                neglasts.setdefault(neglast, len(neglasts))
+
+    neglasts = sorted(neglasts, key=neglasts.get)
+
+    implies_start, implies = _csr(implies)
+    neglast_start, neglast_literals = _csr(sorted(map(literal_id,
+                                                      neglast.literals))
+                                           for neglast in neglasts)
+    neglast_defaults = array('l', (literal_id(neglast.default)
+                                   for neglast in neglasts))
+
+    return FrozenPgraph(nodes, tuple(levels), implies_start, implies,
+                        neglast_defaults, neglast_start, neglast_literals)
+
+
+def thaw(frozen):
+    """Builds a replica of a frozen pgraph.
+
+    Returns:
+        A (pgraph, nodes) tuple, where the nodes list is indexed by ids.
+    """
+    g = ReplicaPgraph()
+    nodes = [g.new_node(FalseConst), g.new_node(TrueConst)]
+    nodes += [g.new_node(ReplicaAtom, i)
+              for i in range(len(nodes), frozen.nr_nodes)]
+
+    literal_at = lambda literal_id: nodes[literal_id // 2][literal_id % 2]
+
+    for literal_id, level in enumerate(frozen.levels):
+        literal = literal_at(literal_id)
+        literal.level = level
+        literal.implies.update(map(literal_at,
+                                   frozen.implied_by(literal_id)))
+
+    for neglast_id, default in enumerate(frozen.neglast_defaults):
+        neglast = Neglast(literal_at(default),
+                          (literal_at(each)
+                           for each in frozen.neglast_members(neglast_id)
+                           if each != default), None)
+        for literal in neglast.literals:
+            literal.neglasts.add(neglast)
+
+    return g, nodes
+
+
+def solve_frozen(frozen, initial_ids=()):
+    """Solves a replica of a frozen pgraph, see solve().
+
+    Args:
+        initial_ids: ids of initial literals.
+
+    Returns:
+        A tuple of values by node ids (None for unresolved nodes).
+
+    Raises:
+        SolveError: in terms of the replica.
+    """
+    g, nodes = thaw(frozen)
+
+    trunk = solve_trunk(g, [nodes[literal_id // 2][literal_id % 2]
+                            for literal_id in initial_ids])
+
+    values = dict(trunk.literals)
+    return tuple(values.get(node) for node in nodes)
@@ -0,0 +1,306 @@
+"""
+Enumeration and counting of pgraph solutions.
+
+Solutions are told apart by values of a chosen set of atoms (e.g. only
+module atoms), that is, two solutions differing only in other nodes count
+as one. The search branches on the chosen atoms one by one, resolving each
+decision on a fork of the trunk (see Trunk.fork()), and lets the solver
+decide the rest of nodes once all the chosen atoms are decided. The solver
+is greedy though, so in case it fails, the rest of atoms are decided in the
+same way to tell whether there is a solution. Decisions split the search
+space into disjoint parts, so no solution is found twice.
+
+Counting multiplies counts of connected components of a pgraph (see
+mybuild.req.components), and each component is counted on its replica, so
+that counts of equally described components can be cached.
+
+Minimization is a branch and bound search over atoms having a cost, which
+starts from the solution of solve() and cuts off branches which can't be
+cheaper than the best solution found so far.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import time
+
+from mybuild import util
+from mybuild.req.components import connected_components, describe, replicate
+from mybuild.req.pgraph import to_lset
+from mybuild.req.solver import (level_key, prepare_trunk, resolve_branches,
+                                stepwise_resolve, solve, why_assumed,
+                                SolveError)
+from mybuild.util.operator import getter
+
+
+__all__ = [
+    "iter_solutions",
+    "count_solutions",
+    "minimize",
+]
+
+
+logger = util.get_extended_logger(__name__)
+
+
+class _Search(object):
+    """
+    Depth-first search over values of atoms, which yields solved trunks.
+
+    The complete attribute tells whether the search space has been
+    exhausted, as opposed to being interrupted by the deadline.
+    """
+
+    def __init__(self, pgraph, initial_literals, atoms, deadline=None,
+                 random=None, literal_key=level_key, prune=None):
+        super(_Search, self).__init__()
+        self.pgraph = pgraph
+        self.initial_literals = initial_literals
+        self.atoms = atoms
+        self.deadline = deadline
+        self.random = random
+        # By default, more preferred literals go first, so that the first
+        # solution found tends to be the one solve() would give.
+        self.literal_key = literal_key
+        self.prune = prune  # a predicate telling trunks not to go into
+
+        self.complete = False
+        self.interrupted = False
+
+    def __iter__(self):
+        try:
+            trunk = prepare_trunk(self.pgraph, self.initial_literals)
+        except SolveError:
+            self.complete = True
+            return
+
+        for leaf in self._leaves(trunk, self.atoms, self.literal_key,
+                                 self.random, self.prune):
+            solved = self._complete(leaf)
+            if solved is not None:
+                yield solved
+            if self.interrupted:
+                return
+
+        self.complete = not self.interrupted
+
+    def _leaves(self, trunk, atoms, literal_key, random=None, prune=None):
+        """Yields forks of the trunk with all the given atoms decided."""
+        stack = [(trunk, 0, None)]  # (trunk, atom index, literal to assume)
+
+        while stack:
+            if self.deadline is not None and time.time() > self.deadline:
+                logger.info('search interrupted by the deadline')
+                self.interrupted = True
+                return
+
+            trunk, i, literal = stack.pop()
+
+            if literal is not None:
+                trunk = trunk.fork()
+                try:
+                    resolve_branches(trunk, [trunk.branchmap[literal]],
+                                     why=why_assumed)
+                except SolveError:
+                    continue
+
+                if prune is not None and prune(trunk):
+                    continue
+
+            while i < len(atoms) and atoms[i] in trunk.nodes:
+                i += 1
+
+            if i < len(atoms):
+                literals = sorted(atoms[i], key=literal_key)
+                if random is not None:
+                    random.shuffle(literals)
+                stack.extend((trunk, i+1, literal)
+                             for literal in reversed(literals))
+                continue
+
+            yield trunk
+
+    def _complete(self, leaf):
+        """Decides the rest of nodes, returns None if it is impossible."""
+        trunk = leaf.fork()
+        try:
+            stepwise_resolve(trunk)
+        except SolveError:
+            pass
+        else:
+            return trunk
+
+        # stepwise_resolve() is greedy and may fail even if there is a
+        # solution, make sure there is none by deciding the rest of atoms.
+        # Once all atoms are decided, so are the nodes built upon them.
+        rest = [atom for atom in self.pgraph.atoms
+                if atom not in leaf.nodes]
+        for trunk in self._leaves(leaf, rest, level_key):
+            trunk = trunk.fork()
+            try:
+                stepwise_resolve(trunk)
+            except SolveError:
+                continue
+            return trunk
+
+        return None
+
+
+def _solution(pgraph, trunk):
+    ret = dict.fromkeys(pgraph.nodes)
+    ret.update(trunk.literals)
+    return ret
+
+
+def _deadline(timeout):
+    return time.time() + timeout if timeout is not None else None
+
+
+@logger.wrap
+def iter_solutions(pgraph, initial_values={}, atoms=None, limit=None,
+                   timeout=None, random=None):
+    """Yields solutions differing in values of the given atoms.
+
+    Args:
+        atoms: nodes to tell solutions apart by, all atoms by default.
+        limit (int): maximum number of solutions to yield.
+        timeout (float): time budget in seconds, the iteration stops once
+            it is exceeded.
+        random: a random.Random instance to shuffle values of atoms with,
+            in order to sample solutions, by default preferred values
+            (according to levels of literals) are tried first.
+
+    Yields:
+        Solutions in the same form as solve() returns.
+    """
+    if atoms is None:
+        atoms = pgraph.atoms
+    search = _Search(pgraph, to_lset(initial_values), list(atoms),
+                     _deadline(timeout), random)
+
+    for nr_solutions, trunk in enumerate(search, 1):
+        yield _solution(pgraph, trunk)
+
+        if limit is not None and nr_solutions >= limit:
+            break
+
+
+@logger.wrap
+def count_solutions(pgraph, initial_values={}, atoms=None, limit=None,
+                    timeout=None, cache=None, key=None):
+    """Counts solutions differing in values of the given atoms.
+
+    Args:
+        atoms, limit, timeout: see iter_solutions().
+        cache: a mapping to look up and store counts of components in,
+            keyed by descriptions of components along with the chosen
+            atoms. Only exact counts are stored.
+        key: a function to order nodes of components by, see describe().
+
+    Returns:
+        A (count, exact) tuple. Once either the limit is reached or the time
+        is out, the exact flag is cleared, and the count is a lower bound.
+    """
+    atoms = set(pgraph.atoms if atoms is None else atoms)
+    initial_literals = to_lset(initial_values)
+    deadline = _deadline(timeout)
+
+    components = connected_components(pgraph)
+    logger.info('counting solutions of %d component(s)', len(components))
+
+    if not components:
+        try:
+            prepare_trunk(pgraph, initial_literals)
+        except SolveError:
+            return 0, True
+        return 1, True
+
+    count, exact = 1, True
+    for component in components:
+        description, nodes = describe(component, initial_literals, key)
+        chosen = tuple(i for i, node in enumerate(nodes) if node in atoms)
+
+        nr_solutions = None
+        if cache is not None:
+            nr_solutions = cache.get((description, chosen))
+
+        if nr_solutions is None:
+            g, replica_nodes, replica_initial = replicate(description)
+            search = _Search(g, replica_initial,
+                             [replica_nodes[i] for i in chosen], deadline)
+
+            nr_solutions = 0
+            for _ in search:
+                nr_solutions += 1
+                if limit is not None and nr_solutions >= limit:
+                    break
+
+            if search.complete:
+                if cache is not None:
+                    cache[description, chosen] = nr_solutions
+            else:
+                exact = False
+
+        if not nr_solutions:
+            return 0, exact
+
+        count *= nr_solutions
+
+    if limit is not None and count > limit:
+        count, exact = limit, False
+
+    return count, exact
+
+
+@logger.wrap
+def minimize(pgraph, initial_values={}, costs={}, timeout=None):
+    """Finds a solution with the least total cost of nodes taking True.
+
+    Args:
+        costs: a {node: cost} mapping, costs must be non-negative, e.g.
+            all ones to minimize the number of modules.
+        timeout (float): time budget in seconds, the best solution found
+            so far is returned once it is exceeded.
+
+    Returns:
+        A (solution, cost, optimal) tuple, where the solution is in the same
+        form as solve() returns, and the optimal flag tells whether the
+        search has been completed in time.
+
+    Raises:
+        SolveError: if no solution is found, as raised by solve().
+    """
+    def total_cost(literals):
+        return sum(costs[node] for node, value in literals
+                   if value and node in costs)
+
+    # Unlike the search, solve() resolves all literals of the same level at
+    # once, and it may fail even if there is a solution.
+    best_solution, best, error = None, [None], None
+    try:
+        best_solution = solve(pgraph, initial_values)
+    except SolveError as e:
+        error = e
+    else:
+        best[0] = total_cost(iteritems(best_solution))
+        logger.info('initial cost: %r', best[0])
+
+    def prune(trunk):
+        return best[0] is not None and total_cost(trunk.literals) >= best[0]
+
+    # The most expensive ones go first to cut off more branches early.
+    atoms = sorted(costs, key=costs.get, reverse=True)
+    search = _Search(pgraph, to_lset(initial_values), atoms,
+                     _deadline(timeout), literal_key=getter.value,
+                     prune=prune)
+
+    for trunk in search:
+        cost = total_cost(trunk.literals)
+        if best[0] is None or cost < best[0]:
+            logger.info('found a solution costing %r', cost)
+            best_solution = _solution(pgraph, trunk)
+            best[0] = cost
+
+    if best_solution is None:
+        raise error
+
+    return best_solution, best[0], search.complete
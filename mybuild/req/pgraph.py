@@ -7,9 +7,8 @@ from mybuild._compat import *
 from collections import namedtuple
 from operator import attrgetter
 
-from mybuild.util.collections import is_mapping
+from mybuild.util.collections import Sequence, Set, is_mapping
 from mybuild.util.misc import Pair, bools
-from mybuild.util.operator import instanceof
 
 
 __author__ = "Eldar Abusalimov"
@@ -17,6 +16,7 @@ __date__ = "2012-11-29"
 
 __all__ = [
     "Pgraph",
+    "NodeView",
     "Node",
     "Literal",
     "Neglast",
@@ -78,22 +78,39 @@ class PgraphMeta(type):
 class Pgraph(extend(metaclass=PgraphMeta)):
     """docstring for Pgraph"""
 
-    nodes = property(lambda self: set(itervalues(self._node_map)))
+    @property
+    def nodes(self):
+        """A live view of all nodes, in order of creation."""
+        return NodeView(self, self._node_list)
 
     @property
     def atoms(self):
-        return [node for node in self.nodes if isinstance(node, Atom)]
+        return self.nodes_of(Atom)
 
     def __init__(self):
         super(Pgraph, self).__init__()
 
+        self._node_list = []  # all nodes, an index of a node is its id
+        self._node_ids = {}   # {node: id}
+        self._node_index = {} # {node type: [nodes of that type or subtype]}
+
+        # Each node type gets its own subclass bound to this pgraph, which
+        # also holds a cache of nodes of that type and lists of the index to
+        # put new nodes to.
         node_types = self._node_types = {}
         for node_type in type(self)._iter_all_node_types():
             bases = self._node_type_bases(node_type)
-            node_types[node_type] = type(node_type.__name__, bases,
-                                         dict(pgraph=self))
+            node_types[node_type] = bound_type = type(node_type.__name__,
+                    bases, dict(pgraph=self,
+                                _node_cache={},
+                                _node_kwargs_cache={}))
+
+            bound_type._node_index_lists = [
+                    self._node_index.setdefault(base, [])
+                    for base in bound_type.__mro__[1:]
+                    if issubclass(base, NodeBase)]
 
-        self._node_map = {}
+        self._operand_sets = {}  # hash-consed operands of OperandSetNodes
 
         self.const_literals = Pair._make(
                 self.new_node(ConstNode.types[const_value])[const_value]
@@ -119,6 +136,31 @@ class Pgraph(extend(metaclass=PgraphMeta)):
         else:
             return cls._new(*args, **kwargs)
 
+    def _add_node(self, node):
+        self._node_ids[node] = len(self._node_list)
+        self._node_list.append(node)
+        for nodes in type(node)._node_index_lists:
+            nodes.append(node)
+
+    def node_id(self, node):
+        """Returns an integer identifying a node within the pgraph, which is
+        the number of nodes created before it."""
+        return self._node_ids[node]
+
+    def nodes_of(self, node_type):
+        """A live view of nodes of the given type (including subtypes)."""
+        try:
+            nodes = self._node_index[node_type]
+        except KeyError:
+            nodes = ()  # there can't be such nodes
+        return NodeView(self, nodes, node_type)
+
+    def freeze(self):
+        """Makes a compact immutable snapshot of the pgraph, see
+        mybuild.req.frozen.FrozenPgraph."""
+        from mybuild.req.frozen import freeze
+        return freeze(self)
+
     def new_const(self, const_value, node=None, why=None):
         """
         Constrains a given node (if any) to the specified const_value.
@@ -134,6 +176,43 @@ class Pgraph(extend(metaclass=PgraphMeta)):
         return node
 
 
+class NodeView(Set, Sequence):
+    """
+    Read-only set of nodes of a pgraph, which reflects nodes created later.
+    Iterates nodes in order of creation, and can be indexed in that order as
+    well, like a list.
+    """
+    __slots__ = '_pgraph', '_nodes', '_node_type'
+
+    def __init__(self, pgraph, nodes, node_type=None):
+        super(NodeView, self).__init__()
+        self._pgraph = pgraph
+        self._nodes = nodes
+        self._node_type = node_type
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __getitem__(self, index):
+        return self._nodes[index]
+
+    def __contains__(self, node):
+        return (node in self._pgraph._node_ids and
+                (self._node_type is None or
+                 isinstance(node, self._node_type)))
+
+    def __repr__(self):
+        return '<{cls.__name__}: {nr_nodes} node(s)>'.format(
+                cls=type(self), nr_nodes=len(self))
+
+
 class NodeMeta(type):
     """
     Allows a Node to be instantiated as usual by passing a pgraph instance
@@ -157,24 +236,23 @@ class NodeBase(extend(metaclass=NodeMeta)):
     @classmethod
     def _new(cls, *args, **kwargs):
         try:
-            pgraph = cls.pgraph
+            cache = cls._node_cache
         except AttributeError:
             raise TypeError("Don't instantiate this class directly, "
                             "use pgraph.new_node(%s, ...) instead" %
                             cls.__name__)
-        else:
-            cache = pgraph._node_map
 
-        if kwargs.pop('cache_kwargs', False):
-            cache_kwargs = frozenset(iteritems(kwargs))
+        if kwargs and kwargs.pop('cache_kwargs', False):
+            cache = cls._node_kwargs_cache
+            cache_key = args, frozenset(iteritems(kwargs))
         else:
-            cache_kwargs = None
+            cache_key = args  # why_* keywords are not a part of the key
 
-        cache_key = cls, args, cache_kwargs
         try:
             ret = cache[cache_key]
         except KeyError:
             ret = cache[cache_key] = cls._factory_call(*args, **kwargs)
+            cls.pgraph._add_node(ret)
 
         return ret
 
@@ -187,14 +265,10 @@ class Node(NodeBase, Pair):
     __slots__ = ()
 
     def __new__(cls, *args, **kwargs):
-        new_node = super(Node, cls).__new__(cls,
-                                            false=Literal(), true=Literal())
-
-        for literal in new_node:
-            literal.node = new_node
+        false, true = Literal(), Literal()
+        new_node = tuple.__new__(cls, (false, true))
 
-        assert all(new_node[bool_value].value == bool_value
-                   for bool_value in bools)
+        false.node = true.node = new_node
 
         return new_node
 
@@ -220,7 +294,7 @@ class Literal(object):
     Literal object is tightly related to its node. Do not construct it
     manually.
     """
-    __slots__ = 'node', 'level', 'implies', 'imply_reasons', 'neglasts'
+    __slots__ = 'node', 'level', 'implies', 'imply_whys', 'neglasts'
 
     pgraph = property(attrgetter('node.pgraph'))
     value  = property(lambda self: self is self.node[True])
@@ -231,9 +305,34 @@ class Literal(object):
 
         self.level = None
 
-        self.implies       = set()  # what to include among with this one
-        self.imply_reasons = set()  # precreated reason objects
-        self.neglasts      = set()  # from where to exclude
+        self.implies    = set()   # what to include among with this one
+        self.imply_whys = dict()  # {implied literal: why or _Whys}
+        self.neglasts   = set()   # from where to exclude
+
+    @property
+    def imply_reasons(self):
+        """Reasons of implications of this literal. These are only needed to
+        explain a solution (or a failure), and are created on demand."""
+        ret = set()
+        for then, why in iteritems(self.imply_whys):
+            if isinstance(why, _Whys):
+                ret.update(Reason(then, (self,), each) for each in why)
+            else:
+                ret.add(Reason(then, (self,), why))
+        return ret
+
+    def has_imply_reason(self, reason):
+        """Same as 'reason in self.imply_reasons', but cheaper."""
+        if reason.cause_literals != (self,):
+            return False
+        try:
+            why = self.imply_whys[reason.literal]
+        except KeyError:
+            return False
+
+        whys = why if isinstance(why, _Whys) else (why,)
+        return any(Reason(reason.literal, (self,), each) == reason
+                   for each in whys)
 
     def __invert__(self):
         """Returns the opposite literal."""
@@ -250,7 +349,14 @@ class Literal(object):
     @staticmethod
     def __imply(if_, then, why=None):
         if_.implies.add(then)
-        if_.imply_reasons.add(Reason(then, [if_], why))
+
+        whys = if_.imply_whys
+        other_why = whys.setdefault(then, why)
+        if other_why is not why:  # rare: the same implication for another why
+            if isinstance(other_why, _Whys):
+                whys[then] = _Whys(other_why.union([why]))
+            else:
+                whys[then] = _Whys([other_why, why])
 
     def therefore(self, other, why=None):
         """Implication: self => other"""
@@ -326,6 +432,11 @@ class Literal(object):
         # return "%r=%r" % (self.node, self.value)
 
 
+class _Whys(frozenset):
+    """Multiple why functions of the same implication."""
+    __slots__ = ()
+
+
 class Neglast(object):
     """
     Neglast unites a set of literals, that can't coexist all together: at
@@ -472,6 +583,9 @@ class OperandSetNode(Node):
     @classmethod
     def _new(cls, operands, *args, **kwargs):
         operands = frozenset(operands)
+        # Equal operand sets become the same object, and lookups of nodes by
+        # them then succeed on an identity check.
+        operands = cls.pgraph._operand_sets.setdefault(operands, operands)
 
         if not operands:
             new = cls._new_no_operands(*args, **kwargs)
@@ -529,8 +643,10 @@ class LatticeOpNode(OperandSetNode):
     @classmethod
     def _new(cls, operands, *args, **kwargs):
         if cls._optimize_new:
-            identity_const_type = ConstNode.types[cls.identity]
-            operands = filternot(instanceof(identity_const_type), operands)
+            operands = frozenset(operands)
+            identity_const = cls.pgraph.const_literals[cls.identity].node
+            if identity_const in operands:
+                operands = operands - frozenset([identity_const])
 
         return super(LatticeOpNode, cls)._new(operands, *args, **kwargs)
 
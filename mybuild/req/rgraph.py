@@ -4,11 +4,12 @@ Graph for reasons of pgraph solution
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
-import heapq
 import logging
-from collections import deque
+from collections import defaultdict, deque
 
 from mybuild.req.pgraph import Reason
+from mybuild.req.solver import Solution
+from mybuild.util.heapq import IndexedHeap
 
 
 __author__ = "Vita Loginova"
@@ -41,7 +42,10 @@ class Rnode(object):
 class Container(object):
     @property
     def length(self):
-        return sum(member.length for member in self.members)
+        """Sum of lengths of all members (inf if any of them is inf)."""
+        if self._nr_inf_members:
+            return float("+inf")
+        return self._finite_length
 
     def __init__(self, literals, rgraph):
         super(Container, self).__init__()
@@ -52,6 +56,10 @@ class Container(object):
         self.members = set()
         self.therefore = {} # key = Rnode, value = Reason
 
+        # The length is maintained incrementally by member_length_changed.
+        self._finite_length = 0
+        self._nr_inf_members = 0
+
     def __repr__(self):
         return ("<{cls.__name__}: {literals}>"
                 .format(cls=type(self), literals=list(self.literals)))
@@ -59,8 +67,24 @@ class Container(object):
     def update(self):
         for literal in self.literals:
             member = self.rgraph.nodes[literal]
+            if member in self.members:
+                continue
             self.members.add(member)
             member.containers.add(self)
+            self.member_length_changed(0, member.length)
+
+    def member_length_changed(self, old_length, new_length):
+        inf = float("+inf")
+
+        if old_length == inf:
+            self._nr_inf_members -= 1
+        else:
+            self._finite_length -= old_length
+
+        if new_length == inf:
+            self._nr_inf_members += 1
+        else:
+            self._finite_length += new_length
 
 
 class Rgraph(object):
@@ -98,6 +122,24 @@ class Rgraph(object):
 
         self.find_shortest_paths()
 
+    def reasons_from(self, container):
+        """Returns a {Rnode: Reason} dict of consequences of a container."""
+        return container.therefore
+
+    def reasons_for(self, node):
+        """Returns a {Container: Reason} dict of causes of a node."""
+        return node.becauseof
+
+    def containers_of(self, node):
+        """Returns containers the node is a member of."""
+        return node.containers
+
+    def length_of(self, node):
+        return node.length
+
+    def parent_of(self, node):
+        return node.parent
+
     def initialize_nodes(self, reason):
         cause_literals = frozenset(reason.cause_literals)
         if cause_literals not in self.containers:
@@ -114,31 +156,34 @@ class Rgraph(object):
         Finds the shortest paths to each of the self.nodes using modified
         Dijkstra's algorithm. The length of path to node is computed as
         a sum of it's becauseof.
+
+        Container lengths are maintained incrementally as their members get
+        updated, and each container is kept in the queue at most once.
         Output:
             Rnode.length - length of the shortest path (inf if there is no one)
             Rnode.parent - cause container (self for initials and None for ones
                                             with infinite length)
         """
-        queue = []
+        inf = float("+inf")
+
+        queue = IndexedHeap()  # containers keyed by their lengths
         used = set()
 
         def update_and_post(node, parent):
             length = 0 if node == parent else parent.length + 1
+            old_length = node.length
             node.length = length
             node.parent = parent
             for container in node.containers:
-                heapq.heappush(queue, (container.length, container))
-
-        heapq.heapify(queue)
+                container.member_length_changed(old_length, length)
+                if container not in used and container.length < inf:
+                    queue.push(container, container.length)  # decrease-key
 
         for container in self.initial.therefore:
             update_and_post(container, container)
 
         while queue:
-            length, container = heapq.heappop(queue)
-
-            if container in used:
-                continue
+            container, length = queue.pop()
             used.add(container)
 
             for cons in container.therefore:
@@ -149,49 +194,356 @@ class Rgraph(object):
         for node in itervalues(self.nodes):
             logger.debug('{0}: length {1}'.format(node, node.length))
 
-    def make_bare_copy(self):
+
+class ShortRgraph(object):
+    """
+    Shortened view of an Rgraph.
+
+    Nodes and containers are shared with the parent rgraph, only the reasons
+    selected by shorten_rgraph are stored here. Use reasons_from/reasons_for
+    instead of Container.therefore/Rnode.becauseof to access them.
+    """
+
+    def __init__(self, rgraph):
+        super(ShortRgraph, self).__init__()
+
+        self.parent = rgraph
+
+        self.nodes = rgraph.nodes
+        self.containers = rgraph.containers
+        self.initial = rgraph.initial
+
+        self.violation_graphs = {}
+
+        self._therefore = defaultdict(dict) # {Container: {Rnode: Reason}}
+        self._becauseof = defaultdict(dict) # {Rnode: {Container: Reason}}
+
+    def reasons_from(self, container):
+        """Returns a {Rnode: Reason} dict of consequences of a container."""
+        return self._therefore.get(container, {})
+
+    def reasons_for(self, node):
+        """Returns a {Container: Reason} dict of causes of a node."""
+        return self._becauseof.get(node, {})
+
+    def containers_of(self, node):
+        return self.parent.containers_of(node)
+
+    def length_of(self, node):
+        return self.parent.length_of(node)
+
+    def parent_of(self, node):
+        return self.parent.parent_of(node)
+
+    def initialize_nodes(self, reason):
+        literal_node = self.nodes[reason.literal]
+        cause_container = self.containers[frozenset(reason.cause_literals)]
+
+        self._becauseof[literal_node][cause_container] = reason
+        self._therefore[cause_container][literal_node] = reason
+
+
+class LayeredRgraph(object):
+    """
+    Rgraph of a diff solution overlaid on top of an already built rgraph.
+
+    This is used to explain dead branches without flattening each of them
+    into a separate solution and building a new Rgraph from scratch. Nodes,
+    containers and reasons of the base rgraph are reused as is, the layer only
+    stores what the diff adds and masks out what must not be seen through it:
+
+      - a hidden solution: its nodes, literals and reasons, as well as any
+        reasons involving hidden literals (for example, everything committed
+        to the trunk after the branch has been refused),
+      - implications of closed_literals (that is, literals of other dead
+        branches, which have their own violation graphs).
+
+    Shortest paths are only recomputed for nodes affected by the layer. Use
+    the accessor methods (reasons_from, length_of, etc.) instead of reading
+    attributes of Rnode/Container objects directly.
+    """
+
+    def __init__(self, rgraph, solution, hidden=None, closed_literals=()):
+        super(LayeredRgraph, self).__init__()
+
+        self.base = rgraph
+
+        # Plain dicts of references, nodes and containers are not copied.
+        self.nodes = dict(rgraph.nodes)
+        self.containers = dict(rgraph.containers)
+        self.initial = rgraph.initial
+
+        self.violation_graphs = {}
+
+        self.solution = solution
+
+        self.hidden = Solution(hidden)
+        self.hidden -= solution  # the layer takes precedence
+
+        self.closed_literals = set(closed_literals)
+
+        self._therefore = defaultdict(dict) # {Container: {Rnode: Reason}}
+        self._becauseof = defaultdict(dict) # {Rnode: {Container: Reason}}
+        self._containers = defaultdict(set) # {Rnode: {Container}}
+
+        self._length = {}  # {Rnode: length} overriding ones of the base
+        self._parent = {}
+
+        for node in solution.nodes:
+            self._node_for(node[True])
+
+        for reason in solution.reasons:
+            self.initialize_nodes(reason)
+
+        for literal in solution.literals:
+            if literal in self.closed_literals:
+                continue
+            for reason in literal.imply_reasons:
+                self.initialize_nodes(reason)
+
+        self.find_shortest_paths()
+
+    def is_visible(self, reason):
+        """Tells whether a reason of the base is not masked out by this layer.
+        Reasons added by the layer itself are always visible."""
+        hidden = self.hidden.literals
+
+        if reason in self.hidden.reasons:
+            return False
+        if reason.literal in hidden:
+            return False
+        if any(literal in hidden for literal in reason.cause_literals):
+            return False
+
+        if len(reason.cause_literals) == 1:
+            cause, = reason.cause_literals
+            if (cause in self.closed_literals and
+                    cause.has_imply_reason(reason)):
+                return False
+
+        return True
+
+    def reasons_from(self, container):
+        """Returns a {Rnode: Reason} dict of consequences of a container."""
+        ret = dict((node, reason)
+                   for node, reason in iteritems(container.therefore)
+                   if self.is_visible(reason))
+        ret.update(self._therefore.get(container, ()))
+        return ret
+
+    def reasons_for(self, node):
+        """Returns a {Container: Reason} dict of causes of a node."""
+        ret = dict((container, reason)
+                   for container, reason in iteritems(node.becauseof)
+                   if self.is_visible(reason))
+        ret.update(self._becauseof.get(node, ()))
+        return ret
+
+    def containers_of(self, node):
+        """Returns containers the node is a member of."""
+        extra = self._containers.get(node)
+        return node.containers | extra if extra else node.containers
+
+    def length_of(self, node):
+        return self._length.get(node, node.length)
+
+    def parent_of(self, node):
+        return self._parent.get(node, node.parent)
+
+    def container_length(self, container):
+        return sum(map(self.length_of, container.members))
+
+    def violation_nodes(self, base_solution):
+        """Nodes taking both values when the layer is applied on top of the
+        given base solution, at least one of them coming from the layer."""
+        solution = self.solution
+        hidden = self.hidden
+
+        def is_visible_literal(literal):
+            return (literal in solution.literals or
+                    literal in base_solution.literals and
+                    literal not in hidden.literals)
+
+        def is_visible_node(node):
+            return (node in solution.nodes or
+                    node in base_solution.nodes and
+                    node not in hidden.nodes)
+
+        return set(literal.node for literal in solution.literals
+                   if is_visible_node(literal.node) and
+                      is_visible_literal(~literal))
+
+    def _node_for(self, literal):
+        try:
+            return self.nodes[literal]
+        except KeyError:
+            pass
+
+        for each in literal.node:
+            self.nodes[each] = Rnode(each, self)
+            self._container_for(frozenset([each]))
+
+        return self.nodes[literal]
+
+    def _container_for(self, literals):
+        try:
+            return self.containers[literals]
+        except KeyError:
+            pass
+
+        container = self.containers[literals] = Container(literals, self)
+        for literal in literals:
+            member = self._node_for(literal)
+            container.members.add(member)
+            self._containers[member].add(container)
+
+        return container
+
+    def initialize_nodes(self, reason):
+        if reason.literal is None:
+            return  # a marker of a dead branch, not an edge
+
+        literal_node = self._node_for(reason.literal)
+        cause_container = self._container_for(
+                frozenset(reason.cause_literals))
+
+        if (cause_container.therefore.get(literal_node) == reason and
+                self.is_visible(reason)):
+            return  # already in the base
+
+        self._becauseof[literal_node][cause_container] = reason
+        self._therefore[cause_container][literal_node] = reason
+
+    def find_shortest_paths(self):
         """
-        Returns rgraph with same nodes but without any reason
+        Updates the shortest paths of the base rgraph to account this layer.
+
+        Firstly, nodes which shortest paths pass through anything masked out
+        are invalidated, along with their subtrees. Then the invalidated nodes
+        and targets of reasons added by the layer are relaxed and the changes
+        are propagated further, like in Rgraph.find_shortest_paths.
         """
-        cls = type(self)
-        new = cls.__new__(cls)
+        inf = float("+inf")
 
-        new.nodes = {}
-        new.containers = {}
-        new.violation_graphs = {}
+        queue = IndexedHeap()  # containers keyed by their lengths
 
-        for literal, node in iteritems(self.nodes):
-            new.nodes[literal] = Rnode(literal, new)
+        dirty = set(self.nodes[literal] for literal in self.hidden.literals
+                    if literal in self.nodes)
 
-        for literals, container in iteritems(self.containers):
-            new.containers[literals] = Container(container.literals, new)
-            new.containers[literals].update()
+        for reason in self.hidden.reasons:
+            try:
+                node = self.nodes[reason.literal]
+            except KeyError:
+                continue
+            parent = node.parent
+            if parent is node:
+                parent = self.initial
+            if node.becauseof.get(parent) == reason:
+                dirty.add(node)
+
+        for literal in self.closed_literals:
+            try:
+                container = self.base.nodes[literal].container()
+            except KeyError:
+                continue
+            for cons, reason in iteritems(container.therefore):
+                if cons.parent is container and not self.is_visible(reason):
+                    dirty.add(cons)
 
-        new.initial = new.containers[frozenset()]
+        stack = list(dirty)
+        while stack:
+            node = stack.pop()
+            for container in node.containers:
+                for cons in container.therefore:
+                    if cons.parent is container and cons not in dirty:
+                        dirty.add(cons)
+                        stack.append(cons)
 
-        return new
+        logger.debug('{0}: {1} node(s) invalidated'.format(self, len(dirty)))
+
+        for node in dirty:
+            self._length[node] = inf
+            self._parent[node] = None
+
+        def relax(node, parent):
+            if parent is self.initial:
+                length, parent = 0, node
+            else:
+                length = self.container_length(parent) + 1
+
+            if not length < self.length_of(node):
+                return
+
+            self._length[node] = length
+            self._parent[node] = parent
+
+            for container in self.containers_of(node):
+                container_length = self.container_length(container)
+                if container_length < inf:
+                    queue.push(container, container_length)
+
+        for node in dirty:
+            for container in self.reasons_for(node):
+                relax(node, container)
+
+        for container, therefore in list(iteritems(self._therefore)):
+            for cons in therefore:
+                relax(cons, container)
+
+        while queue:
+            container, length = queue.pop()
+            for cons in self.reasons_from(container):
+                relax(cons, container)
 
 
 def shorten_rgraph(rgraph, rnodes):
     """
     Constructs rgraph containing the the most shortest paths to the rnodes
     passed as argument.
+
+    The result is a ShortRgraph view sharing nodes with the given rgraph, so
+    it only costs as much as the selected paths do.
     """
-    def set_path(rgraph_copy, container):
-        for member in container.members:
-            if member.length == 0:
-                rgraph_copy.initialize_nodes(member.becauseof[rgraph.initial])
-            else:
-                set_path(rgraph_copy, member.parent)
-                rgraph_copy.initialize_nodes(member.becauseof[member.parent])
+    short = ShortRgraph(rgraph)
+    visited = set()
+    stack = []  # [container, members iterator, member pending its reason]
+
+    def push(container):
+        visited.add(container)
+        stack.append([container, iter(container.members), None])
 
-    rgraph_copy = rgraph.make_bare_copy()
     for node in rnodes:
-        if node.length == float("+inf"):
+        if rgraph.length_of(node) == float("+inf"):
             raise Exception('No way to {0}'.format(node))
-        set_path(rgraph_copy, node.container())
 
-    return rgraph_copy
+        container = node.container()
+        if container in visited:
+            continue
+        push(container)
+
+        # Postorder DFS over the shortest path tree: reasons of a container
+        # members are added after the reasons of their own causes.
+        while stack:
+            entry = stack[-1]
+            pending = entry[2]
+            if pending is not None:
+                parent = rgraph.parent_of(pending)
+                short.initialize_nodes(rgraph.reasons_for(pending)[parent])
+                entry[2] = None
+
+            for member in entry[1]:
+                parent = rgraph.parent_of(member)
+                if rgraph.length_of(member) == 0:
+                    parent = rgraph.initial
+                elif parent not in visited:
+                    entry[2] = member
+                    push(parent)
+                    break
+                short.initialize_nodes(rgraph.reasons_for(member)[parent])
+            else:
+                stack.pop()
+
+    return short
 
 
 def shorten_error_rgraph(rgraph, violation_nodes):
@@ -200,7 +552,10 @@ def shorten_error_rgraph(rgraph, violation_nodes):
     nodes with smallest length.
     """
     def length(node):
-        return sum(rgraph.nodes[literal].length for literal in node)
+        return sum(rgraph.length_of(rgraph.nodes[literal]) for literal in node)
+
+    if not violation_nodes:
+        return shorten_rgraph(rgraph, ())
 
     min_length = length(min(violation_nodes, key = length))
 
@@ -211,25 +566,28 @@ def shorten_error_rgraph(rgraph, violation_nodes):
         rnodes.add(rgraph.nodes[node[False]])
         rnodes.add(rgraph.nodes[node[True]])
 
-    if rnodes:
-        return shorten_rgraph(rgraph, rnodes)
+    return shorten_rgraph(rgraph, rnodes)
 
-    return shorten_rgraph(rgraph, [rgraph.initial])
 
+def get_branch_rgraph(rgraph, trunk, branch):
+    """
+    Returns a LayeredRgraph of a dead branch on top of the trunk rgraph.
 
-def prepare_rgraph_branch(trunk, branch):
-    solution = branch.flatten()
+    The trunk is viewed as it was at the moment the branch had been refused,
+    i.e. anything committed since then is hidden.
+    """
+    solution = Solution(branch)
     # TODO move to solver
     for gen_literal in branch.gen_literals:
         solution.reasons.add(Reason(gen_literal))
 
-    for literal in solution.literals:
-        for reason in literal.imply_reasons[:]:
-            if (literal in trunk.dead_branches and
-                literal not in branch.gen_literals):
-                literal.imply_reasons.remove(reason)
+    hidden = Solution()
+    for diff in trunk.commits[branch.baserev:]:
+        hidden |= diff
+
+    closed_literals = set(trunk.dead_branches).difference(branch.gen_literals)
 
-    return solution
+    return LayeredRgraph(rgraph, solution, hidden, closed_literals)
 
 
 def get_violation_nodes(solution):
@@ -241,15 +599,14 @@ def get_violation_nodes(solution):
 
 
 def get_error_rgraph(solution, is_short=True):
-    def build_rgraph(branch):
-        rgraph = Rgraph(branch)
+    def shorten(rgraph, violation_nodes):
         if is_short:
-            violation_nodes = list(get_violation_nodes(branch))
-            rgraph = shorten_error_rgraph(rgraph, violation_nodes)
+            rgraph = shorten_error_rgraph(rgraph, list(violation_nodes))
         return rgraph
 
     trunk = solution.trunk
-    rgraph = build_rgraph(trunk)
+    trunk_rgraph = Rgraph(trunk)
+    rgraph = shorten(trunk_rgraph, get_violation_nodes(trunk))
 
     branchmap = {}
     for literal, branch in iteritems(trunk.dead_branches):
@@ -261,8 +618,9 @@ def get_error_rgraph(solution, is_short=True):
             rgraph.violation_graphs[literal] = rgraph_branch
             continue
 
-        branch_solution = prepare_rgraph_branch(trunk, branch)
-        rgraph_branch = build_rgraph(branch_solution)
+        branch_rgraph = get_branch_rgraph(trunk_rgraph, trunk, branch)
+        rgraph_branch = shorten(branch_rgraph,
+                                branch_rgraph.violation_nodes(trunk))
         rgraph_branch.violation_graphs = rgraph.violation_graphs
 
         branchmap[frozenset(branch.gen_literals)] = rgraph_branch
@@ -302,30 +660,11 @@ def traverse_error_rgraph(rgraph):
     Yields:
         (reason, shift) pairs
     """
-    node_deque = deque()
+    frontier = deque()  # (node, reason) pairs waiting for a new chain
+    frontier_nodes = set()
     visited_nodes = set()
     visited_containers = set()
-    reason_list = []
-
-    def dfs(node, reason):
-        is_visited = node in visited_nodes
-        container = node.container()
-
-        if not is_visited:
-            visited_nodes.add(node)
-            visited_containers.add(container)
-            reason_list.append(reason)
-
-        if is_visited or not container.therefore:
-            yield reason_list[:]
-            reason_list[:] = []
-            return
-
-        for cons, reason in iteritems(container.therefore):
-            for each in dfs(cons, reason):
-                yield each
-            for cons_container in cons.containers:
-                post_traversal(cons_container)
+    chain = []
 
     def post_traversal(container):
         if container in visited_containers:
@@ -333,18 +672,68 @@ def traverse_error_rgraph(rgraph):
 
         visited_containers.add(container)
 
-        for cons, reason in iteritems(container.therefore):
-            if cons not in node_deque and cons not in visited_nodes:
-                node_deque.appendleft((cons, reason))
+        for cons, reason in iteritems(rgraph.reasons_from(container)):
+            if cons not in frontier_nodes and cons not in visited_nodes:
+                frontier_nodes.add(cons)
+                frontier.appendleft((cons, reason))
+
+    def visit(node, reason):
+        """Returns an iterator over consequences of the node unless the
+        current chain ends on it."""
+        if node in visited_nodes:
+            return None
 
-    for node, reason in iteritems(rgraph.initial.therefore):
-        node_deque.append((node, reason))
+        container = node.container()
+        visited_nodes.add(node)
+        visited_containers.add(container)
+        chain.append(reason)
+
+        therefore = rgraph.reasons_from(container)
+        if not therefore:
+            return None
+
+        return iteritems(therefore)
+
+    def flush_chain():
+        for shift, reason in enumerate(reversed(chain)):
+            yield reason, shift
+        del chain[:]
+
+    for node, reason in iteritems(rgraph.reasons_from(rgraph.initial)):
+        frontier_nodes.add(node)
+        frontier.append((node, reason))
         post_traversal(node.container())
 
-    while node_deque:
-        node, reason = node_deque.pop()
-        for chain in dfs(node, reason):
-            shift = 0
-            while chain:
-                yield chain.pop(), shift
-                shift += 1
+    while frontier:
+        node, reason = frontier.pop()
+        frontier_nodes.discard(node)
+
+        # Explicit DFS stack of [consequences iterator, last visited node].
+        therefore = visit(node, reason)
+        stack = [[therefore, None]] if therefore is not None else []
+        if not stack:
+            for each in flush_chain():
+                yield each
+
+        while stack:
+            top = stack[-1]
+            therefore, last = top
+
+            if last is not None:
+                top[1] = None
+                for cons_container in rgraph.containers_of(last):
+                    post_traversal(cons_container)
+
+            for cons, reason in therefore:
+                break
+            else:
+                stack.pop()
+                continue
+
+            top[1] = cons
+            therefore = visit(cons, reason)
+            if therefore is not None:
+                stack.append([therefore, None])
+            else:
+                for each in flush_chain():
+                    yield each
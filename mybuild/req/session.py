@@ -0,0 +1,127 @@
+"""
+Incremental what-if solving of a pgraph under extra assumptions.
+
+A session prepares a trunk once: creates it, expands all branches and
+resolves the ones forced by dead branches. Assumptions are resolved on top of
+a fork of that trunk, and each assumption level keeps its own fork, so that
+retracting assumptions merely drops it.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+from mybuild import util
+from mybuild.req.pgraph import Reason, to_lset
+from mybuild.req.solver import (prepare_trunk, resolve_branches,
+                                stepwise_resolve, why_assumed, SolveError)
+
+
+__all__ = [
+    "Session",
+    "changes",
+]
+
+
+logger = util.get_extended_logger(__name__)
+
+
+def changes(old, new):
+    """Compares two solutions.
+
+    Returns:
+        A {node: (old_value, new_value)} dict of nodes whose values differ.
+    """
+    return dict((node, (old.get(node), value))
+                for node, value in iteritems(new)
+                if old.get(node) is not value)
+
+
+class Session(object):
+    """
+    Answers what-if queries about a pgraph.
+
+    Assumptions are stacked: each call to assume() adds literals to the ones
+    assumed so far, and retract() takes back the most recent ones.
+    """
+
+    @property
+    def depth(self):
+        """Number of assumptions which are not retracted yet."""
+        return len(self._levels) - 1
+
+    @property
+    def assumptions(self):
+        """A set of all assumed literals."""
+        return self._levels[-1][0]
+
+    @property
+    def solution(self):
+        """A solution under the current assumptions."""
+        return self._levels[-1][2]
+
+    def __init__(self, pgraph, initial_values={}):
+        super(Session, self).__init__()
+        self.pgraph = pgraph
+        self.initial_literals = to_lset(initial_values)
+
+        trunk = prepare_trunk(pgraph, self.initial_literals)
+
+        self.baseline = self._solve(trunk)
+        self._levels = [(frozenset(), trunk, self.baseline)]
+
+    def _solve(self, trunk):
+        trunk = trunk.fork()
+        stepwise_resolve(trunk)
+
+        ret = dict.fromkeys(self.pgraph.nodes)
+        ret.update(trunk.literals)
+        return ret
+
+    @logger.wrap
+    def assume(self, values):
+        """Adds assumptions on top of the current ones.
+
+        Args:
+            values: a mapping of nodes to values or an iterable of literals.
+
+        Returns:
+            A (solution, changes) tuple, where the changes are made against
+            the baseline solution (with no assumptions), see changes().
+
+        Raises:
+            SolveError: if the assumptions can't be satisfied, the session
+                stays as is then.
+        """
+        literals = to_lset(values)
+        assumptions = self.assumptions | literals
+        logger.info('assuming %d literal(s) at depth %d',
+                    len(literals), self.depth)
+
+        trunk = self._levels[-1][1].fork()
+
+        branches = set()
+        for literal in literals:
+            if literal in trunk.literals:
+                continue
+            if ~literal in trunk.literals:
+                # The assumption contradicts the ones made earlier (or the
+                # initial values), there is no branch to explain it with.
+                # Record the violation right in the fork, it is dropped
+                # anyway.
+                trunk.literals.add(literal)
+                trunk.reasons.add(Reason(literal, why=why_assumed))
+                raise SolveError(trunk)
+
+            branches.add(trunk.branchmap[literal])
+
+        resolve_branches(trunk, branches, why=why_assumed)
+
+        solution = self._solve(trunk)
+        self._levels.append((assumptions, trunk, solution))
+
+        return solution, changes(self.baseline, solution)
+
+    def retract(self):
+        """Takes back the most recent assumptions."""
+        if not self.depth:
+            raise ValueError('Nothing to retract')
+        self._levels.pop()
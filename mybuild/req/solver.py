@@ -4,6 +4,7 @@ Pgraph solver.
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import copy
 import logging
 import operator
 from collections import defaultdict
@@ -30,6 +31,8 @@ __all__ = [
     "expand_branchset",
     "resolve_branches",
     "stepwise_resolve",
+    "warm_resolve",
+    "prepare_trunk",
     "solve_trunk",
 
     "solve",
@@ -61,8 +64,9 @@ class Solution(object):
         self.nodes    = set()
         self.literals = set()
         self.reasons  = set()  # note that this set does NOT include reasons
-                               # from each literal's imply_reasons set, only
-                               # special (like for neglasts or assumptions).
+                               # of implications (see Literal.imply_reasons),
+                               # only special (like for neglasts or
+                               # assumptions).
 
         if initial is not None:
             self |= initial
@@ -131,6 +135,38 @@ class Trunk(Solution):
 
         self.commits = list()  # incremental diffs applied to the trunk
 
+    def fork(self):
+        """
+        Makes a copy of the trunk along with its branches, which can be
+        resolved further without affecting this one.
+
+        Nodes, literals and reasons are shared, as well as committed diffs,
+        so that forking is much cheaper than creating and expanding a trunk
+        from scratch.
+        """
+        ret = Trunk()
+        ret |= self
+
+        ret.neglefts = dict((neglast, set(negleft))
+                            for neglast, negleft in iteritems(self.neglefts))
+        ret.commits = list(self.commits)
+
+        forks = dict()  # {branch: fork}, substituted ones are mapped twice
+
+        def fork_branch(branch):
+            try:
+                return forks[branch]
+            except KeyError:
+                branch_fork = forks[branch] = branch.fork(ret)
+                return branch_fork
+
+        for attr in 'branchmap', 'dead_branches':
+            setattr(ret, attr, dict((literal, fork_branch(branch))
+                                    for literal, branch
+                                    in iteritems(getattr(self, attr))))
+
+        return ret
+
     def commit(self, diff):
         if self is not diff.trunk:
             raise ValueError('Diff must be created from this trunk')
@@ -234,6 +270,21 @@ class Diff(Solution):
         del self.negexcls
         super(Diff, self).dispose()
 
+    def fork(self, trunk):
+        """Copies the diff for a forked trunk, see Trunk.fork()."""
+        if not self.trunked:
+            return self  # disposed
+
+        ret = copy.copy(self)
+        Solution.__init__(ret, self)
+
+        ret.trunk = trunk
+        ret.todo = set(self.todo)
+        ret.negexcls = defaultdict(set, ((neglast, set(negexcl))
+                                         for neglast, negexcl
+                                         in iteritems(self.negexcls)))
+        return ret
+
     def flatten(self):
         if not self.ready:
             raise ValueError('not ready: {0}: {0.todo}'.format(self))
@@ -333,6 +384,12 @@ class Branch(Diff):
 
         self.todo |= gen_literal.implies
 
+    def fork(self, trunk):
+        ret = super(Branch, self).fork(trunk)
+        if ret is not self:
+            ret.gen_literals = set(self.gen_literals)
+        return ret
+
     def merge(self, other):
         if self.literals >= other.gen_literals:  # other is already in self
             assert self.nodes    >= other.nodes
@@ -542,15 +599,24 @@ def branchset_to_resolve(trunk):
     dead_literals = set()
     for branch in filternot(getter.valid, trunk.branchset()):
         dead_literals |= branch.gen_literals
+    # A branch substituted for an equivalent one may still be referred to by
+    # some of its gen literals, while the rest have already been refused.
+    dead_literals = set(literal for literal in dead_literals
+                        if ~literal in trunk.branchmap)
     return dead_literals, set(trunk.branchmap[~literal] for literal in dead_literals)
 
 
 @logger.wrap
-def resolve_branches(trunk, branches=None):
+def resolve_branches(trunk, branches=None, why=None):
     """
     Merges given branches back into trunk updating its branchmap and rest
     branches.
+
+    Gen literals of the given branches are explained using the why function,
+    which is why_default unless specified.
     """
+    if why is None:
+        why = why_default
 
     dead_literals = set()
     if branches is None:
@@ -571,7 +637,7 @@ def resolve_branches(trunk, branches=None):
                                                 why=why_implied_by_dead_branch,
                                                 follow=True))
                 else:
-                    resolved.reasons.add(Reason(gen_literal, why=why_default,
+                    resolved.reasons.add(Reason(gen_literal, why=why,
                                                 follow=False))
 
             resolved.merge(branch)
@@ -613,20 +679,90 @@ def stepwise_resolve(trunk):
         resolve_branches(trunk, branchset & trunk.branchset())
 
 
-def solve_trunk(pgraph, initial_values={}):
+def level_key(literal):
+    """Orders literals by levels, more preferred ones first, the ones with no
+    level last."""
+    return literal.level is None, literal.level
+
+
+@logger.wrap
+def warm_resolve(trunk, hints):
+    """
+    Resolves branches of hinted literals given as a {node: value} mapping
+    (e.g. a previous solution, unresolved nodes are ignored), as long as it
+    does not lead to a conflict. In case of a conflict, hints are split in
+    halves recursively to find out which ones to drop. Hints with more
+    preferred levels go first.
+
+    Returns a fork of the trunk with hints resolved (or the trunk itself if
+    there was nothing to resolve).
+    """
+    def resolve_hints(trunk, literals):
+        literals = [literal for literal in literals
+                    if literal in trunk.branchmap]
+        if not literals:
+            return trunk
+
+        fork = trunk.fork()
+        try:
+            resolve_branches(fork, set(fork.branchmap[literal]
+                                       for literal in literals),
+                             why=why_hinted)
+        except SolveError:
+            pass
+        else:
+            return fork
+
+        if len(literals) == 1:
+            logger.debug('\tdropping hint: %r', literals[0])
+            return trunk
+
+        middle = len(literals) // 2
+        trunk = resolve_hints(trunk, literals[:middle])
+        return resolve_hints(trunk, literals[middle:])
+
+    literals = sorted((node[value] for node, value in iteritems(hints)
+                       if value is not None
+                       and node[value] in trunk.branchmap),
+                      key=level_key)
+    logger.info('resolving %d hint(s)', len(literals))
+
+    return resolve_hints(trunk, literals)
+
+
+def prepare_trunk(pgraph, initial_values={}):
+    """
+    Creates a trunk and resolves everything that follows from the initial
+    values, leaving the rest of decisions to stepwise_resolve().
+    """
     trunk = create_trunk(pgraph, initial_values)
 
     expand_branchset(trunk)
     resolve_branches(trunk)
+
+    return trunk
+
+
+def solve_trunk(pgraph, initial_values={}, hints=None):
+    trunk = prepare_trunk(pgraph, initial_values)
+    if hints:
+        trunk = warm_resolve(trunk, hints)
     stepwise_resolve(trunk)
 
     return trunk
 
 
-def solve(pgraph, initial_values={}):
+def solve(pgraph, initial_values={}, hints=None):
+    """
+    Finds a solution of a pgraph satisfying the initial values.
+
+    Hints are node values to decide on first whenever possible, say, the ones
+    of a previous solution, which keeps the solution stable across small
+    changes of the pgraph. See warm_resolve().
+    """
     logger.info('solving %r with initials: %r', pgraph, initial_values)
 
-    trunk = solve_trunk(pgraph, initial_values)
+    trunk = solve_trunk(pgraph, initial_values, hints)
     ret = dict.fromkeys(pgraph.nodes)
     ret.update(trunk.literals)
     logger.debug('Solution:')
@@ -643,6 +779,12 @@ def why_implies_dead_branch(literal, *cause_literals):
 def why_default(literal, *cause_literals):
     return '%s by default' % (literal)
 
+def why_assumed(literal, *cause_literals):
+    return '%s as assumed' % (literal)
+
+def why_hinted(literal, *cause_literals):
+    return '%s as hinted' % (literal)
+
 class SolveError(Exception):
     """docstring for SolveError"""
 
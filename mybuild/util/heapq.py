@@ -0,0 +1,125 @@
+"""
+Extends the standard heapq module.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+from heapq import *
+
+
+class IndexedHeap(object):
+    """
+    Binary min-heap of unique hashable items keyed by a separate priority.
+
+    Unlike plain heapq-based queues, each item is stored at most once, so its
+    priority can be changed in place (decrease-key) instead of pushing
+    a duplicate entry. Items themselves are never compared, only priorities.
+
+    Usage example:
+
+    >>> heap = IndexedHeap()
+    >>> heap.push('a', 3)
+    >>> heap.push('b', 2)
+    >>> heap.push('a', 1)  # decrease-key
+    >>> len(heap)
+    2
+    >>> heap.pop()
+    ('a', 1)
+    >>> heap.pop()
+    ('b', 2)
+    """
+    __slots__ = '_items', '_priorities', '_index'
+
+    def __init__(self):
+        super(IndexedHeap, self).__init__()
+        self._items      = []  # heap-ordered items
+        self._priorities = []  # priorities of corresponding items
+        self._index      = {}  # {item: position}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._index
+
+    def priority(self, item):
+        return self._priorities[self._index[item]]
+
+    def push(self, item, priority):
+        """Inserts a new item, or changes a priority of an existing one."""
+        try:
+            pos = self._index[item]
+
+        except KeyError:
+            pos = len(self._items)
+            self._items.append(item)
+            self._priorities.append(priority)
+            self._index[item] = pos
+            self._sift_up(pos)
+
+        else:
+            old_priority = self._priorities[pos]
+            self._priorities[pos] = priority
+            if priority < old_priority:
+                self._sift_up(pos)
+            elif old_priority < priority:
+                self._sift_down(pos)
+
+    def pop(self):
+        """Removes and returns the (item, priority) pair with the least
+        priority."""
+        items = self._items
+        priorities = self._priorities
+        if not items:
+            raise IndexError('pop from empty heap')
+
+        item, priority = items[0], priorities[0]
+        del self._index[item]
+
+        last_item, last_priority = items.pop(), priorities.pop()
+        if items:
+            items[0], priorities[0] = last_item, last_priority
+            self._index[last_item] = 0
+            self._sift_down(0)
+
+        return item, priority
+
+    def _move(self, item, priority, pos):
+        self._items[pos] = item
+        self._priorities[pos] = priority
+        self._index[item] = pos
+
+    def _sift_up(self, pos):
+        items = self._items
+        priorities = self._priorities
+        item, priority = items[pos], priorities[pos]
+
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            if not priority < priorities[parent_pos]:
+                break
+            self._move(items[parent_pos], priorities[parent_pos], pos)
+            pos = parent_pos
+
+        self._move(item, priority, pos)
+
+    def _sift_down(self, pos):
+        items = self._items
+        priorities = self._priorities
+        item, priority = items[pos], priorities[pos]
+        size = len(items)
+
+        while True:
+            child_pos = 2*pos + 1
+            if child_pos >= size:
+                break
+            right_pos = child_pos + 1
+            if (right_pos < size and
+                    priorities[right_pos] < priorities[child_pos]):
+                child_pos = right_pos
+            if not priorities[child_pos] < priority:
+                break
+            self._move(items[child_pos], priorities[child_pos], pos)
+            pos = child_pos
+
+        self._move(item, priority, pos)
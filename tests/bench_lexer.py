@@ -0,0 +1,67 @@
+"""
+Benchmarks throughput of the PLY lexer and the hand-written tokenizer.
+
+Run it directly: python tests/bench_lexer.py [size_kb...]
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import sys
+import timeit
+
+from mybuild.lang import lex
+from mybuild.lang.location import Fileinfo
+
+
+snippet = '''\
+/*
+ * A module with a doc comment.
+ */
+module Foo(debug = 0, log_level = "info") {
+    // Sources and dependencies
+    sources: ["foo.c", "bar.c", "escaped\\tname.c"]
+    depends: [
+        Bar, Baz::Qux,
+        embox.lib.LibC(static = 1)
+    ]
+    option flags: "-O2 -Wall";
+}
+
+'''
+
+# Mostly comments, e.g. license headers and commented out code, which the
+# PLY lexer matches with a non-greedy regex of a block comment.
+comment_snippet = (
+    '/*\n' +
+    ' * Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n' * 64 +
+    ' */\n' +
+    '// module Unused { sources: ["unused.c"] }\n' * 16 +
+    'module Bar {}\n\n')
+
+
+def tokenize(lexer, source):
+    lexer.lineno = 1
+    lexer.ignore_newline_stack = [0]
+    lexer.fileinfo = Fileinfo(source, '<bench>')
+    lexer.input(source)
+    for _ in iter(lexer.token, None):
+        pass
+
+
+def bench(size_kb, repeat=5):
+    for input_name, text in [('code', snippet),
+                             ('comments', comment_snippet)]:
+        source = text * max(1, size_kb * 1024 // len(text))
+        size_mb = len(source) / (1024 * 1024)
+
+        for name, lexer in [('ply', lex.lexer.clone()),
+                            ('tokenizer', lex.Tokenizer())]:
+            best = min(timeit.repeat(lambda: tokenize(lexer, source),
+                                     repeat=repeat, number=1))
+            print('{0:>8} KB {1:>10} {2:>10} {3:>10.2f} MB/s'
+                  .format(size_kb, input_name, name, size_mb / best))
+
+
+if __name__ == "__main__":
+    for size_kb in [int(arg) for arg in sys.argv[1:]] or [64, 1024]:
+        bench(size_kb)
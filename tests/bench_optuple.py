@@ -0,0 +1,62 @@
+"""
+Benchmarks hashing of optuples and Pgraph node lookups by optuples.
+
+Run it directly: python tests/bench_optuple.py [nr_modules...]
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import sys
+import timeit
+
+from mybuild.binding.pydsl import module, option
+from mybuild.core.context import Context
+
+
+def new_modules(nr_modules):
+    ret = []
+    for i in range(nr_modules):
+        @module
+        def m(self, level=option(0, 1, 2, 3), name=option.str('x'),
+              debug=option.bool()):
+            pass
+        ret.append(m)
+    return ret
+
+
+def value_hash(optuple):
+    """Hashes an optuple by its values, as it would be without interning."""
+    return optuple._type_hash() ^ tuple.__hash__(optuple)
+
+
+def bench(nr_modules, repeat=3):
+    modules = new_modules(nr_modules)
+    optuples = [m(level=level, name='x', debug=False)
+                for m in modules for level in range(4)]
+
+    g = Context().pgraph
+    for optuple in optuples:
+        g.node_for(optuple)
+
+    def lookup():
+        for optuple in optuples:
+            g.node_for(optuple)
+
+    def lookup_new():
+        for m in modules:
+            for level in range(4):
+                g.node_for(m(level=level, name='x', debug=False))
+
+    for name, func in [('value hash', lambda: list(map(value_hash,
+                                                       optuples))),
+                       ('hash', lambda: list(map(hash, optuples))),
+                       ('node_for', lookup),
+                       ('new+node_for', lookup_new)]:
+        best = min(timeit.repeat(func, repeat=repeat, number=10))
+        print('{0:>8} modules {1:>14} {2:>10.3f} us/optuple'
+              .format(nr_modules, name, best / 10 / len(optuples) * 1e6))
+
+
+if __name__ == "__main__":
+    for nr_modules in [int(arg) for arg in sys.argv[1:]] or [100, 1000]:
+        bench(nr_modules)
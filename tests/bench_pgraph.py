@@ -0,0 +1,56 @@
+"""
+Benchmarks construction of a Context pgraph (without solving it).
+
+Run it directly: python tests/bench_pgraph.py [nr_modules...]
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import sys
+import timeit
+
+from mybuild.binding.pydsl import module, option
+from mybuild.core.context import Context
+
+
+def new_module(deps):
+    @module
+    def m(self, level=option(0, 1, 2, 3), debug=option.bool()):
+        for dep in deps:
+            self._constrain(dep(level=level))
+    return m
+
+
+def new_modules(nr_modules):
+    ret = []
+    for i in range(nr_modules):
+        ret.append(new_module(ret[-3:]))
+
+    @module
+    def conf(self):
+        for m in ret[-10:]:
+            self._constrain(m)
+
+    return conf
+
+
+def build(conf):
+    context = Context()
+    context.discover_all(conf())
+    context.init_pgraph_domains()
+    context.init_pgraph_providers()
+    return context.pgraph
+
+
+def bench(nr_modules, repeat=3):
+    conf = new_modules(nr_modules)
+    nr_nodes = len(build(conf).nodes)
+
+    best = min(timeit.repeat(lambda: build(conf), repeat=repeat, number=1))
+    print('{0:>8} modules {1:>8} nodes {2:>10.3f} ms {3:>8.3f} us/node'
+          .format(nr_modules, nr_nodes, best * 1e3, best / nr_nodes * 1e6))
+
+
+if __name__ == "__main__":
+    for nr_modules in [int(arg) for arg in sys.argv[1:]] or [500, 5000]:
+        bench(nr_modules)
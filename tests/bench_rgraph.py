@@ -0,0 +1,48 @@
+"""
+Benchmarks rgraph traversal on deep synthetic implication chains.
+
+Run it directly: python tests/bench_rgraph.py [depth...]
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import sys
+import timeit
+
+from mybuild.req.rgraph import Rgraph, get_error_rgraph, traverse_error_rgraph
+from mybuild.req.solver import solve, SolveError
+
+from test_solver import HandyPgraph
+
+
+def chain_error(depth):
+    """Solves A0 -> A1 -> ... -> An with A0 and ~An, which is a violation
+    explained by a chain of depth reasons."""
+    g = HandyPgraph()
+    atoms = [g.NamedAtom(name='A{0}'.format(i)) for i in range(depth)]
+
+    for atom, next_atom in zip(atoms, atoms[1:]):
+        atom[True] >> next_atom[True]
+
+    try:
+        solve(g, {atoms[0]: True, atoms[-1]: False})
+    except SolveError as e:
+        return e
+    raise AssertionError('Chain of depth {0} is solvable'.format(depth))
+
+
+def bench(depth, repeat=3):
+    error = chain_error(depth)
+
+    for name, rgraph in [('full', Rgraph(error.trunk)),
+                         ('short', get_error_rgraph(error))]:
+        nr_reasons = sum(1 for _ in traverse_error_rgraph(rgraph))
+        best = min(timeit.repeat(lambda: list(traverse_error_rgraph(rgraph)),
+                                 repeat=repeat, number=1))
+        print('{0:>8} {1:>6} {2:>8} reasons {3:>10.2f} ms'
+              .format(depth, name, nr_reasons, best * 1000))
+
+
+if __name__ == "__main__":
+    for depth in [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]:
+        bench(depth)
@@ -1,10 +1,14 @@
 from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
+import shutil
+import tempfile
 import unittest
 
-from mybuild.binding.pydsl import module
-from mybuild.core.context import resolve
+from mybuild.binding.pydsl import module, option
+from mybuild.core.context import Context, ContextPgraph, node_label, resolve
+from mybuild.req.cache import ComponentCache
+from mybuild.req.models import count_solutions, iter_solutions
 from mybuild.req.solver import solve
 from mybuild.req.solver import SolveError
 
@@ -122,3 +126,255 @@ class SolverTestCase(unittest.TestCase):
         self.assertIn(m1, modules)
         self.assertNotIn(m2, modules)
         self.assertIn(m3, modules)
+
+    def test_solve_components(self):
+        @module
+        def conf(self):
+            self._constrain(m1(isM2=True))
+            self._constrain(m3)
+
+        @module
+        def m1(self, isM2=False):
+            if isM2:
+                self._constrain(m2)
+
+        @module
+        def m2(self):
+            pass
+
+        @module
+        def m3(self):
+            pass
+
+        @module
+        def unused(self):
+            self._constrain(m2)
+
+        def optuples(instance_map):
+            return set(instance._optuple
+                       for instance in itervalues(instance_map))
+
+        expected = optuples(resolve(conf))
+        cache = {}
+        self.assertEqual(expected, optuples(resolve(conf, cache=cache)))
+        self.assertTrue(cache)
+        self.assertEqual(expected, optuples(resolve(conf, cache=cache)))
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = ComponentCache(cache_dir)
+            self.assertEqual(expected, optuples(resolve(conf, cache=cache)))
+            self.assertEqual(0, cache.hits)
+
+            cache = ComponentCache(cache_dir)  # as if in another run
+            self.assertEqual(expected, optuples(resolve(conf, cache=cache)))
+            self.assertEqual(len(cache), cache.hits)
+            self.assertEqual(0, cache.misses)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_session(self):
+        @module
+        def conf(self):
+            self._constrain(m1)
+
+        @module
+        def m1(self, x=option(1, 2)):
+            if x == 2:
+                self._constrain(m2)
+
+        @module
+        def m2(self):
+            pass
+
+        context = Context()
+        context.resolve(conf)
+        session = context.session()
+
+        g = context.pgraph
+        solution, changes = session.assume({g.node_for(m1(x=2)): True})
+        self.assertIn(m2, context.instance_map(solution))
+        self.assertEqual((False, True), changes[g.atom_for(m2)])
+        self.assertEqual((True, False), changes[g.atom_for(m1, 'x', 1)])
+
+        session.retract()
+        self.assertNotIn(m2, context.instance_map(session.solution))
+
+        context.resolve(m2)
+        self.assertEqual({g.node_for(m2()): True}, context.initial_values)
+
+    def test_count_configurations(self):
+        @module
+        def conf(self):
+            self._constrain(m1)
+
+        @module
+        def m1(self, x=option(1, 2)):
+            if x == 2:
+                self._constrain(m2)
+
+        @module
+        def m2(self):
+            pass
+
+        context = Context()
+        expected = context.resolve(conf)
+
+        g = context.pgraph
+        module_atoms = list(g.module_atoms)
+
+        # Whether m2 is included or not, option values aside.
+        self.assertEqual((2, True), count_solutions(g, context.initial_values,
+                                                    module_atoms))
+
+        solutions = list(iter_solutions(g, context.initial_values,
+                                        module_atoms))
+        self.assertEqual(2, len(solutions))
+        self.assertEqual(expected, context.instance_map(solutions[0]))
+        self.assertIn(m2, context.instance_map(solutions[1]))
+
+    def test_costs(self):
+        @module
+        def conf(self):
+            self._constrain(m1)
+
+        @module
+        def m1(self, x=option(1, 2)):
+            if x == 1:
+                self._constrain(m2)
+            else:
+                self._constrain(m3)
+                self._constrain(m4)
+
+        @module
+        def m2(self):
+            pass
+
+        @module
+        def m3(self):
+            pass
+
+        @module
+        def m4(self):
+            pass
+
+        modules = resolve(conf, costs=lambda module: 1)
+        self.assertEqual(set([conf, m1, m2]), set(modules))
+
+        modules = resolve(conf, costs={m2: 10})
+        self.assertEqual(set([conf, m1, m3, m4]), set(modules))
+        self.assertEqual(2, modules[m1].x)
+
+    def test_typed_nodes(self):
+        @module
+        def conf(self):
+            self._constrain(m(x=2))
+
+        @module
+        def m(self, x=option(1, 2), y=option.bool()):
+            pass
+
+        context = Context()
+        context.resolve(conf)
+        g = context.pgraph
+
+        self.assertEqual(set([g.atom_for(conf), g.atom_for(m)]),
+                         g.module_atoms)
+        self.assertEqual(set(g.atom_for(m, option, value)
+                             for option, value in [('x', 1), ('x', 2),
+                                                   ('y', False), ('y', True)]),
+                         g.option_atoms)
+        self.assertIn(g.node_for(m(x=2, y=False)), g.optuple_nodes)
+        self.assertNotIn(g.atom_for(m), g.optuple_nodes)
+
+        self.assertEqual(set(g.module_atoms) | set(g.option_atoms),
+                         set(g.atoms))
+
+    def test_hints(self):
+        @module
+        def conf_old(self):
+            self._constrain(m(x=2))
+
+        @module
+        def conf_new(self):
+            self._constrain(m)
+
+        @module
+        def m(self, x=option(1, 2, 3)):
+            pass
+
+        context = Context()
+        context.resolve(conf_old)
+        hints = context.solution_hints()
+        self.assertIs(True, hints[node_label(context.pgraph.atom_for(m))])
+
+        self.assertEqual(1, resolve(conf_new)[m].x)
+        self.assertEqual(2, resolve(conf_new, hints=hints)[m].x)
+
+        for kwargs in [dict(costs={}), dict(cache={}), dict(processes=2)]:
+            self.assertRaises(ValueError, Context, hints=hints, **kwargs)
+
+    def test_node_label(self):
+        @module
+        def conf(self):
+            self._constrain(m(x=2))
+
+        @module
+        def m(self, x=1):
+            pass
+
+        context = Context()
+        context.resolve(conf)
+        labels = set(map(node_label, context.pgraph.nodes))
+
+        self.assertEqual(len(context.pgraph.nodes), len(labels))
+        self.assertIn(node_label(context.pgraph.node_for(m(x=2))), labels)
+
+
+class OptupleTestCase(unittest.TestCase):
+
+    def test_interning(self):
+        @module
+        def m(self, x=option(1, 2), y=option.bool()):
+            pass
+
+        @module
+        def other(self, x=option(1, 2), y=option.bool()):
+            pass
+
+        optuple = m(x=1, y=False)
+        self.assertIs(optuple, m._opmake([1, False]))
+        self.assertIs(optuple, m(y=False)(x=1))
+        self.assertIs(m(), m._options._ellipsis)
+
+        self.assertEqual(optuple, m(x=1, y=False))
+        self.assertNotEqual(optuple, m(x=2, y=False))
+        self.assertNotEqual(optuple, other(x=1, y=False))
+        self.assertNotEqual(optuple, (1, False))
+
+        self.assertEqual(1, len(set([optuple, m(x=1)(y=False)])))
+
+        self.assertIs(True, m(x=True).x)
+        self.assertIs(1, m(x=1).x)
+        self.assertNotEqual(m(x=1), m(x=True))
+
+    def test_unhashable_values(self):
+        @module
+        def m(self, x=option(1, 2)):
+            pass
+
+        domain = m._opmake([set([1, 2])])
+        self.assertIsNot(domain, m._opmake([set([1, 2])]))
+        self.assertEqual(domain, m._opmake([set([1, 2])]))
+        self.assertRaises(TypeError, hash, domain)
+        self.assertRaises(TypeError, set, [domain, m._opmake([set([1, 2])])])
+        self.assertIs(m(x=1), type(domain)._make([1]))
+
+    def test_node_for(self):
+        @module
+        def m(self, x=option(1, 2)):
+            pass
+
+        g = ContextPgraph(Context())
+        self.assertIs(g.node_for(m(x=1)), g.node_for(m._opmake([1])))
+        self.assertIsNot(g.node_for(m(x=1)), g.node_for(m(x=2)))
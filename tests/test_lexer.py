@@ -0,0 +1,107 @@
+"""
+Differential tests of mybuild.lang.lex.Tokenizer against the PLY lexer.
+"""
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import random
+import unittest
+
+from mybuild.lang import lex
+from mybuild.lang.location import Fileinfo
+
+
+def tokenize(lexer, source):
+    """Returns a list of (type, value, lineno, lexpos) tuples, followed by
+    an error raised, if any."""
+    lexer.lineno = 1
+    lexer.ignore_newline_stack = [0]
+    lexer.fileinfo = Fileinfo(source, '<test>')
+    lexer.input(source)
+
+    ret = []
+    try:
+        for t in iter(lexer.token, None):
+            ret.append((t.type, t.value, t.lineno, t.lexpos))
+    except Exception as e:
+        ret.append((type(e), e.args))
+    ret.append(('lineno', lexer.lineno))
+
+    return ret
+
+
+class TokenizerTestCase(unittest.TestCase):
+
+    fragments = [
+        ' ', '\t', '\n', '\n\n', '  \n', '// line comment', '//', '/* */',
+        '/*\n*/', '/**/', '/*\n\n*/\n', '/* unterminated', '/', '*',
+        'foo', '_bar1', 'x', '0', '42', '007', '"str"', '"esc\\n\\t\\"q\\""',
+        '"\\\\"', '"unterminated', '"', '"a\nb"',
+        '(', ')', '[', ']', '{', '}', ',', '.', ':', '::', ':::', '=', ';',
+        '\r', '$', '@', 'module', 'obj', 'foo(bar=1, baz="2")',
+    ]
+
+    samples = [
+        '',
+        '\n',
+        'module Foo(x = 1):\n    pass\n',
+        'a = [\n  1, 2,\n  3\n]\nb = (\n  {\n   c: 1\n  }\n)\n',
+        'x /* inline */ y\n/* multi\nline */ z // trailing\n',
+        'x\n\n  \n/**/\n\t\ny',
+        's = "a\\tb\\\\c\\"d"',
+        'Foo :: Bar {\n  baz: 1;\n  qux: "2"\n}\n',
+        'a /* never closed\n\n',
+        'unbalanced }',
+    ]
+
+    def assertSameTokens(self, source):
+        self.assertEqual(tokenize(lex.lexer.clone(), source),
+                         tokenize(lex.Tokenizer(), source),
+                         msg='Source: {0!r}'.format(source))
+
+    def test_samples(self):
+        for source in self.samples:
+            self.assertSameTokens(source)
+
+    def test_fragments(self):
+        for fragment in self.fragments:
+            self.assertSameTokens(fragment)
+            self.assertSameTokens('a ' + fragment + ' b')
+
+    def test_random(self):
+        rnd = random.Random(42)
+        for _ in range(2000):
+            source = ''.join(rnd.choice(self.fragments)
+                             for _ in range(rnd.randint(1, 20)))
+            self.assertSameTokens(source)
+
+    def test_slice(self):
+        source = 'a: /* x */ "s" // c\nb: 1 /* y\n*/\n'
+        for start in range(len(source)):
+            for end in range(start, len(source) + 1):
+                lexer = lex.Tokenizer()
+                lexer.lineno = source.count('\n', 0, start) + 1
+                lexer.ignore_newline_stack = [0]
+                lexer.fileinfo = Fileinfo(source, '<test>')
+                lexer.input(source, start, end)
+                try:
+                    tokens = [(t.type, t.value, t.lexpos - start)
+                              for t in iter(lexer.token, None)]
+                except SyntaxError:
+                    tokens = None
+
+                expected = tokenize(lex.lexer.clone(), source[start:end])
+                expected = [token[:2] + token[3:] for token in expected[:-1]]
+                if expected and expected[-1][0] is SyntaxError:
+                    expected = None
+                self.assertEqual(expected, tokens)
+
+    def test_error_location(self):
+        tokens = tokenize(lex.Tokenizer(), 'foo\n  bar $')
+        error_type, error_args = tokens[-2]
+        self.assertIs(error_type, SyntaxError)
+        self.assertEqual(error_args[1][1:3], (2, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
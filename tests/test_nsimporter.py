@@ -0,0 +1,566 @@
+from __future__ import absolute_import, division, print_function
+from mybuild._compat import *
+
+import ast
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mybuild.nsimporter import SingleNamespaceImporter
+from mybuild.nsimporter.dircache import DirectoryCache
+from mybuild.nsimporter.index import NamespaceIndex
+from mybuild.nsloader.myfile import MyFileLoader, precise_lineno
+from mybuild.nsloader.pyfile import PyFileLoader
+from mybuild.core.context import resolve
+from mybuild.glue import PyDslLoader
+from mybuild.nsloader import catalogue, yamlfile
+from mybuild.nsloader.catalogue import Catalogue, CatalogueLoader
+from mybuild.nsloader.yamlfile import YamlFileLoader
+
+
+class PrefetchPyFileLoader(PyFileLoader):
+    PREFETCH = True
+
+    def get_code(self, fullname):
+        if self.importer is not None:
+            code = self.importer.get_prefetched_code(self.path)
+            if code is not None:
+                return code
+        return super(PrefetchPyFileLoader, self).get_code(fullname)
+
+
+class NsImporterTestCaseBase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_file(self, relpath, content=''):
+        path = os.path.join(self.root, relpath)
+        dirpath = os.path.dirname(path)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def touch_dir(self, relpath, delta):
+        """Shifts mtime of a directory, for changes to be noticed even on
+        file systems with coarse timestamps."""
+        path = os.path.join(self.root, relpath)
+        mtime = os.stat(path).st_mtime + delta
+        os.utime(path, (mtime, mtime))
+
+
+class DirectoryCacheTestCase(NsImporterTestCaseBase):
+
+    def test_listing(self):
+        self.make_file('pkg/Pybuild')
+        self.make_file('file')
+
+        dircache = DirectoryCache()
+
+        self.assertTrue(dircache.isdir(self.root, 'pkg'))
+        self.assertTrue(dircache.isfile(self.root, 'file'))
+        self.assertFalse(dircache.isfile(self.root, 'pkg'))
+        self.assertFalse(dircache.isdir(self.root, 'file'))
+        self.assertFalse(dircache.isfile(self.root, 'missing'))
+
+        pkg_path = os.path.join(self.root, 'pkg')
+        self.assertTrue(dircache.isfile(pkg_path, 'Pybuild'))
+
+    def test_missing_directory(self):
+        dircache = DirectoryCache()
+        missing_path = os.path.join(self.root, 'missing')
+
+        self.assertFalse(dircache.isdir(missing_path, 'pkg'))
+        self.assertFalse(dircache.isfile(missing_path, 'Pybuild'))
+
+    def test_mtime_invalidation(self):
+        dircache = DirectoryCache()
+        self.assertFalse(dircache.isfile(self.root, 'Pybuild'))
+
+        self.make_file('Pybuild')
+        self.touch_dir('', -10)
+        self.assertTrue(dircache.isfile(self.root, 'Pybuild'))
+
+        os.remove(os.path.join(self.root, 'Pybuild'))
+        self.touch_dir('', -10)
+        self.assertFalse(dircache.isfile(self.root, 'Pybuild'))
+
+    def test_explicit_invalidation(self):
+        dircache = DirectoryCache()
+        # An integral mtime survives os.utime() round trips exactly.
+        mtime = int(os.stat(self.root).st_mtime) - 10
+        os.utime(self.root, (mtime, mtime))
+        self.assertFalse(dircache.isfile(self.root, 'Pybuild'))
+
+        # The change is made within the same timestamp tick.
+        self.make_file('Pybuild')
+        os.utime(self.root, (mtime, mtime))
+        self.assertFalse(dircache.isfile(self.root, 'Pybuild'))
+
+        dircache.invalidate(self.root)
+        self.assertTrue(dircache.isfile(self.root, 'Pybuild'))
+
+
+class NamespaceIndexTestCase(NsImporterTestCaseBase):
+
+    def build(self, path=None):
+        if path is None:
+            path = [self.root]
+        return NamespaceIndex.build('ns', path, ['Mybuild', 'Pybuild'])
+
+    def test_build(self):
+        self.make_file('Mybuild')
+        self.make_file('pkg/Pybuild')
+        self.make_file('pkg/sub/Mybuild')
+        self.make_file('pkg/sub/main.c')
+        self.make_file('.hidden/Mybuild')
+        self.make_file('not-a-package/Mybuild')
+
+        index = self.build()
+
+        self.assertEqual(dict(pkg=os.path.join(self.root, 'pkg'),
+                              **{'pkg.sub': os.path.join(self.root,
+                                                         'pkg', 'sub')}),
+                         index.packages)
+
+        self.assertEqual({'Mybuild': os.path.join(self.root, 'Mybuild')},
+                         index.loader_files(''))
+        self.assertEqual({'Mybuild': os.path.join(self.root,
+                                                  'pkg', 'sub', 'Mybuild')},
+                         index.loader_files('pkg.sub'))
+
+    def test_shadowed_package(self):
+        self.make_file('first/pkg/Pybuild')
+        self.make_file('second/pkg/Mybuild')
+        self.make_file('second/other/Mybuild')
+
+        first = os.path.join(self.root, 'first')
+        second = os.path.join(self.root, 'second')
+        index = self.build([first, second])
+
+        self.assertEqual(os.path.join(first, 'pkg'), index.packages['pkg'])
+        self.assertEqual(os.path.join(second, 'other'),
+                         index.packages['other'])
+        self.assertNotIn(os.path.join(second, 'pkg'), index.dirs)
+
+    def test_update(self):
+        self.make_file('pkg/Pybuild')
+        index = self.build()
+        self.assertFalse(index.update())
+
+        self.make_file('pkg/new/Mybuild')
+        self.touch_dir('pkg', -10)
+        self.assertTrue(index.update())
+        self.assertIn('pkg.new', index.packages)
+        self.assertEqual(self.build().dirs, index.dirs)
+
+        shutil.rmtree(os.path.join(self.root, 'pkg'))
+        self.assertTrue(index.update())
+        self.assertEqual({}, index.packages)
+
+    def test_save_load(self):
+        self.make_file('tree/pkg/Pybuild')
+        self.make_file('tree/pkg/sub/Mybuild')
+        index = self.build([os.path.join(self.root, 'tree')])
+
+        index_file = os.path.join(self.root, 'index.json')
+        index.save(index_file)
+        loaded = NamespaceIndex.load(index_file)
+
+        self.assertEqual(index.path, loaded.path)
+        self.assertEqual(index.filenames, loaded.filenames)
+        self.assertEqual(index.packages, loaded.packages)
+        self.assertEqual(index.dirs, loaded.dirs)
+        self.assertFalse(loaded.update())
+
+    def test_load_malformed(self):
+        index_file = self.make_file('index.json', '{"version": 1}')
+        self.assertRaises(ValueError, NamespaceIndex.load, index_file)
+
+
+class NamespaceImporterTestCase(NsImporterTestCaseBase):
+
+    namespace = 'nsimporter_test'
+
+    def tearDown(self):
+        for name in list(sys.modules):
+            if name.partition('.')[0] == self.namespace:
+                del sys.modules[name]
+        super(NamespaceImporterTestCase, self).tearDown()
+
+    def importer(self):
+        return SingleNamespaceImporter({'Pybuild': PyFileLoader},
+                                       self.namespace, [self.root])
+
+    def test_import_all(self):
+        self.make_file('pkg/Pybuild', 'foo = 1\n')
+        self.make_file('pkg/sub/Pybuild', 'bar = 2\n')
+        self.make_file('nopybuild/file', '')
+
+        with self.importer() as importer:
+            ns = importer.import_all(['pkg', 'pkg.sub', 'nopybuild'])
+
+        self.assertEqual(1, ns.pkg.foo)
+        self.assertEqual(2, ns.pkg.sub.bar)
+        self.assertFalse(hasattr(ns.nopybuild, 'Pybuild'))
+
+    def test_new_package(self):
+        self.make_file('pkg/Pybuild', 'foo = 1\n')
+
+        with self.importer() as importer:
+            ns = importer.import_all(['pkg'])
+            self.assertRaises(ImportError, importer.import_all, ['new'])
+
+            self.make_file('new/Pybuild', 'bar = 2\n')
+            importer.invalidate_caches()
+            importer.import_all(['new'])
+
+        self.assertEqual(2, ns.new.bar)
+
+    def test_index(self):
+        self.make_file('pkg/Pybuild', 'foo = 1\n')
+        index_file = os.path.join(self.root, 'index.json')
+
+        with self.importer() as importer:
+            importer.load_index(self.namespace, index_file)
+            self.assertTrue(os.path.isfile(index_file))
+
+            # Changes are not seen until the index is updated.
+            self.make_file('new/Pybuild', 'bar = 2\n')
+            self.touch_dir('', -10)
+            self.assertIsNone(importer.find_module(self.namespace + '.new',
+                                                   [self.root]))
+
+            importer.invalidate_caches()
+            ns = importer.import_all(['pkg', 'new'])
+
+        self.assertEqual(1, ns.pkg.foo)
+        self.assertEqual(2, ns.new.bar)
+
+        index = NamespaceIndex.load(index_file)
+        self.assertNotIn('new', index.packages)
+
+        with self.importer() as importer:
+            index = importer.load_index(self.namespace, index_file)
+        self.assertIn('new', index.packages)
+
+
+class PrefetchTestCase(NsImporterTestCaseBase):
+
+    namespace = 'nsimporter_prefetch_test'
+
+    def tearDown(self):
+        for name in list(sys.modules):
+            if name.partition('.')[0] == self.namespace:
+                del sys.modules[name]
+        super(PrefetchTestCase, self).tearDown()
+
+    def importer(self):
+        return SingleNamespaceImporter({'Pybuild': PrefetchPyFileLoader},
+                                       self.namespace, [self.root])
+
+    def test_prefetch(self):
+        paths = [self.make_file('Pybuild', 'foo = 1\n'),
+                 self.make_file('pkg/Pybuild', 'bar = 2\n'),
+                 self.make_file('pkg/sub/Pybuild', 'baz = 3\n'),
+                 self.make_file('other/Pybuild', 'qux = 4\n')]
+        self.make_file('broken/Pybuild', '(\n')
+
+        with self.importer() as importer:
+            importer.prefetch(self.namespace, ['pkg.sub'], processes=2)
+            self.assertEqual(set(paths[:3]), set(importer.prefetched))
+
+            importer.prefetch(self.namespace, processes=2)
+            self.assertEqual(set(paths), set(importer.prefetched))
+
+            ns = importer.import_all(['pkg.sub', 'other'])
+            self.assertEqual({}, importer.prefetched)
+
+        self.assertEqual(1, ns.foo)
+        self.assertEqual(2, ns.pkg.bar)
+        self.assertEqual(3, ns.pkg.sub.baz)
+        self.assertEqual(4, ns.other.qux)
+
+    def test_changed_file(self):
+        path = self.make_file('pkg/Pybuild', 'foo = 1\n')
+
+        with self.importer() as importer:
+            importer.prefetch(self.namespace, processes=1)
+
+            self.make_file('pkg/Pybuild', 'foo = 2\n')
+            mtime = os.stat(path).st_mtime + 10
+            os.utime(path, (mtime, mtime))
+
+            ns = importer.import_all(['pkg'], prefetch=False)
+
+        self.assertEqual(2, ns.pkg.foo)
+
+
+class LazyPackageTestCase(NamespaceImporterTestCase):
+
+    def importer(self):
+        return SingleNamespaceImporter({'Pybuild': PyFileLoader},
+                                       self.namespace, [self.root],
+                                       lazy=True)
+
+    def get_exports(self, loader_type, source):
+        path = self.make_file('exports/' + loader_type.__name__, source)
+        fullname = self.namespace + '.exports.' + loader_type.__name__
+        return loader_type(None, fullname, path).get_exports(fullname)
+
+    def test_py_exports(self):
+        self.assertEqual(set(['foo', 'bar', 'baz', 'os', 'Cls', 'func']),
+                         set(self.get_exports(PyFileLoader, """
+import os.path
+from sys import version as foo
+bar, (baz, _private) = 1, (2, 3)
+def func(): local = 1
+class Cls(object): attr = 1
+if True:
+    squares = [i*i for i in range(3)]
+""".replace('squares', '_squares'))))
+
+        self.assertEqual(['foo'], self.get_exports(PyFileLoader,
+                                                   "__all__ = ['foo']\n"
+                                                   "foo = bar = 1\n"))
+        self.assertIsNone(self.get_exports(PyFileLoader, "from os import *\n"))
+
+        for source in ["__all__ = ['foo']\n__all__ += ['bar']\n",
+                       "__all__ = ['foo']\n__all__.extend(['bar'])\n",
+                       "if True:\n    __all__ = ['foo']\n",
+                       "def func():\n    global foo\n    foo = 1\n",
+                       "globals()['foo'] = 1\n",
+                       "vars().update(foo=1)\n",
+                       "exec('foo = 1')\n"]:
+            self.assertIsNone(self.get_exports(PyFileLoader, source), source)
+
+    def test_my_exports(self):
+        self.assertEqual(['foo', 'bar', 'baz'],
+                         self.get_exports(MyFileLoader, """
+module foo: { files: ["foo.c"] }
+application bar(arg): {
+    depends: [foo]
+}
+baz.attr: 42
+"""))
+
+    def test_lazy_import(self):
+        self.make_file('pkg/Pybuild', 'foo = 1\n')
+        self.make_file('other/Pybuild', 'bar = 2\n')
+
+        with self.importer() as importer:
+            ns = importer.import_all(['pkg', 'other'])
+            pybuild_name = self.namespace + '.pkg.Pybuild'
+
+            self.assertNotIn(pybuild_name, sys.modules)
+            self.assertEqual(1, ns.pkg.foo)
+            self.assertIn(pybuild_name, sys.modules)
+            self.assertNotIn(self.namespace + '.other.Pybuild', sys.modules)
+
+            self.assertFalse(hasattr(ns.pkg, 'missing'))
+
+
+class PreciseLinenoTestCase(unittest.TestCase):
+
+    def test_precise_lineno(self):
+        source = "def f():\n    return [1,\n            1 // 0]\n"
+        precise = compile(source, '<test>', 'exec')
+
+        # Mimic a fast mode: expressions get a line of a statement.
+        tree = ast.parse(source)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.expr):
+                node.lineno = 2
+        fast = compile(tree, '<test>', 'exec')
+
+        namespace = {}
+        exec(fast, namespace)
+        try:
+            namespace['f']()
+        except ZeroDivisionError:
+            tb = sys.exc_info()[2].tb_next
+
+        self.assertEqual(2, tb.tb_lineno)
+        self.assertEqual(3, precise_lineno(tb.tb_frame.f_code, tb.tb_lasti,
+                                           precise))
+
+
+class YamlModuleType(object):
+
+    def __init__(self, fullname, mapping):
+        self.__module__ = fullname
+        if 'name' in mapping:
+            self.__name__ = mapping['name']
+        self.mapping = mapping
+
+
+@unittest.skipIf(yamlfile.yaml is None, 'PyYaml is not installed')
+class YamlFileLoaderTestCase(NsImporterTestCaseBase):
+
+    fullname = 'nsimporter_yaml_test'
+
+    source = """\
+--- !module
+name: foo
+files: [foo.c]
+--- !module
+name: bar
+depends:
+  - {name: nested}
+...
+--- !module
+files: [anonymous.c]
+"""
+
+    def setUp(self):
+        super(YamlFileLoaderTestCase, self).setUp()
+        self.constructed = []
+
+    def tearDown(self):
+        sys.modules.pop(self.fullname, None)
+        super(YamlFileLoaderTestCase, self).tearDown()
+
+    def construct(self, fullname, mapping):
+        self.constructed.append(mapping.get('name'))
+        return YamlModuleType(fullname, mapping)
+
+    def loader(self, path):
+        return YamlFileLoader({'!module': self.construct}, self.fullname, path)
+
+    def test_lazy_documents(self):
+        path = self.make_file('Mybuild.yaml', self.source)
+        module = self.loader(path).load_module(self.fullname)
+        self.assertEqual([None], self.constructed)
+
+        self.assertEqual([{'name': 'nested'}],
+                         module.bar.mapping['depends'])
+        self.assertEqual(self.fullname, module.bar.__module__)
+        self.assertEqual([None, 'bar'], self.constructed)
+
+        self.assertEqual(['foo.c'], module.foo.mapping['files'])
+        self.assertIs(module.foo, module.foo)
+        self.assertEqual([None, 'bar', 'foo'], self.constructed)
+
+        self.assertFalse(hasattr(module, 'nested'))
+
+    def test_index_cache(self):
+        path = self.make_file('Mybuild.yaml', self.source)
+        key = (path, YamlFileLoader.NAME_KEY)
+
+        self.assertIsNone(self.loader(path).get_exports(self.fullname))
+        index = yamlfile._index_cache[key][1]
+        self.assertEqual([name for name, start, end in index],
+                         ['foo', 'bar', None])
+
+        self.loader(path).get_exports(self.fullname)
+        self.assertIs(index, yamlfile._index_cache[key][1])
+
+        self.make_file('Mybuild.yaml', '--- !module\nname: baz\n')
+        mtime = os.stat(path).st_mtime + 10
+        os.utime(path, (mtime, mtime))
+
+        self.assertEqual(['baz'], self.loader(path).get_exports(self.fullname))
+        module = self.loader(path).load_module(self.fullname)
+        self.assertEqual('baz', module.baz.__name__)
+        self.assertFalse(hasattr(module, 'foo'))
+
+
+class PyCatalogueLoader(CatalogueLoader):
+    FILENAME = 'Pybuild.cat'
+
+
+class CatalogueTestCase(NamespaceImporterTestCase):
+
+    namespace = 'nsimporter_catalogue_test'
+
+    def importer(self, loader_type=PyDslLoader):
+        return SingleNamespaceImporter({'Pybuild': loader_type},
+                                       self.namespace, [self.root])
+
+    def test_convert(self):
+        self.make_file('pkg/Pybuild', """
+@module
+def conf(self):
+    self._constrain(foo(level=2))
+
+@module
+def foo(self, level=option(1, 2, 3), name=option.str("x")):
+    self.files = ["foo.c", "foo.h"]
+    self.includes = ["include"]
+    self.depends = [bar, {ns}.other.Pybuild.baz]
+
+@module
+def bar(self):
+    self.files = ["bar.c"]
+
+@module
+def qux(self):
+    self.build_depends = [bar]
+""".format(ns=self.namespace))
+        self.make_file('other/Pybuild', """
+@module
+def baz(self, debug=option.bool()):
+    pass
+""")
+
+        with self.importer() as importer:
+            ns = importer.import_all(['pkg', 'other'])
+            for rel_name in 'pkg', 'other':
+                catalogue.convert(getattr(ns, rel_name).Pybuild,
+                                  os.path.join(self.root, rel_name,
+                                               'Pybuild.cat'))
+
+        for name in list(sys.modules):
+            if name.partition('.')[0] == self.namespace:
+                del sys.modules[name]
+        for rel_name in 'pkg', 'other':
+            os.remove(os.path.join(self.root, rel_name, 'Pybuild'))
+
+        cat = Catalogue.open(os.path.join(self.root, 'pkg', 'Pybuild.cat'))
+        self.assertEqual(['bar', 'conf', 'foo', 'qux'], cat.names())
+        self.assertIn('foo', cat)
+        self.assertIsNone(cat.record('baz'))
+        cat.close()
+
+        with self.importer(PyCatalogueLoader) as importer:
+            ns = importer.import_all(['pkg', 'other'])
+            pybuild = ns.pkg.Pybuild
+            self.assertNotIn('foo', vars(pybuild))
+
+            foo = pybuild.foo
+            self.assertIs(foo, pybuild.foo)
+            self.assertEqual(['level', 'name'], list(foo._options))
+            self.assertEqual([1, 'x'],
+                             [optype.default for optype in foo._optypes])
+            self.assertEqual(set([1, 2, 3]), foo._optypes.level._values)
+
+            instance = foo(level=2, name='x')._instantiate_module()
+            self.assertEqual(['foo.c', 'foo.h'], instance.files)
+            self.assertEqual(['include'], instance.includes)
+            self.assertEqual([pybuild.bar(), ns.other.Pybuild.baz()],
+                             instance.depends)
+            self.assertEqual([foo], foo.provides)
+
+            qux = pybuild.qux()._instantiate_module()
+            self.assertEqual([pybuild.bar()], qux.depends)
+            self.assertIn(pybuild.bar, resolve(pybuild.qux))
+
+            instance_map = resolve(pybuild.conf)
+
+        self.assertEqual(set([pybuild.conf, foo, pybuild.bar,
+                              ns.other.Pybuild.baz]),
+                         set(instance_map))
+        self.assertEqual(2, instance_map[foo].level)
+
+    def test_malformed(self):
+        path = self.make_file('pkg/Pybuild.cat', 'MYBC')
+        self.assertRaises(ValueError, Catalogue.open, path)
+        self.make_file('pkg/Pybuild.cat', '')
+        self.assertRaises(ValueError, Catalogue.open, path)
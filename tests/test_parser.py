@@ -6,9 +6,12 @@ from mybuild._compat import *
 
 import ast
 import itertools
+import re
+import threading
 import unittest
 
-from mybuild.lang.parse import my_parse
+from mybuild.lang.incremental import IncrementalParse
+from mybuild.lang.parse import MyParser, my_parse
 
 
 __author__ = "Vita Loginova"
@@ -262,3 +265,177 @@ except __my_exec_module__:
         self.assertIs(True, ASTComparator().compare(my_node1, my_node2))
         self.assertIs(True, ASTComparator().compare(my_node1, py_node))
         pass
+
+
+class FastModeTestCase(unittest.TestCase):
+
+    my_source = """
+module food: {
+    fruits: {
+        red: [apple,
+              cherry]
+        yellow: [banana]
+    }
+}
+
+module drinks(food): {
+    juice: food.fruits.red
+}
+"""
+
+    def test_same_tree(self):
+        full = my_parse(self.my_source)
+        fast = my_parse(self.my_source, fast=True)
+
+        self.assertEqual(ast.dump(full), ast.dump(fast))
+
+        full_lines = [node.lineno for node in ast.walk(full)
+                      if isinstance(node, ast.stmt)]
+        fast_lines = [node.lineno for node in ast.walk(fast)
+                      if isinstance(node, ast.stmt)]
+        self.assertEqual(full_lines, fast_lines)
+
+    def test_syntax_error_location(self):
+        my_source = "module food: {\n    fruits: [apple,\n}\n"
+
+        with self.assertRaises(SyntaxError) as full_cm:
+            my_parse(my_source)
+        with self.assertRaises(SyntaxError) as fast_cm:
+            my_parse(my_source, fast=True)
+
+        self.assertEqual(tuple(full_cm.exception.args[1]),
+                         tuple(fast_cm.exception.args[1]))
+
+
+class ReentrancyTestCase(unittest.TestCase):
+
+    sources = [
+        "module main: {\n}\n",
+        "module food: {\n    fruits: {\n        red: [apple]\n    }\n}\n",
+        "x: (1,\n    2)\ny: [a.b, {c: d}]\n",
+        "module broken: {\n",
+    ]
+
+    def parse_dump(self, source, parser=None):
+        try:
+            if parser is None:
+                return ast.dump(my_parse(source, '<test>'),
+                                include_attributes=True)
+            return ast.dump(parser.parse(source, '<test>'),
+                            include_attributes=True)
+        except SyntaxError as e:
+            return repr(e.args)
+
+    def test_parser_instances(self):
+        first, second = MyParser(), MyParser()
+
+        for source in self.sources:
+            self.assertEqual(self.parse_dump(source),
+                             self.parse_dump(source, first))
+            self.assertEqual(self.parse_dump(source),
+                             self.parse_dump(source, second))
+
+    def test_threads(self):
+        expected = [self.parse_dump(source) for source in self.sources]
+        results = {}
+
+        def worker(n):
+            results[n] = [self.parse_dump(source)
+                          for _ in range(20)
+                          for source in self.sources]
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for n in range(4):
+            self.assertEqual(expected * 20, results[n])
+
+
+class IncrementalParseTestCase(unittest.TestCase):
+
+    my_source = """\
+"Docstring"
+
+module food: {
+    fruits: {
+        red: [apple,
+              cherry]
+    }
+}
+
+module drinks(food): {
+    juice: food.fruits.red
+}
+fruits.yellow: [banana]; x: 1
+"""
+
+    def dump(self, module):
+        # Auxiliary functions are named differently, but consistently.
+        aux_names = {}
+        def rename(m):
+            return aux_names.setdefault(m.group(),
+                                        '<aux-{0}>'.format(len(aux_names)))
+        return re.sub(r'<aux-0(\.\d+)?-\d+>', rename,
+                      ast.dump(module, include_attributes=True))
+
+    def assertSameAsFull(self, inc):
+        self.assertEqual(self.dump(my_parse(inc.source)),
+                         self.dump(inc.module))
+
+    def edit(self, inc, old, new, count=1):
+        for _ in range(count):
+            start = inc.source.index(old)
+            inc.edit(start, start + len(old), new)
+            self.assertSameAsFull(inc)
+
+    def test_initial(self):
+        inc = IncrementalParse(self.my_source)
+        self.assertSameAsFull(inc)
+        self.assertEqual(['food', 'drinks', 'fruits.yellow', 'x'],
+                         [str(binding) for binding in inc.bindings])
+
+    def test_edit_within_line(self):
+        inc = IncrementalParse(self.my_source)
+        food_stmts = inc.chunks[1].stmts
+
+        self.edit(inc, 'juice', 'water')
+        self.edit(inc, 'x: 1', 'x: 42')
+
+        self.assertIs(food_stmts, inc.chunks[1].stmts)
+
+    def test_edit_lines(self):
+        inc = IncrementalParse(self.my_source)
+        self.edit(inc, '\n}\n\nmodule drinks', '\n}\nmodule drinks')
+        drinks_stmts = inc.chunks[2].stmts
+
+        self.edit(inc, '[apple,', '[apple,\n  plum,', count=3)
+        self.edit(inc, 'module food', 'y: 2\nmodule food')
+
+        self.assertIs(drinks_stmts, inc.chunks[3].stmts)
+
+    def test_statements(self):
+        inc = IncrementalParse(self.my_source)
+
+        self.edit(inc, '; x: 1', '')
+        self.edit(inc, 'fruits.yellow', 'y: 2; fruits.yellow')
+        self.assertEqual(['food', 'drinks', 'y', 'fruits.yellow'],
+                         [str(binding) for binding in inc.bindings])
+
+    def test_syntax_error(self):
+        inc = IncrementalParse(self.my_source)
+        source = inc.source
+        module = inc.module
+
+        for old, new in [('[apple,', '[apple'),
+                         ('x: 1', '"Docstring"'),
+                         ('fruits.yellow', 'food')]:
+            start = source.index(old)
+            with self.assertRaises(SyntaxError):
+                inc.edit(start, start + len(old), new)
+
+        self.assertEqual(source, inc.source)
+        self.assertIs(module, inc.module)
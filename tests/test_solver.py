@@ -2,14 +2,35 @@ from __future__ import absolute_import, division, print_function
 from mybuild._compat import *
 
 import functools
+import itertools
+import pickle
+import random
+import shutil
+import sys
+import tempfile
 import unittest
 
 from mybuild.req import pgraph
+from mybuild.req.cache import ComponentCache
+from mybuild.req.components import (connected_components,
+                                    describe,
+                                    solve_components)
+from mybuild.req.frozen import solve_frozen
+from mybuild.req.models import count_solutions, iter_solutions, minimize
+from mybuild.req.rgraph import (Rgraph,
+                                get_branch_rgraph,
+                                get_error_rgraph,
+                                get_violation_nodes,
+                                shorten_rgraph,
+                                traverse_error_rgraph)
+from mybuild.req.session import Session
 from mybuild.req.solver import (ComparableSolution,
+                                Solution,
                                 create_trunk,
                                 solve_trunk,
                                 solve,
                                 SolveError)
+from mybuild.util.misc import bools
 
 
 class HandyPgraph(pgraph.Pgraph):
@@ -73,6 +94,102 @@ class SolverTestCaseBase(unittest.TestCase):
     def atoms(self, names):
         return [self.pgraph.NamedAtom(name=name) for name in names]
 
+    def random_pgraph(self, rnd, nr_groups, group_size):
+        """Makes a few independent groups of atoms with random relations,
+        some of which are bound to constants."""
+        g = self.pgraph
+        initial_values = {}
+        groups = []
+
+        for n in range(nr_groups):
+            atoms = self.atoms('{0}.{1}'.format(n, i)
+                               for i in range(group_size))
+            groups.append(atoms)
+
+            for atom in atoms:
+                atom[rnd.choice([True, False])].level = rnd.randint(0, 2)
+
+            for _ in range(group_size):
+                a, b = rnd.sample(atoms, 2)
+                a[rnd.choice([True, False])] >> b[rnd.choice([True, False])]
+
+            node = rnd.choice([g.Or, g.And, g.AtMostOne])(
+                    *rnd.sample(atoms, 3), name='op{0}'.format(n))
+            initial_values[node] = rnd.choice([True, False])
+
+            if rnd.random() < 0.3:
+                g.new_const(rnd.choice([True, False]), rnd.choice(atoms))
+
+        return initial_values, groups
+
+
+class PgraphTestCase(SolverTestCaseBase):
+
+    def test_new_node_cache(self):
+        g = self.pgraph
+        A,B = self.atoms('AB')
+
+        self.assertIs(A, g.NamedAtom(name='A'))
+        self.assertIsNot(A, g.NamedAtom(name='C'))
+
+        N = g.new_node(pgraph.And, [A, B])
+        self.assertIs(N, g.new_node(pgraph.And, (B, A),
+                                    why_identity_implies_all_operands_identity=
+                                        None))
+        self.assertIs(N._operands, g.new_node(pgraph.Or, [B, A])._operands)
+
+        self.assertEqual(set([A, B, N, g.new_node(pgraph.Or, [A, B]),
+                              g.new_const(True), g.new_const(False),
+                              g.NamedAtom(name='C')]), g.nodes)
+
+    def test_node_registry(self):
+        g = self.pgraph
+        atoms = g.atoms
+        nodes = g.nodes
+        self.assertEqual(0, len(atoms))
+
+        A,B = self.atoms('AB')
+        N = g.Or(A, B)
+
+        self.assertEqual([A, B], list(atoms))
+        self.assertEqual([A, B, N], list(nodes)[-3:])
+        self.assertEqual([N], list(g.nodes_of(pgraph.LatticeOpNode)))
+        self.assertIn(N, nodes)
+        self.assertNotIn(N, atoms)
+        self.assertEqual(set([A, B, N]),
+                         nodes - set(g.nodes_of(pgraph.ConstNode)))
+        self.assertEqual(B, atoms[-1])
+        self.assertEqual(2, len(random.Random(0).sample(atoms, 2)))
+
+        self.assertEqual(list(range(len(nodes))), list(map(g.node_id, nodes)))
+
+    def test_imply_reasons(self):
+        A,B = self.atoms('AB')
+        why_1 = lambda outcome, *causes: 'one'
+        why_2 = lambda outcome, *causes: 'two'
+
+        A[True].therefore(B[True], why_1)
+        A[True].therefore(B[True], why_1)
+        self.assertEqual(set([pgraph.Reason(B[True], [A[True]], why_1)]),
+                         A[True].imply_reasons)
+
+        A[True].therefore(B[True], why_2)
+        A[True].therefore(B[True])
+        reasons = A[True].imply_reasons
+        self.assertEqual(set(['one', 'two', 'B <= (A)']),
+                         set(map(repr, reasons)))
+
+        for reason in reasons:
+            self.assertTrue(A[True].has_imply_reason(reason))
+        self.assertFalse(A[True].has_imply_reason(
+                pgraph.Reason(B[True], [A[True]], lambda *_: 'other')))
+        self.assertFalse(B[False].has_imply_reason(
+                pgraph.Reason(B[True], [A[True]], why_1)))
+
+        self.assertEqual(set([pgraph.Reason(A[False], [B[False]], why)
+                              for why in (why_1, why_2, None)]),
+                         B[False].imply_reasons)
+
 
 class TrunkTestCase(SolverTestCaseBase):
     """Test cases which do not involve branching."""
@@ -310,3 +427,579 @@ class BranchTestCase(SolverTestCaseBase):
 
         self.assertEqual(ComparableSolution(initial_trunk.base),
                          ComparableSolution(solved_trunk.base))
+
+
+class ComponentsTestCase(SolverTestCaseBase):
+
+    def solve_both(self, initial_values, **kwargs):
+        try:
+            expected = solve(self.pgraph, initial_values)
+        except SolveError:
+            expected = SolveError
+
+        try:
+            solution = solve_components(self.pgraph, initial_values,
+                                        **kwargs)
+        except SolveError:
+            solution = SolveError
+
+        self.assertEqual(expected, solution)
+        return solution
+
+    def test_components(self):
+        initial_values, groups = self.random_pgraph(random.Random(1), 5, 4)
+
+        components = connected_components(self.pgraph)
+        self.assertEqual(5, len(components))
+        for component in components:
+            self.assertTrue(any(component.nodes.issuperset(atoms)
+                                for atoms in groups))
+
+    def test_random(self):
+        rnd = random.Random(42)
+        for _ in range(100):
+            self.pgraph = HandyPgraph()
+            initial_values, _ = self.random_pgraph(rnd, rnd.randint(1, 4),
+                                                   rnd.randint(3, 6))
+            self.solve_both(initial_values)
+
+    def test_cache(self):
+        g = self.pgraph
+        initial_values = {}
+        for size in range(2, 6):  # different sizes, so as not to share
+            name = 'N{0}'.format(size)
+            atoms = self.atoms(name + str(i) for i in range(size))
+            atoms[0][True].level = 0
+            initial_values[g.AtMostOne(*atoms, name=name)] = True
+
+        cache = {}
+        solution = self.solve_both(initial_values, cache=cache)
+        self.assertIsNot(SolveError, solution)
+        self.assertEqual(4, len(cache))
+
+        cache = dict((description, tuple(not value if value is not None
+                                         else None for value in values))
+                     for description, values in iteritems(cache))
+        negated = solve_components(self.pgraph, initial_values, cache=cache)
+        for node, value in iteritems(solution):
+            if value is not None:
+                self.assertIs(not value, negated[node])
+
+    def test_describe_stable(self):
+        key = lambda node: node._name
+
+        descriptions = []
+        for _ in range(2):
+            self.pgraph = HandyPgraph()
+            initial_values, _ = self.random_pgraph(random.Random(5), 1, 6)
+            component, = connected_components(self.pgraph)
+            descriptions.append(describe(component, pgraph.to_lset(
+                initial_values), key)[0])
+
+        self.assertEqual(descriptions[0], descriptions[1])
+
+    def test_processes(self):
+        rnd = random.Random(7)
+        initial_values, _ = self.random_pgraph(rnd, 6, 5)
+        self.solve_both(initial_values, processes=2)
+
+
+class ComponentCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_persistence(self):
+        cache = ComponentCache(self.path)
+        cache[((None, ()),)] = (True,)
+        cache[((1, ()),)] = (False,)
+
+        self.assertEqual((True,), cache.get(((None, ()),)))
+        self.assertIsNone(cache.get(((2, ()),)))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        cache = ComponentCache(self.path)
+        self.assertEqual(2, len(cache))
+        self.assertEqual((False,), cache[((1, ()),)])
+        self.assertRaises(KeyError, cache.__getitem__, ((2, ()),))
+
+        cache.clear()
+        self.assertEqual(0, len(ComponentCache(self.path)))
+
+    def test_eviction(self):
+        cache = ComponentCache(self.path)
+        cache[(0,)] = (True,) * 10
+        entry_size = cache._size
+        cache.max_size = 3 * entry_size
+
+        for i in range(1, 3):
+            cache[(i,)] = (True,) * 10
+        self.assertIsNotNone(cache.get((0,)))  # now 1 is the oldest one
+
+        cache[(3,)] = (True,) * 10
+        self.assertEqual(3, len(cache))
+        self.assertIsNone(cache.get((1,)))
+        for i in 0, 2, 3:
+            self.assertIsNotNone(cache.get((i,)))
+
+    def test_broken_entry(self):
+        cache = ComponentCache(self.path)
+        cache[(0,)] = (True,)
+        with open(cache._filename(cache.digest((0,))), 'wb') as f:
+            f.write(b'garbage')
+
+        self.assertIsNone(cache.get((0,)))
+        self.assertEqual(0, len(cache))
+
+
+class SessionTestCase(SolverTestCaseBase):
+
+    def solve_or_error(self, initial_values):
+        try:
+            return solve(self.pgraph, initial_values)
+        except SolveError:
+            return SolveError
+
+    def test_assume(self):
+        g = self.pgraph
+        A,B,C = self.atoms('ABC')
+
+        g.AtMostOne(A, B, C)
+        A[False].level = B[False].level = C[False].level = 0
+
+        session = Session(g)
+        self.assertIs(False, session.baseline[A])
+
+        solution, changes = session.assume({A: True})
+        self.assertIs(True, solution[A])
+        self.assertIs(False, solution[B])
+        self.assertEqual((False, True), changes[A])
+        self.assertNotIn(B, changes)
+
+        with self.assertRaises(SolveError):
+            session.assume({B: True})
+        self.assertEqual(1, session.depth)
+
+        session.retract()
+        self.assertEqual(0, session.depth)
+        self.assertIs(session.baseline, session.solution)
+
+        solution, changes = session.assume({B: True})
+        self.assertIs(True, solution[B])
+        self.assertRaises(ValueError, Session(g).retract)
+
+    def test_contradiction(self):
+        g = self.pgraph
+        A,B = self.atoms('AB')
+
+        session = Session(g, {B: True})
+        session.assume({A: True})
+
+        with self.assertRaises(SolveError) as cm:
+            session.assume({A: False})
+        self.assertIn(A, set(get_violation_nodes(cm.exception.trunk)))
+        self.assertEqual(1, session.depth)
+
+        self.assertRaises(SolveError, session.assume, {B: False})
+        self.assertEqual(1, session.depth)
+
+    def test_random(self):
+        rnd = random.Random(11)
+        for _ in range(50):
+            self.pgraph = HandyPgraph()
+            initial_values, groups = self.random_pgraph(rnd, 2,
+                                                        rnd.randint(3, 6))
+            try:
+                session = Session(self.pgraph, initial_values)
+            except SolveError:
+                continue
+            self.assertEqual(self.solve_or_error(initial_values),
+                             session.baseline)
+
+            assumed = dict(initial_values)
+            for _ in range(3):
+                atom = rnd.choice(rnd.choice(groups))
+                value = rnd.choice([True, False])
+                if assumed.get(atom, value) is not value:
+                    depth = session.depth
+                    self.assertRaises(SolveError, session.assume,
+                                      {atom: value})
+                    self.assertEqual(depth, session.depth)
+                    continue
+                assumed[atom] = value
+
+                expected = self.solve_or_error(assumed)
+                try:
+                    solution, _ = session.assume({atom: value})
+                except SolveError:
+                    self.assertIs(SolveError, expected)
+                    break
+                self.assertEqual(expected, solution)
+
+            while session.depth:
+                session.retract()
+            self.assertEqual(self.solve_or_error(initial_values),
+                             session.solution)
+
+
+class FrozenPgraphTestCase(SolverTestCaseBase):
+
+    def test_freeze(self):
+        g = self.pgraph
+        A,B = self.atoms('AB')
+        N = g.AtMostOne(A, B)
+        A[True].level = 0
+
+        frozen = g.freeze()
+        self.assertEqual(5, frozen.nr_nodes)
+        self.assertIs(N, frozen.nodes[4])
+        self.assertEqual([None, 0, None, None], list(frozen.levels[4:8]))
+
+        a, b = frozen.literal_id(A[True]), frozen.literal_id(B[True])
+        self.assertEqual((4+1, 6+1), (a, b))
+        self.assertEqual(sorted(map(frozen.literal_id, A[True].implies)),
+                         list(frozen.implied_by(a)))
+        self.assertIn(b-1, frozen.implied_by(a))
+
+        self.assertEqual(1, frozen.nr_neglasts)
+        self.assertEqual(sorted(map(frozen.literal_id,
+                                    next(iter(N[True].neglasts)).literals)),
+                         list(frozen.neglast_members(0)))
+
+    def test_solve_frozen(self):
+        rnd = random.Random(19)
+        for _ in range(30):
+            self.pgraph = HandyPgraph()
+            initial_values, _ = self.random_pgraph(rnd, rnd.randint(1, 3),
+                                                   rnd.randint(3, 5))
+            try:
+                expected = solve(self.pgraph, initial_values)
+            except SolveError:
+                expected = SolveError
+
+            frozen = self.pgraph.freeze()
+            initial_ids = list(map(frozen.literal_id,
+                                   pgraph.to_lset(initial_values)))
+
+            unpickled = pickle.loads(pickle.dumps(frozen))
+            self.assertIsNone(unpickled.nodes)
+            try:
+                solution = frozen.to_solution(solve_frozen(unpickled,
+                                                           initial_ids))
+            except SolveError:
+                solution = SolveError
+
+            self.assertEqual(expected, solution)
+
+
+class WarmStartTestCase(SolverTestCaseBase):
+
+    def test_hints(self):
+        g = self.pgraph
+        A,B,C = self.atoms('ABC')
+        N = g.AtMostOne(A, B, C)
+        A[True].level = 0
+
+        self.assertIs(True, solve(g, {N: True})[A])
+
+        solution = solve(g, {N: True}, hints={B: True, C: None})
+        self.assertEqual((False, True, False),
+                         (solution[A], solution[B], solution[C]))
+
+        # Conflicting hints, one of them is dropped.
+        solution = solve(g, {N: True}, hints={B: True, C: True})
+        self.assertEqual(1, [solution[A], solution[B],
+                             solution[C]].count(True))
+        self.assertIs(False, solution[A])
+
+        # Hints contradicting initial values are ignored.
+        solution = solve(g, {N: True, C: True}, hints={B: True})
+        self.assertIs(True, solution[C])
+
+    def test_random(self):
+        rnd = random.Random(23)
+        for _ in range(30):
+            self.pgraph = HandyPgraph()
+            initial_values, groups = self.random_pgraph(rnd, rnd.randint(1, 3),
+                                                        rnd.randint(3, 5))
+            atoms = [atom for group in groups for atom in group]
+
+            for expected in iter_solutions(self.pgraph, initial_values, atoms,
+                                           limit=3, random=rnd):
+                solution = solve(self.pgraph, initial_values, hints=expected)
+                self.assertEqual([expected[atom] for atom in atoms],
+                                 [solution[atom] for atom in atoms])
+
+
+class ModelsTestCase(SolverTestCaseBase):
+
+    def brute_force(self, initial_values, atoms):
+        ret = set()
+        for values in itertools.product(bools, repeat=len(atoms)):
+            assumed = dict(initial_values)
+            if any(assumed.setdefault(atom, value) is not value
+                   for atom, value in zip(atoms, values)):
+                continue
+            try:
+                solution = solve(self.pgraph, assumed)
+            except SolveError:
+                continue
+            ret.add(tuple(solution[atom] for atom in atoms))
+        return ret
+
+    def test_at_most_one(self):
+        g = self.pgraph
+        A,B,C = atoms = self.atoms('ABC')
+        g.AtMostOne(A, B, C)
+
+        solutions = list(iter_solutions(g, {}, atoms))
+        self.assertEqual(4, len(solutions))
+        self.assertEqual((4, True), count_solutions(g, {}, atoms))
+        self.assertEqual((1, True), count_solutions(g, {A: True}, atoms))
+
+        self.assertEqual(2, len(list(iter_solutions(g, {}, atoms, limit=2))))
+        self.assertEqual((2, False), count_solutions(g, {}, atoms, limit=2))
+
+        self.assertEqual([], list(iter_solutions(g, {}, atoms, timeout=-1)))
+        self.assertEqual(False, count_solutions(g, {}, atoms, timeout=-1)[1])
+
+    def test_random(self):
+        rnd = random.Random(13)
+        for _ in range(30):
+            self.pgraph = HandyPgraph()
+            initial_values, groups = self.random_pgraph(rnd, rnd.randint(1, 2),
+                                                        rnd.randint(3, 4))
+            atoms = [atom for group in groups for atom in group]
+            expected = self.brute_force(initial_values, atoms)
+
+            solutions = [tuple(solution[atom] for atom in atoms)
+                         for solution in iter_solutions(self.pgraph,
+                                                        initial_values,
+                                                        atoms)]
+            self.assertEqual(len(expected), len(solutions))
+            self.assertEqual(expected, set(solutions))
+            self.assertEqual((len(expected), True),
+                             count_solutions(self.pgraph, initial_values,
+                                             atoms))
+
+    def test_atoms_subset(self):
+        g = self.pgraph
+        A,B,C,D = self.atoms('ABCD')
+        N = g.Or(B, C, D)
+        A[False] >> C[True]
+        B[True] >> C[False]
+        B[True] >> D[False]
+        C[True] >> D[False]
+        A[False].level = B[False].level = D[False].level = 0
+
+        # Having A True and C False, the solver takes B and D False at once.
+        expected = set([(True, True), (False, True), (True, False)])
+        solutions = [(solution[A], solution[C])
+                     for solution in iter_solutions(g, {N: True}, [A, C])]
+        self.assertEqual(len(expected), len(solutions))
+        self.assertEqual(expected, set(solutions))
+        self.assertEqual((3, True), count_solutions(g, {N: True}, [A, C]))
+
+    def test_count_cache(self):
+        g = self.pgraph
+        for name in 'XYZ':
+            g.AtMostOne(*self.atoms(name + str(i) for i in range(3)),
+                        name=name + '*')
+        key = lambda node: node._name[1:]  # the same for all components
+
+        cache = {}
+        self.assertEqual((4**3, True), count_solutions(g, cache=cache,
+                                                       key=key))
+        self.assertEqual(1, len(cache))
+
+        cache = dict.fromkeys(cache, 2)
+        self.assertEqual((2**3, True), count_solutions(g, cache=cache,
+                                                       key=key))
+
+
+class MinimizeTestCase(SolverTestCaseBase):
+
+    def test_minimize(self):
+        g = self.pgraph
+        A,B,C = self.atoms('ABC')
+        N = g.Or(A, B, C)
+        A[True].level = 0  # solve() would prefer the most expensive one
+
+        self.assertIs(True, solve(g, {N: True})[A])
+
+        costs = {A: 5, B: 1, C: 2}
+        solution, cost, optimal = minimize(g, {N: True}, costs)
+        self.assertEqual((1, True), (cost, optimal))
+        self.assertEqual((False, True, False),
+                         (solution[A], solution[B], solution[C]))
+
+        solution, cost, optimal = minimize(g, {N: True}, costs, timeout=-1)
+        self.assertEqual((5, False), (cost, optimal))
+
+    def test_costs_subset(self):
+        g = self.pgraph
+        A,B,C,D = self.atoms('ABCD')
+        N = g.Or(B, C, D)
+        A[False] >> C[True]
+        B[True] >> C[False]
+        B[True] >> D[False]
+        C[True] >> D[False]
+        A[False].level = B[False].level = D[False].level = 0
+
+        # Having A True and C False, the solver takes B and D False at once.
+        solution, cost, optimal = minimize(g, {N: True}, {A: 0, C: 3})
+        self.assertEqual((0, True), (cost, optimal))
+        self.assertEqual((True, False), (solution[A], solution[C]))
+
+    def test_random(self):
+        rnd = random.Random(17)
+        for _ in range(30):
+            self.pgraph = HandyPgraph()
+            initial_values, groups = self.random_pgraph(rnd, rnd.randint(1, 2),
+                                                        rnd.randint(3, 4))
+            costs = dict((atom, rnd.randint(0, 3))
+                         for group in groups for atom in group)
+            try:
+                solution, cost, optimal = minimize(self.pgraph,
+                                                   initial_values, costs)
+            except SolveError:
+                continue
+            self.assertTrue(optimal)
+            self.assertEqual(cost, sum(costs[atom]
+                                       for atom in costs if solution[atom]))
+
+            expected = min(sum(costs[atom]
+                               for atom in costs if each[atom])
+                           for each in iter_solutions(self.pgraph,
+                                                      initial_values,
+                                                      list(costs)))
+            self.assertEqual(expected, cost)
+
+
+class RgraphTestCase(SolverTestCaseBase):
+
+    def solve_error(self, initial_values):
+        with self.assertRaises(SolveError) as cm:
+            solve(self.pgraph, initial_values)
+        return cm.exception
+
+    def test_shortest_paths(self):
+        g = self.pgraph
+        A,B,C = self.atoms('ABC')
+
+        N = g.AtMostOne(A,B,C)
+        error = self.solve_error({A: True, B: True})
+
+        rgraph = Rgraph(error.trunk)
+        lengths = dict((literal, rnode.length)
+                       for literal, rnode in iteritems(rgraph.nodes))
+
+        self.assertEqual(0, lengths[A[True]])
+        self.assertEqual(0, lengths[B[True]])
+        self.assertEqual(1, lengths[C[False]])
+        self.assertEqual(1, lengths[N[True]])
+        self.assertEqual(float("+inf"), lengths[C[True]])
+
+        # ~N is only reachable through all of ~A, ~B and ~C.
+        self.assertEqual(4, lengths[N[False]])
+
+    def test_shorten_rgraph(self):
+        g = self.pgraph
+        A,B,C,D = self.atoms('ABCD')
+
+        A[True] >> B[True] >> C[True]
+        A[True] >> D[True]
+        error = self.solve_error({A: True, C: False})
+
+        rgraph = Rgraph(error.trunk)
+        short = shorten_rgraph(rgraph, [rgraph.nodes[C[True]]])
+
+        self.assertIs(rgraph.nodes, short.nodes)
+
+        reasons = set(reason for reason, shift in traverse_error_rgraph(short))
+        self.assertEqual(set([A[True], B[True], C[True]]),
+                         set(reason.literal for reason in reasons))
+
+    def test_error_rgraph_trunk(self):
+        g = self.pgraph
+        A, = self.atoms('A')
+
+        # A & ~A
+        error = self.solve_error({g.And(A, g.Not(A)): True})
+
+        rgraph = get_error_rgraph(error)
+        reasons = [reason for reason, shift in traverse_error_rgraph(rgraph)]
+
+        self.assertTrue(reasons)
+        self.assertIn(A[True],  [reason.literal for reason in reasons])
+        self.assertIn(A[False], [reason.literal for reason in reasons])
+
+    def test_traverse_deep_chain(self):
+        g = self.pgraph
+        depth = sys.getrecursionlimit() + 100
+        atoms = [g.NamedAtom(name='A{0}'.format(i)) for i in range(depth)]
+
+        for atom, next_atom in zip(atoms, atoms[1:]):
+            atom[True] >> next_atom[True]
+        error = self.solve_error({atoms[0]: True, atoms[-1]: False})
+
+        rgraph = get_error_rgraph(error)
+
+        chains = []
+        for reason, shift in traverse_error_rgraph(rgraph):
+            if not shift:
+                chains.append([])
+            self.assertEqual(len(chains[-1]), shift)
+            chains[-1].append(reason.literal)
+
+        # Each chain is yielded in the reverse order, i.e. from the violation
+        # back to the initial literal.
+        self.assertEqual(sorted([[atom[True]  for atom in reversed(atoms)],
+                                 [atom[False] for atom in atoms]], key=repr),
+                         sorted(chains, key=repr))
+
+    def test_error_rgraph_branches(self):
+        g = self.pgraph
+        A, B = self.atoms('AB')
+
+        x = g.And(B[False], A[False], g.Or(A[True], B[True]))
+        x.equivalent(B[True])
+
+        # (A | B) & (~A | B) & (A | ~B)
+        P = g.And(g.Or(A[True],  B[True]),
+                  g.Or(A[False], B[True]),
+                  g.Or(A[True], B[False]))
+        error = self.solve_error({P: True})
+        trunk = error.trunk
+
+        rgraph = get_error_rgraph(error)
+        self.assertTrue(rgraph.violation_graphs)
+
+        trunk_rgraph = Rgraph(trunk)
+        for literal, branch in iteritems(trunk.dead_branches):
+            if branch.valid:
+                continue
+
+            layered = get_branch_rgraph(trunk_rgraph, trunk, branch)
+
+            # Compare against an rgraph built from scratch.
+            flat = Solution(branch.flatten())
+            for gen_literal in branch.gen_literals:
+                flat.reasons.add(pgraph.Reason(gen_literal))
+            full = Rgraph(flat)
+
+            for each, rnode in iteritems(full.nodes):
+                self.assertEqual(rnode.length,
+                                 layered.length_of(layered.nodes[each]))
+
+            # The layer only stores edges which its branch adds.
+            for container, therefore in iteritems(layered._therefore):
+                for node, reason in iteritems(therefore):
+                    self.assertFalse(container.therefore.get(node) == reason
+                                     and layered.is_visible(reason))
+
+            self.assertTrue(list(traverse_error_rgraph(
+                rgraph.violation_graphs[literal])))